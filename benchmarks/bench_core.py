@@ -0,0 +1,372 @@
+# Offline benchmarks of the download manager against local fakes of aria2, mega-get and an HTTP server
+"""Time the manager's hot paths without touching the network or the project's state files.
+
+Scenarios (each at several sizes, repeated; the median and minimum are reported):
+
+* ``add`` / ``add_many``: queue N URLs one at a time and in one batch (prechecks included)
+* ``list_cold`` / ``list_warm``: the ``list`` command with N jobs, in a fresh process-like
+  manager and in a long-lived (daemon-like) one
+* ``refresh_tick``: one GUI progress poll with N jobs
+* ``pause_resume``: pause and resume N jobs one by one
+* ``state_save`` / ``state_load`` / ``state_record``: each store (json, journal, sqlite) at
+  1k/10k/100k jobs
+* ``direct``: direct-download throughput from a local range server
+* ``mega_add``: starting N downloads through a fake ``mega-get``
+
+    python benchmarks/bench_core.py [--scale quick|full] [--only SCENARIO ...] [--latency-ms MS]
+                                    [--repeat N] [--output FILE] [--compare BASELINE] [--tolerance F]
+
+``--output`` writes the results as JSON; ``--compare`` checks them against an earlier file
+and exits non-zero when a scenario got slower by more than ``--tolerance`` (default 0.25).
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if os.fspath(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, os.fspath(PROJECT_ROOT))
+
+from fakes import RangeServer, write_fake_mega_get  # noqa: E402
+
+from downloader.core.config import Config  # noqa: E402
+from downloader.core.content_index import ContentIndex  # noqa: E402
+from downloader.core.daemon import run_command  # noqa: E402
+from downloader.core.host_tuning import HostTuning  # noqa: E402
+from downloader.core.job import Backend, Job, JobStatus  # noqa: E402
+from downloader.core.manager import DownloadManager  # noqa: E402
+from downloader.core.metadata_cache import MetadataCache  # noqa: E402
+from downloader.core.mirrors import MirrorStats  # noqa: E402
+from downloader.core.persistence import JournalPersistence, Persistence  # noqa: E402
+from downloader.core.segmented import SegmentedDownload  # noqa: E402
+from downloader.core.sqlite_persistence import SqlitePersistence  # noqa: E402
+from downloader.core.test_aria2_rpc import FakeAria2Server  # noqa: E402
+
+# Sizes per scenario for each --scale
+SCALES = {
+    "quick": {"add": [100], "list": [1000], "refresh": [200], "pause_resume": [20], "state": [1000],
+              "direct": 16 << 20, "mega_add": [5], "ticks": 5},
+    "full": {"add": [100, 1000], "list": [1000, 10000], "refresh": [1000], "pause_resume": [100],
+             "state": [1000, 10000, 100000], "direct": 128 << 20, "mega_add": [20], "ticks": 20},
+}
+
+SCENARIOS = ("add", "list", "refresh", "pause_resume", "state", "direct", "mega_add")
+
+
+def _quiet():
+    # The manager reports every job it touches; keep that out of the timings' output
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def _result(scenario, params, samples, **extra):
+    return {
+        "scenario": scenario,
+        "params": params,
+        "median_s": round(statistics.median(samples), 6),
+        "min_s": round(min(samples), 6),
+        "runs": len(samples),
+        **extra,
+    }
+
+
+def _manager(tmp, aria2=None):
+    """A manager whose state, caches and config all live in ``tmp``, talking to the fake ``aria2``."""
+    mgr = DownloadManager(config=Config(os.path.join(tmp, "config.json")))
+    mgr.persistence = Persistence(os.path.join(tmp, "state.json"))
+    mgr.metadata = MetadataCache(os.path.join(tmp, "metadata.json"))
+    mgr.host_tuning = HostTuning(os.path.join(tmp, "hosts.json"))
+    mgr.mirror_stats = MirrorStats(os.path.join(tmp, "mirrors.json"))
+    mgr.content_index = ContentIndex(os.path.join(tmp, "content.json"))
+    mgr.scheduler.log_path = None
+    if aria2 is not None:
+        mgr.aria2.binary_path = sys.executable
+        mgr.aria2.endpoint_path = os.path.join(tmp, "aria2.json")
+        mgr.aria2._set_rpc_port(aria2.port)
+        mgr.aria2.rpc.secret = aria2.secret
+    return mgr
+
+
+def _started_jobs(aria2, n):
+    return [Job(f"job-{i}", f"http://fake.invalid/{i}.bin", Backend.ARIA2, JobStatus.STARTED, gid=gid)
+            for i, gid in enumerate(aria2.preload(n))]
+
+
+def bench_add(sizes, repeat, aria2, http):
+    results = []
+    for n in sizes:
+        for scenario in ("add", "add_many"):
+            samples, requests = [], []
+            for _ in range(repeat):
+                with tempfile.TemporaryDirectory() as tmp:
+                    mgr = _manager(tmp, aria2)
+                    urls = [http.url(f"file-{i}.bin") for i in range(n)]
+                    options = {"dir": tmp}
+                    before = aria2.requests
+                    with _quiet():
+                        if scenario == "add":
+                            samples.append(_timed(lambda: [mgr.add(url, options=options) for url in urls]))
+                        else:
+                            samples.append(_timed(lambda: mgr.add_many(urls, options=options)))
+                    requests.append(aria2.requests - before)
+                    mgr.persistence.close()
+            results.append(_result(scenario, {"jobs": n, "latency_ms": aria2.latency * 1000}, samples,
+                                   per_job_us=round(statistics.median(samples) / n * 1e6, 1),
+                                   rpc_requests=max(requests)))
+    return results
+
+
+def bench_list(sizes, repeat, aria2):
+    results = []
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            _manager(tmp).persistence.save(_started_jobs(aria2, n), [])
+            cold, warm = [], []
+            for _ in range(repeat):
+                mgr = _manager(tmp, aria2)
+                with _quiet():
+                    # A fresh manager loads the state, as an in-process CLI call does
+                    cold.append(_timed(lambda: run_command(mgr, "list", {"status": None})))
+                    # The daemon keeps it loaded
+                    warm.append(_timed(lambda: run_command(mgr, "list", {"status": None})))
+        params = {"jobs": n, "latency_ms": aria2.latency * 1000}
+        results.append(_result("list_cold", params, cold))
+        results.append(_result("list_warm", params, warm))
+    return results
+
+
+def _gui_poll(mgr, last):
+    # What the GUI's ProgressWorker does each tick, without Qt
+    statuses = mgr.refresh()
+    jobs = list(mgr.queue) + list(mgr.history)
+    if statuses is None:
+        queue = mgr.queue
+        statuses = mgr.fetch_aria2_statuses(queue.with_status("started") + queue.with_status("queued") + queue.with_status("paused"))
+    statuses = dict(statuses, **mgr.direct_progress)
+    snapshot = {}
+    for job in jobs:
+        status = statuses.get(job.aria2_gid or job.id) or {}
+        total = int(status.get("totalLength", 0))
+        progress = f"{int(status.get('completedLength', 0)) / total * 100:.2f}" if total else "0"
+        snapshot[job.id] = {"status": str(job.status), "progress": progress}
+    changed = sum(last.get(job_id) != row for job_id, row in snapshot.items())
+    return snapshot, changed
+
+
+def bench_refresh(sizes, ticks, aria2):
+    results = []
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            _manager(tmp).persistence.save(_started_jobs(aria2, n), [])
+            mgr = _manager(tmp, aria2)
+            last, samples, changed = {}, [], []
+            with _quiet():
+                for _ in range(ticks):
+                    start = time.perf_counter()
+                    last, count = _gui_poll(mgr, last)
+                    samples.append(time.perf_counter() - start)
+                    changed.append(count)
+        results.append(_result("refresh_tick", {"jobs": n, "latency_ms": aria2.latency * 1000}, samples,
+                               rows_changed=max(changed)))
+    return results
+
+
+def bench_pause_resume(sizes, repeat, aria2):
+    results = []
+    for n in sizes:
+        samples = []
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as tmp:
+                _manager(tmp).persistence.save(_started_jobs(aria2, n), [])
+                mgr = _manager(tmp, aria2)
+                ids = [job.id for job in mgr.queue]
+
+                def cycle():
+                    for job_id in ids:
+                        mgr.pause(job_id)
+                    for job_id in ids:
+                        mgr.resume(job_id)
+
+                with _quiet():
+                    samples.append(_timed(cycle))
+        results.append(_result("pause_resume", {"jobs": n, "latency_ms": aria2.latency * 1000}, samples,
+                               per_job_us=round(statistics.median(samples) / n * 1e6, 1)))
+    return results
+
+
+# State stores by name, each opened on files inside a directory
+STORES = {
+    "json": lambda tmp: Persistence(os.path.join(tmp, "state.json")),
+    "journal": lambda tmp: JournalPersistence(os.path.join(tmp, "journal.json")),
+    "sqlite": lambda tmp: SqlitePersistence(os.path.join(tmp, "state.sqlite3"), json_path=os.path.join(tmp, "none.json")),
+}
+
+
+def bench_state(sizes, repeat):
+    results = []
+    for n in sizes:
+        jobs = [Job(f"job-{i:06d}", f"https://example.invalid/files/{i}.bin", Backend.ARIA2, JobStatus.STARTED,
+                    gid=f"{i:016x}", extra={"options": {"dir": "/downloads"}, "priority": i % 3})
+                for i in range(n)]
+        for store, open_store in STORES.items():
+            saves, loads, records, size = [], [], [], 0
+            for _ in range(repeat):
+                with tempfile.TemporaryDirectory() as tmp:
+                    persistence = open_store(tmp)
+                    saves.append(_timed(lambda: persistence.save(jobs, [])))
+                    # SQLite keeps recent writes in its -wal file until a checkpoint
+                    size = sum(os.path.getsize(p) for p in (persistence.path, persistence.path + "-wal") if os.path.exists(p))
+                    persistence.close()
+                    fresh = open_store(tmp)
+                    loads.append(_timed(fresh.load))
+                    changed = jobs[n // 2]
+                    records.append(_timed(lambda: fresh.record("update", changed, jobs, [])))
+                    fresh.close()
+            params = {"jobs": n, "store": store}
+            results.append(_result("state_save", params, saves, bytes=size))
+            results.append(_result("state_load", params, loads))
+            results.append(_result("state_record", params, records))
+    return results
+
+
+def bench_direct(size, repeat, http):
+    import hashlib
+    results = []
+    digest = "sha256=" + hashlib.sha256(http.payload).hexdigest()
+    for connections, checksum in ((1, None), (4, None), (4, digest)):
+        samples = []
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as tmp:
+                engine = SegmentedDownload(http.url(), os.path.join(tmp, "file.bin"), connections=connections,
+                                           checksum=checksum)
+                samples.append(_timed(engine.run))
+        results.append(_result("direct", {"bytes": size, "connections": connections, "checksum": bool(checksum)},
+                               samples, mb_per_s=round(size / statistics.median(samples) / (1 << 20), 1)))
+    return results
+
+
+def bench_mega_add(sizes, repeat):
+    results = []
+    for n in sizes:
+        samples = []
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as tmp:
+                mgr = _manager(tmp)
+                from downloader.core.mega_backend import MegaBackend
+                mgr._mega = MegaBackend(binary_path=write_fake_mega_get(tmp))
+                with _quiet():
+                    samples.append(_timed(lambda: [mgr.add(f"https://mega.nz/file/bench{i}") for i in range(n)]))
+                for job in mgr.queue:
+                    if job.pid:
+                        with contextlib.suppress(ChildProcessError):
+                            os.waitpid(job.pid, 0)
+        results.append(_result("mega_add", {"jobs": n}, samples,
+                               per_job_ms=round(statistics.median(samples) / n * 1000, 2)))
+    return results
+
+
+def run(scenarios, scale, repeat, latency):
+    sizes = SCALES[scale]
+    results = []
+    with FakeAria2Server(latency=latency, speed=1 << 20, total=100 << 20) as aria2, RangeServer(size=sizes["direct"]) as http:
+        for scenario in scenarios:
+            print(f"[bench] {scenario} ...", file=sys.stderr)
+            if scenario == "add":
+                results += bench_add(sizes["add"], repeat, aria2, http)
+            elif scenario == "list":
+                results += bench_list(sizes["list"], repeat, aria2)
+            elif scenario == "refresh":
+                results += bench_refresh(sizes["refresh"], sizes["ticks"], aria2)
+            elif scenario == "pause_resume":
+                results += bench_pause_resume(sizes["pause_resume"], repeat, aria2)
+            elif scenario == "state":
+                results += bench_state(sizes["state"], repeat)
+            elif scenario == "direct":
+                results += bench_direct(sizes["direct"], repeat, http)
+            elif scenario == "mega_add":
+                results += bench_mega_add(sizes["mega_add"], repeat)
+    return results
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def _key(result):
+    return result["scenario"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(results, baseline, tolerance):
+    """Scenarios whose median time grew by more than ``tolerance`` against ``baseline``."""
+    before = {_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        old = before.get(_key(r))
+        if old and old["median_s"] > 0 and r["median_s"] > old["median_s"] * (1 + tolerance):
+            regressions.append((r, old))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the download manager against local fakes")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="quick", help="Job counts and file sizes to use")
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, help="Run only these scenarios")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (median and minimum are reported)")
+    parser.add_argument("--latency-ms", dest="latency_ms", type=float, default=1.0, help="Delay of the fake aria2 per RPC round trip")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Earlier --output file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown against --compare (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = run(args.only or SCENARIOS, args.scale, max(1, args.repeat), args.latency_ms / 1000)
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scale": args.scale,
+            "repeat": args.repeat,
+            "latency_ms": args.latency_ms,
+        },
+        "results": results,
+    }
+    for r in results:
+        params = " ".join(f"{k}={v}" for k, v in r["params"].items())
+        extra = " ".join(f"{k}={r[k]}" for k in r if k not in ("scenario", "params", "median_s", "min_s", "runs"))
+        print(f"{r['scenario']:<14}{params:<40}{r['median_s'] * 1000:>12.2f} ms  {extra}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for new, old in regressions:
+            print(f"REGRESSION {new['scenario']} {new['params']}: {old['median_s'] * 1000:.2f} ms -> {new['median_s'] * 1000:.2f} ms")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
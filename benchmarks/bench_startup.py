@@ -0,0 +1,106 @@
+# CLI cold-start benchmark: import time (-X importtime) and wall-clock per subcommand
+"""Measure how long ``python -m downloader.cli <command>`` takes to start.
+
+For each command, one run under ``-X importtime`` records total import time and which
+modules were loaded. Then ``--repeat`` plain runs give the median wall-clock time.
+Commands that must stay light are also checked against a list of modules they must not
+import, so a stray top-level import shows up as a failure rather than a slow drift.
+
+    python benchmarks/bench_startup.py [--repeat N] [--budget-ms MS] [--json]
+
+Exits non-zero when a command imports a forbidden module or exceeds ``--budget-ms``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# (label, CLI arguments, modules the command must not import)
+COMMANDS = [
+    ("help", ["--help"], ["downloader.core.manager", "subprocess", "ssl", "urllib.request"]),
+    ("config show", ["config", "show"], ["downloader.core.manager", "subprocess", "ssl", "urllib.request"]),
+    ("list", ["--no-daemon", "list"], ["downloader.core.mega_backend", "ssl", "urllib.request"]),
+    ("status", ["--no-daemon", "status", "no-such-id"], ["downloader.core.mega_backend", "ssl", "urllib.request"]),
+]
+
+
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.fspath(PROJECT_ROOT), env.get("PYTHONPATH")]))
+    return env
+
+
+def _run(args, importtime=False):
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-m", "downloader.cli", *args]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=PROJECT_ROOT, env=_env(), capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        # A command that crashes early would otherwise look fast; keep the error, not the import lines
+        errors = "\n".join(l for l in proc.stderr.splitlines() if not l.startswith("import time:"))
+        raise RuntimeError(f"'downloader.cli {' '.join(args)}' exited with status {proc.returncode}:\n{errors}")
+    return elapsed, proc
+
+
+def parse_importtime(stderr):
+    """Return (total import microseconds, {module: cumulative microseconds}) from -X importtime output."""
+    total = 0
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        modules[name.strip()] = int(cumulative)
+        # Top-level imports are the ones not indented under a parent
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total, modules
+
+
+def bench(repeat=5):
+    results = []
+    for label, args, forbidden in COMMANDS:
+        _, proc = _run(args, importtime=True)
+        import_us, modules = parse_importtime(proc.stderr)
+        walls = [_run(args)[0] for _ in range(repeat)]
+        results.append({
+            "command": label,
+            "import_ms": round(import_us / 1000, 2),
+            "modules": len(modules),
+            "wall_ms": round(statistics.median(walls) * 1000, 2),
+            "forbidden": sorted(m for m in forbidden if m in modules),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup time per subcommand")
+    parser.add_argument("--repeat", type=int, default=5, help="Wall-clock runs per command (median is reported)")
+    parser.add_argument("--budget-ms", dest="budget_ms", type=float, help="Fail if any command's median wall-clock exceeds this")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = bench(args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'command':<14}{'imports ms':>12}{'modules':>10}{'wall ms':>10}  forbidden imports")
+        for r in results:
+            print(f"{r['command']:<14}{r['import_ms']:>12.2f}{r['modules']:>10}{r['wall_ms']:>10.2f}  {', '.join(r['forbidden']) or '-'}")
+
+    failed = [r for r in results if r["forbidden"]]
+    if args.budget_ms is not None:
+        failed += [r for r in results if r["wall_ms"] > args.budget_ms]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# Local stand-ins for mega-get and a file server, so benchmarks run offline and repeatably
+# (the fake aria2 is the one the tests use: downloader.core.test_aria2_rpc.FakeAria2Server)
+import os
+import stat
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RangeServer(ThreadingHTTPServer):
+    """HTTP file server answering HEAD and ``Range`` GETs for any path with the same ``size`` bytes.
+
+    Every path serves the same content with the same strong ETag, so one server stands in
+    for many URLs.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, size=64 << 20, etag='"bench-v1"'):
+        super().__init__(("127.0.0.1", 0), _RangeHandler)
+        self.size = size
+        self.etag = etag
+        # A repeating pattern: content does not matter, only that it is cheap to slice
+        block = bytes(range(256)) * 4096
+        self.payload = memoryview((block * (size // len(block) + 1))[:size])
+        self._thread = threading.Thread(target=self.serve_forever, name="range-server", daemon=True)
+
+    def url(self, name="file.bin"):
+        return f"http://127.0.0.1:{self.server_address[1]}/{name}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _headers(self, status, length, extra=()):
+        self.send_response(status)
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(length))
+        for name, value in extra:
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._headers(200, self.server.size)
+
+    def do_GET(self):
+        size = self.server.size
+        header = self.headers.get("Range")
+        if header and header.startswith("bytes=") and self.headers.get("If-Range") in (None, self.server.etag):
+            start, _, end = header[len("bytes="):].partition("-")
+            start, end = int(start), min(int(end) if end else size - 1, size - 1)
+            self._headers(206, end - start + 1, [("Content-Range", f"bytes {start}-{end}/{size}")])
+        else:
+            start, end = 0, size - 1
+            self._headers(200, size)
+        view = self.server.payload
+        try:
+            for offset in range(start, end + 1, 1 << 20):
+                self.wfile.write(view[offset:min(end + 1, offset + (1 << 20))])
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def write_fake_mega_get(directory, delay=0.0):
+    """Write a ``mega-get`` stand-in into ``directory``; returns its path.
+
+    It sleeps ``delay`` seconds and exits. Given a local path after the link (as the manager
+    passes for verified downloads), it writes a small file there.
+    """
+    script = os.path.join(directory, "mega-get.py")
+    with open(script, "w", encoding="utf-8") as f:
+        f.write(
+            "import os, sys, time\n"
+            f"time.sleep({delay!r})\n"
+            "if len(sys.argv) > 2:\n"
+            "    with open(os.path.join(sys.argv[2], 'mega.bin'), 'wb') as out:\n"
+            "        out.write(b'mega')\n"
+        )
+    if os.name == "nt":
+        path = os.path.join(directory, "mega-get.bat")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f'@"{sys.executable}" "{script}" %*\n')
+    else:
+        path = os.path.join(directory, "mega-get")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"#!{sys.executable}\n")
+            with open(script, encoding="utf-8") as body:
+                f.write(body.read())
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
@@ -1,10 +1,13 @@
 # CLI entry point using argparse (MVP)
 import argparse
+import os
 import sys
 import json
-from downloader.core.manager import DownloadManager
 from downloader.core.config import Config
 
+# Commands that only need the DownloadManager; a running daemon can serve them
+MANAGER_COMMANDS = ("add", "pause", "resume", "remove", "status", "list", "schedule", "limit", "tune", "metrics")
+
 
 def _install_portable_aria2():
     """Download and place a portable aria2c.exe into the aria2_portable folder."""
@@ -13,6 +16,7 @@ def _install_portable_aria2():
     import shutil
     from pathlib import Path
     from downloader.core.utils import PROJECT_ROOT
+    from downloader.core.binaries import invalidate_binary
 
     aria_url = "https://github.com/aria2/aria2/releases/download/release-1.37.0/aria2-1.37.0-win-64bit-build1.zip"
     portable_dir = Path(PROJECT_ROOT) / "downloader" / "aria2_portable"
@@ -34,6 +38,7 @@ def _install_portable_aria2():
         dest = portable_dir / "aria2c.exe"
         shutil.copy2(candidates[0], dest)
         print(f"aria2c.exe placed at {dest}")
+        invalidate_binary("aria2c")
     except Exception as exc:
         print(f"Failed to download or extract aria2: {exc}")
     finally:
@@ -43,18 +48,128 @@ def _install_portable_aria2():
             pass
         shutil.rmtree(extract_dir, ignore_errors=True)
 
+def _read_url_list(path):
+    """URLs from a file (or stdin for '-'), one download per line; blank lines and # comments are skipped.
+
+    As in aria2's input files, a line may list several whitespace-separated URLs of the same
+    file: the first is the download's URL, the rest its mirrors. Returns one list per line.
+    """
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line.split() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+def _command_params(args):
+    """JSON-serialisable parameters for a manager command, shared by the daemon and in-process paths."""
+    if args.command == "add":
+        params = {"url": args.url, "backend": args.backend, "urls": None, "priority": args.priority,
+                  "max_speed": args.max_speed, "mirrors": {}, "checksums": {}}
+        if args.url and args.mirror:
+            params["mirrors"][args.url] = args.mirror
+        if args.url and args.checksum:
+            params["checksums"][args.url] = args.checksum
+        if args.from_file:
+            # Read here so '-' refers to this process's stdin, not the daemon's
+            lines = _read_url_list(args.from_file)
+            params["urls"] = ([args.url] if args.url else []) + [uris[0] for uris in lines]
+            params["mirrors"].update((uris[0], uris[1:]) for uris in lines if len(uris) > 1)
+        if args.checksums:
+            params["checksums"].update(_manifest_checksums(args.checksums, params["urls"] or [args.url]))
+        return params
+    if args.command == "list":
+        return {"status": args.status}
+    if args.command == "schedule":
+        return {"limit": args.limit}
+    if args.command == "limit":
+        return {"target": args.target, "rate": args.rate}
+    if args.command == "tune":
+        return {"host": args.host, "connections": args.connections, "unpin": args.unpin}
+    return {"id": getattr(args, "id", None)}
+
+
+def _manifest_checksums(path, urls):
+    """``{url: checksum}`` for the URLs whose file name is listed in the checksum manifest at ``path``."""
+    import urllib.parse
+    from downloader.core.checksums import read_manifest
+
+    manifest = read_manifest(path)
+    checksums = {}
+    for url in urls:
+        name = os.path.basename(urllib.parse.unquote(urllib.parse.urlsplit(url).path))
+        if name in manifest:
+            checksums[url] = manifest[name]
+    missing = len(urls) - len(checksums)
+    if missing:
+        print(f"{missing} of {len(urls)} URLs have no entry in {path}; they are not verified.")
+    return checksums
+
+
+def _checksum(text):
+    """argparse type for ALGO=HEX digests such as sha256=<64 hex digits>."""
+    from downloader.core.checksums import parse_checksum
+    try:
+        return parse_checksum(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _rate(text):
+    """argparse type for speeds such as 500K or 2M (bytes per second; 0 = unlimited)."""
+    from downloader.core.bandwidth import parse_rate
+    try:
+        return parse_rate(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _run_daemon(manager, metrics_port=None):
+    from downloader.core.daemon import DownloaderDaemon
+    try:
+        daemon = DownloaderDaemon(manager, metrics_port=metrics_port)
+    except RuntimeError as e:
+        print(e)
+        return
+    manager.start_event_listener()
+    print(f"Downloader daemon listening on {daemon.path} (Ctrl+C or 'daemon --stop' to exit).")
+    if metrics_port is not None:
+        print(f"Metrics at http://localhost:{metrics_port}/metrics")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        print(e)
+    except OSError as e:
+        # e.g. the metrics port is taken
+        print(f"Downloader daemon failed: {e}")
+    finally:
+        manager.stop_event_listener()
+        manager.persistence.close()
+        print("Downloader daemon stopped.")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Cross-platform download utility")
     fallback_group = parser.add_mutually_exclusive_group()
     fallback_group.add_argument("--aria2-direct-fallback", dest="aria2_direct_fallback", action="store_true", help="Enable direct download fallback when aria2 RPC is blocked")
     fallback_group.add_argument("--no-aria2-direct-fallback", dest="aria2_direct_fallback", action="store_false", help="Disable direct download fallback (default if env not set)")
     parser.set_defaults(aria2_direct_fallback=None)
+    parser.add_argument("--no-daemon", dest="no_daemon", action="store_true", help="Run in this process even if a downloader daemon is running")
+    parser.add_argument("--trace", metavar="FILE", help="Write timed spans (precheck, aria2 start-up, RPC calls, spawns, state saves) to FILE as Chrome/Perfetto trace JSON; a command sent to a running daemon is traced only as the request, so add --no-daemon or start the daemon with --trace")
     subparsers = parser.add_subparsers(dest="command")
 
     # Add download
     add_parser = subparsers.add_parser("add", help="Add a new download")
-    add_parser.add_argument("url", help="URL to download")
+    add_parser.add_argument("url", nargs="?", help="URL to download")
+    add_parser.add_argument("--from-file", dest="from_file", help="Add every URL in a file, one per line ('-' reads stdin); extra URLs on a line are mirrors of the first")
     add_parser.add_argument("--backend", help="Force backend (aria2, mega)")
+    add_parser.add_argument("--priority", type=int, default=0, help="Scheduling priority; higher starts first under the 'priority' policy and gets a larger share of the global speed limit")
+    add_parser.add_argument("--max-speed", dest="max_speed", type=_rate, help="Speed limit for this download, e.g. 500K or 2M (bytes per second)")
+    add_parser.add_argument("--mirror", action="append", default=[], help="Another URL of the same file to download from in parallel (repeatable)")
+    add_parser.add_argument("--checksum", type=_checksum, help="Expected digest of the file, e.g. sha256=<hex> (md5, sha1, sha224, sha256, sha384, sha512)")
+    add_parser.add_argument("--checksums", metavar="MANIFEST", help="sha256sum-style manifest (HEX  name); each URL is verified against its file name's entry")
 
     # Pause/resume/remove
     for cmd in ["pause", "resume", "remove"]:
@@ -69,8 +184,27 @@ def main():
     progress_parser.add_argument("gid", help="aria2 GID")
     # List all aria2 downloads (GIDs)
     subparsers.add_parser("aria2-list", help="List all active aria2 download GIDs and status")
+    # Recorded aria2c lifecycle
+    subparsers.add_parser("aria2-health", help="Check the recorded aria2c: process, RPC reachability and queue counts")
+    subparsers.add_parser("aria2-shutdown", help="Stop the recorded aria2c cleanly")
     # List downloads
-    subparsers.add_parser("list", help="List all downloads")
+    list_parser = subparsers.add_parser("list", help="List all downloads")
+    list_parser.add_argument("--status", help="Only list downloads with this status (e.g. started, paused, completed)")
+    # Speed limits at runtime
+    limit_parser = subparsers.add_parser("limit", help="Change the speed limit of a download or the global one")
+    limit_parser.add_argument("target", help="Download ID, or 'global' for the overall limit (saved in the config)")
+    limit_parser.add_argument("rate", type=_rate, help="Bytes per second with an optional K/M/G suffix; 0 removes the limit")
+    # Per-host connection tuning
+    tune_parser = subparsers.add_parser("tune", help="Show or pin the per-host connection counts learned from download speeds")
+    tune_parser.add_argument("host", nargs="?", help="Host name (all tuned hosts when omitted)")
+    tune_group = tune_parser.add_mutually_exclusive_group()
+    tune_group.add_argument("--connections", type=int, help="Pin the host at this many connections (1-16)")
+    tune_group.add_argument("--unpin", action="store_true", help="Let the host be tuned automatically again")
+    # Scheduler state and decisions
+    schedule_parser = subparsers.add_parser("schedule", help="Show scheduler limits, waiting jobs and recent decisions")
+    schedule_parser.add_argument("--limit", type=int, default=20, help="Number of recent decisions to show")
+    # Instrumentation
+    subparsers.add_parser("metrics", help="Print download speeds, RPC/save/precheck latencies and spawn times in Prometheus text format")
     # Config commands
     config_parser = subparsers.add_parser("config", help="View or set backend configuration")
     config_sub = config_parser.add_subparsers(dest="config_command")
@@ -84,6 +218,33 @@ def main():
     cfg_mega = config_sub.add_parser("mega", help="Set Mega credentials")
     cfg_mega.add_argument("--email", dest="email", help="Set Mega email")
     cfg_mega.add_argument("--password", dest="password", help="Set Mega password")
+
+    cfg_state = config_sub.add_parser("persistence", help="Set how queue state is stored")
+    cfg_state.add_argument("--mode", choices=["json", "journal", "sqlite"], help="json: rewrite the state file on every change; journal: append changes and compact in the background; sqlite: indexed database with per-row updates")
+    cfg_state.add_argument("--compact-bytes", dest="compact_bytes", type=int, help="Journal size that triggers compaction into the state file")
+
+    cfg_precheck = config_sub.add_parser("precheck", help="Set how URLs are checked before queueing")
+    cfg_precheck.add_argument("--mode", choices=["blocking", "background", "off"], help="blocking: check before queueing; background: queue first and mark unreachable jobs as errors; off: leave it to aria2")
+    cfg_precheck.add_argument("--workers", type=int, help="Number of concurrent precheck threads")
+    cfg_precheck.add_argument("--per-host", dest="per_host", type=int, help="Maximum concurrent prechecks against one host")
+    cfg_precheck.add_argument("--timeout", type=float, help="Per-request timeout in seconds")
+    cfg_precheck.add_argument("--deadline", type=float, help="Overall time limit in seconds for checking a bulk add")
+    cfg_sched = config_sub.add_parser("scheduler", help="Set how many downloads run at once and in which order")
+    cfg_sched.add_argument("--max-active", dest="max_active", type=int, help="Maximum downloads running at once (0 removes the limit)")
+    cfg_sched.add_argument("--per-host", dest="per_host", type=int, help="Maximum downloads running at once against one host (0 removes the limit)")
+    cfg_sched.add_argument("--per-backend", dest="per_backend", action="append", metavar="BACKEND=N", help="Maximum downloads running at once on a backend, e.g. mega=1 (repeatable; 0 removes the limit)")
+    cfg_sched.add_argument("--policy", choices=["fifo", "priority", "shortest"], help="Start order: fifo (oldest first), priority (highest --priority first) or shortest (smallest known size first)")
+    cfg_checksum = config_sub.add_parser("checksum", help="Set checksum verification retries and hashing processes")
+    cfg_checksum.add_argument("--retries", type=int, help="Times a download is fetched again after a checksum mismatch before it is an error")
+    cfg_checksum.add_argument("--workers", type=int, help="Processes hashing finished Mega/standalone aria2c downloads (0: one per CPU)")
+    cfg_dedup = config_sub.add_parser("dedup", help="Set how downloads of content already on disk are handled")
+    cfg_dedup.add_argument("--enable", dest="enabled", action="store_true", default=None, help="Complete new downloads from identical files already downloaded (the default)")
+    cfg_dedup.add_argument("--disable", dest="enabled", action="store_false", help="Always download, even when the content is already on disk")
+    cfg_dedup.add_argument("--methods", nargs="+", choices=["hardlink", "reflink", "copy"], help="How to place the existing file, tried in order (default: hardlink reflink copy)")
+    # Long-running daemon serving add/pause/resume/remove/status/list
+    daemon_parser = subparsers.add_parser("daemon", help="Run the downloader daemon so other commands skip per-call startup")
+    daemon_parser.add_argument("--stop", action="store_true", help="Stop a running daemon")
+    daemon_parser.add_argument("--metrics-port", dest="metrics_port", type=int, help="Also serve metrics for Prometheus at http://localhost:PORT/metrics")
     # Download portable aria2
     subparsers.add_parser("get-aria2", help="Download portable aria2c.exe for Windows into project directory")
     # Download portable MegaCMD
@@ -93,31 +254,62 @@ def main():
 
 
     args = parser.parse_args()
+    params = None
+    if args.trace or os.getenv("DOWNLOADER_TRACE"):
+        from downloader.core import tracing
+        tracing.start(args.trace or os.environ["DOWNLOADER_TRACE"])
+    if args.command in ("metrics", "daemon"):
+        # Recording is off by default; the daemon keeps the numbers a later 'metrics' call reports
+        from downloader.core import metrics
+        metrics.enable()
+    if args.command in MANAGER_COMMANDS or args.command == "daemon":
+        from downloader.core.daemon import DaemonUnavailable, run_command, send_command
+    if args.command in MANAGER_COMMANDS:
+        if args.command == "add" and not (args.url or args.from_file):
+            add_parser.error("a URL or --from-file is required")
+        if args.command == "tune" and (args.connections or args.unpin) and not args.host:
+            tune_parser.error("a host is required to pin or unpin")
+        if args.command == "tune" and args.connections is not None and not 1 <= args.connections <= 16:
+            tune_parser.error("--connections must be between 1 and 16")
+        params = _command_params(args)
+        if not args.no_daemon:
+            try:
+                reply = send_command(args.command, params)
+            except DaemonUnavailable:
+                pass
+            else:
+                print(reply.get("output", ""), end="")
+                if not reply.get("ok"):
+                    print(f"Daemon error: {reply.get('error')}")
+                return
+    elif args.command == "daemon" and args.stop:
+        try:
+            print(send_command("shutdown").get("output", ""), end="")
+        except DaemonUnavailable:
+            print("No downloader daemon is running.")
+        return
+
     config = Config()
-    manager = DownloadManager(aria2_direct_fallback=args.aria2_direct_fallback, config=config)
 
-    if args.command == "add":
-        manager.add(args.url, backend=args.backend)
-    elif args.command == "pause":
-        manager.pause(args.id)
-    elif args.command == "resume":
-        manager.resume(args.id)
-    elif args.command == "remove":
-        manager.remove(args.id)
-    elif args.command == "status":
-        manager.status(args.id)
-    elif args.command == "list":
-        manager.refresh()
-        manager.status()
+    def _manager():
+        # Only commands that touch downloads pay for the manager, its state and backends
+        from downloader.core.manager import DownloadManager
+        return DownloadManager(aria2_direct_fallback=args.aria2_direct_fallback, config=config)
+
+    if args.command in MANAGER_COMMANDS:
+        run_command(_manager(), args.command, params)
+    elif args.command == "daemon":
+        _run_daemon(_manager(), args.metrics_port)
     elif args.command == "get-aria2":
         if sys.platform != "win32":
             print("get-aria2 is currently supported on Windows only.")
         else:
             _install_portable_aria2()
     elif args.command == "get-mega":
-        import os, urllib.request, subprocess, shutil
+        import urllib.request, subprocess, shutil
         from pathlib import Path
         from downloader.core.utils import PROJECT_ROOT
+        from downloader.core.binaries import invalidate_binary
 
         mega_url = "https://mega.nz/MEGAcmdSetup64.exe"
         installer_path = Path(PROJECT_ROOT) / "downloader" / "MEGAcmdSetup64.exe"
@@ -167,6 +359,7 @@ def main():
                     shutil.rmtree(dest)
                 shutil.copytree(source_dir, dest)
                 print(f"Copied MEGAcmd to portable folder: {dest}")
+                invalidate_binary("mega-get")
             except Exception as e:
                 print(f"Failed to copy MEGAcmd to portable folder: {e}")
 
@@ -206,11 +399,54 @@ def main():
         elif args.config_command == "mega":
             config.set_mega(email=args.email, password=args.password)
             print("Updated Mega config.")
+        elif args.config_command == "persistence":
+            from downloader.core.persistence import migrate_persistence
+            try:
+                old_mode = config.get_persistence().get("mode")
+                config.set_persistence(mode=args.mode, compact_bytes=args.compact_bytes)
+                if args.mode:
+                    options = {k: v for k, v in config.get_persistence().items() if k != "mode"}
+                    migrate_persistence(old_mode, args.mode, **options)
+                print("Updated persistence config.")
+            except ValueError as ve:
+                print(f"Invalid persistence config: {ve}")
+        elif args.config_command == "precheck":
+            try:
+                config.set_precheck(mode=args.mode, workers=args.workers, per_host=args.per_host, timeout=args.timeout, deadline=args.deadline)
+                print("Updated precheck config.")
+            except ValueError as ve:
+                print(f"Invalid precheck config: {ve}")
+        elif args.config_command == "scheduler":
+            try:
+                per_backend = None
+                if args.per_backend:
+                    per_backend = {}
+                    for item in args.per_backend:
+                        name, sep, value = item.partition("=")
+                        if not sep or not value.strip().isdigit():
+                            raise ValueError(f"expected BACKEND=N, got {item!r}")
+                        per_backend[name.strip()] = int(value)
+                config.set_scheduler(max_active=args.max_active, per_host=args.per_host, per_backend=per_backend, policy=args.policy)
+                print("Updated scheduler config.")
+            except ValueError as ve:
+                print(f"Invalid scheduler config: {ve}")
+        elif args.config_command == "checksum":
+            try:
+                config.set_checksum(retries=args.retries, workers=args.workers)
+                print("Updated checksum config.")
+            except ValueError as ve:
+                print(f"Invalid checksum config: {ve}")
+        elif args.config_command == "dedup":
+            try:
+                config.set_dedup(enabled=args.enabled, methods=args.methods)
+                print("Updated dedup config.")
+            except ValueError as ve:
+                print(f"Invalid dedup config: {ve}")
         else:
             config_parser = [sp for sp in subparsers.choices.values() if sp.prog.endswith('config')]
             parser.print_help()
     elif args.command == "get-7zip":
-        import os, urllib.request, shutil
+        import urllib.request, shutil
         from pathlib import Path
         from downloader.core.utils import PROJECT_ROOT
 
@@ -231,38 +467,30 @@ def main():
             print(f"Failed to download 7zr.exe: {e}")
     # (Removed duplicate and obsolete code for get-aria2 and get-mega)
     elif args.command == "aria2-list":
-        from downloader.core.aria2_backend import Aria2Backend, DEFAULT_RPC_SECRET
+        from downloader.core.aria2_backend import Aria2Backend, DEFAULT_RPC_SECRET, STATUS_KEYS
         backend = Aria2Backend(rpc_secret=DEFAULT_RPC_SECRET)
+        backend.attach_recorded_endpoint()
         # List all active downloads via aria2 RPC
-        payload = {
-            "jsonrpc": "2.0",
-            "id": "tellActive",
-            "method": "aria2.tellActive",
-            "params": [f"token:{backend.rpc_secret}", ["gid", "status", "totalLength", "completedLength", "downloadSpeed", "errorCode", "errorMessage"]]
-        }
-        import urllib.request, json
         try:
-            req = urllib.request.Request(backend.rpc_url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
-            with urllib.request.urlopen(req) as resp:
-                result = json.loads(resp.read())
-                downloads = result.get('result') or []
-                if not downloads:
-                    print("No active aria2 downloads.")
-                    return
-                for d in downloads:
-                    gid = d['gid']
-                    status = d.get('status')
-                    total = int(d.get('totalLength', 0))
-                    completed = int(d.get('completedLength', 0))
-                    percent = (completed / total * 100) if total else 0
-                    speed = int(d.get('downloadSpeed', 0))
-                    err = d.get('errorMessage') or ''
-                    print(f"GID: {gid} | Status: {status} | Progress: {percent:.2f}% ({completed}/{total} bytes) | Speed: {speed/1024:.2f} KB/s {err}")
+            downloads = backend.rpc.call("aria2.tellActive", ["gid", *STATUS_KEYS]) or []
+            if not downloads:
+                print("No active aria2 downloads.")
+                return
+            for d in downloads:
+                gid = d['gid']
+                status = d.get('status')
+                total = int(d.get('totalLength', 0))
+                completed = int(d.get('completedLength', 0))
+                percent = (completed / total * 100) if total else 0
+                speed = int(d.get('downloadSpeed', 0))
+                err = d.get('errorMessage') or ''
+                print(f"GID: {gid} | Status: {status} | Progress: {percent:.2f}% ({completed}/{total} bytes) | Speed: {speed/1024:.2f} KB/s {err}")
         except Exception as e:
             print(f"Failed to list aria2 downloads: {e}")
     elif args.command == "aria2-progress":
         from downloader.core.aria2_backend import Aria2Backend, DEFAULT_RPC_SECRET
         backend = Aria2Backend(rpc_secret=DEFAULT_RPC_SECRET)
+        backend.attach_recorded_endpoint()
         status = backend.get_status(args.gid)
         if status:
             total = int(status.get('totalLength', 0))
@@ -274,6 +502,27 @@ def main():
             print(f"GID: {args.gid}\nStatus: {status.get('status')}\nProgress: {percent:.2f}% ({completed}/{total} bytes)\nSpeed: {speed/1024:.2f} KB/s{err_line}")
         else:
             print("Could not retrieve status for GID", args.gid)
+    elif args.command in ("aria2-health", "aria2-shutdown"):
+        from downloader.core.aria2_backend import Aria2Backend, DEFAULT_RPC_SECRET
+        aria2_cfg = config.get_aria2()
+        backend = Aria2Backend(
+            rpc_secret=aria2_cfg.get("rpc_secret", DEFAULT_RPC_SECRET),
+            rpc_port=aria2_cfg.get("rpc_port", 6800),
+        )
+        if args.command == "aria2-shutdown":
+            print("aria2c stopped." if backend.shutdown_rpc() else "aria2c did not stop in time.")
+        else:
+            info = backend.health()
+            if not info["recorded"]:
+                print("No aria2c endpoint recorded; checking the configured port.")
+            elif info["stale"]:
+                print("The recorded aria2c endpoint is stale; it was not contacted.")
+            pid_state = "unknown" if info["pid_alive"] is None else ("alive" if info["pid_alive"] else "not running")
+            print(f"Port: {info['port']}\nPID: {info['pid'] or '-'} ({pid_state})")
+            if info["reachable"]:
+                print(f"RPC: reachable (aria2 {info['version']})\nActive: {info['active']}  Waiting: {info['waiting']}  Stopped: {info['stopped']}")
+            else:
+                print(f"RPC: unreachable ({info.get('error')})")
     else:
         parser.print_help()
 
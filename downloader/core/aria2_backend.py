@@ -1,29 +1,46 @@
 # aria2 backend implementation
 import os
-import json
 import time
-import ssl
 import socket
-import shutil
 import subprocess
-import urllib.error
 import urllib.parse
-import urllib.request
-from .utils import ensure_download_dir, PROJECT_ROOT
+from . import metrics, tracing
+from .aria2_rpc import Aria2RpcClient, Aria2RpcAuthError
+from .precheck import precheck_url
+from .segmented import SegmentedDownload, part_paths, read_chunk_map
+from .checksums import parse_checksum
+from .job import DIRECT_DOWNLOAD_GID
+from .binaries import cached_binary
+from .aria2_endpoint import load_endpoint, save_endpoint, clear_endpoint, secret_fingerprint, pid_alive
+from .utils import echo, ensure_download_dir, PROJECT_ROOT, ARIA2_LOG_PATH
 
 DEFAULT_RPC_SECRET = "secret123"
+STATUS_KEYS = ["status", "completedLength", "totalLength", "downloadSpeed", "connections", "errorCode", "errorMessage"]
 
 class Aria2Backend:
     def __init__(self, binary_path=None, rpc_port=6800, rpc_secret=DEFAULT_RPC_SECRET, allow_direct_fallback=None):
-        self.binary_path = binary_path or self._find_aria2c()
+        self.binary_path = binary_path or cached_binary("aria2c", self._find_aria2c)
         self.rpc_port = rpc_port
         self.rpc_url = f'http://localhost:{self.rpc_port}/jsonrpc' if rpc_port else None
         self.rpc_secret = rpc_secret
+        self.rpc = Aria2RpcClient(port=rpc_port, secret=rpc_secret)
         self.aria2c_proc = None
         if allow_direct_fallback is None:
             env_val = os.getenv("ARIA2_DIRECT_FALLBACK", "").lower()
             allow_direct_fallback = env_val in ("1", "true", "yes", "on")
         self.allow_direct_fallback = bool(allow_direct_fallback)
+        # Optional MetadataCache shared with the manager; lets known-good URLs skip the precheck
+        self.metadata = None
+        # Where the live RPC endpoint is recorded between runs (None: the project default)
+        self.endpoint_path = None
+        # Optional HostTuning shared with the manager: per-host split/connection counts
+        self.host_tuning = None
+        # gid -> connection count it was started with, so speed samples are attributed correctly
+        self.connection_settings = {}
+        # Optional MirrorStats shared with the manager: per-mirror throughput from direct downloads
+        self.mirror_stats = None
+        # Optional ContentIndex shared with the manager: finished direct downloads are added to it
+        self.content_index = None
 
     def _is_socket_permission_error(self, err):
         msg = str(err or "").lower()
@@ -33,8 +50,12 @@ class Aria2Backend:
             or "error 10013" in msg
         )
 
-    def _spawn_cli_download(self, url, downloads_dir, options=None, return_proc=False):
-        """Fallback to standalone aria2c (no RPC) when RPC sockets are blocked."""
+    def _spawn_cli_download(self, url, downloads_dir, options=None, return_proc=False, mirrors=None):
+        """Fallback to standalone aria2c (no RPC) when RPC sockets are blocked.
+
+        ``mirrors`` (URLs of the same file, ``url`` included) are all given to aria2c, which then
+        fetches pieces from each of them.
+        """
         options = options or {}
         args = [
             self.binary_path,
@@ -46,37 +67,34 @@ class Aria2Backend:
         out_name = options.get("out") or options.get("filename")
         if out_name:
             args += ["-o", out_name]
-        args.append(url)
+        if options.get("max-download-limit"):
+            args.append(f"--max-download-limit={options['max-download-limit']}")
+        args.extend(mirrors or [url])
 
         try:
-            proc = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT, text=True)
-            print("[aria2] Started standalone aria2c (no RPC) due to socket permissions block.")
+            start = time.perf_counter()
+            with tracing.span('spawn aria2c-standalone'):
+                proc = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT, text=True)
+            metrics.SPAWN_SECONDS.observe(time.perf_counter() - start, process='aria2c-standalone')
+            echo("[aria2] Started standalone aria2c (no RPC) due to socket permissions block.")
             return proc if return_proc else proc.pid
         except Exception as e:
-            print(f"[aria2] Standalone aria2c failed: {e}")
+            echo(f"[aria2] Standalone aria2c failed: {e}")
             if self.allow_direct_fallback:
-                return self._direct_download(url, downloads_dir)
+                return self._direct_download(url, downloads_dir, mirrors=mirrors, checksum=options.get("checksum"))
             raise
 
+    def _set_rpc_port(self, port):
+        self.rpc_port = port
+        self.rpc_url = f'http://localhost:{self.rpc_port}/jsonrpc'
+        self.rpc.set_port(port)
+
     def _rpc_ping(self):
-        payload = {
-            "jsonrpc": "2.0",
-            "id": "ping",
-            "method": "aria2.getVersion",
-            "params": [f"token:{self.rpc_secret}"]
-        }
         try:
-            req = urllib.request.Request(
-                self.rpc_url,
-                data=json.dumps(payload).encode(),
-                headers={'Content-Type': 'application/json'}
-            )
-            with urllib.request.urlopen(req, timeout=2):
-                return True
-        except urllib.error.HTTPError as he:
-            if he.code == 401:
-                raise RuntimeError("aria2 RPC reachable but authentication failed; check rpc-secret") from he
-            return False
+            self.rpc.call("aria2.getVersion", timeout=2)
+            return True
+        except Aria2RpcAuthError:
+            raise
         except Exception:
             return False
 
@@ -100,8 +118,52 @@ class Aria2Backend:
                 deduped.append(p)
         return deduped
 
+    def attach_recorded_endpoint(self):
+        """Point the RPC client at the aria2c recorded by an earlier run, if it is still there.
+
+        The record is only trusted when it was made with the same RPC secret and its process
+        is alive; a stale record is removed. Returns True when the endpoint answered a ping.
+        """
+        endpoint = load_endpoint(self.endpoint_path)
+        if not endpoint:
+            return False
+        if not self._endpoint_is_ours(endpoint):
+            return False
+        pid = endpoint.get("pid")
+        if pid and not pid_alive(pid):
+            clear_endpoint(self.endpoint_path)
+            return False
+        previous_port = self.rpc_port
+        self._set_rpc_port(endpoint["port"])
+        try:
+            if self._rpc_ping():
+                return True
+        except Aria2RpcAuthError:
+            pass
+        clear_endpoint(self.endpoint_path)
+        self._set_rpc_port(previous_port)
+        return False
+
+    @tracing.traced('wait_ready')
+    def _wait_ready(self, proc, timeout=10.0):
+        """Ping a freshly spawned aria2c with exponential backoff until it answers, exits or times out."""
+        deadline = time.monotonic() + timeout
+        delay = 0.01
+        while True:
+            if self._rpc_ping():
+                return True
+            if proc.poll() is not None or time.monotonic() >= deadline:
+                return False
+            time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            delay = min(delay * 2, 0.25)
+
+    @tracing.traced('ensure_rpc')
     def _ensure_rpc(self, downloads_dir):
         """Ensure an aria2 RPC server is reachable; start one if needed, trying alternate ports on permission errors."""
+        # Fast path: the endpoint a previous run started or found
+        if self.attach_recorded_endpoint():
+            return
+
         if not os.path.isfile(self.binary_path):
             raise RuntimeError(f"aria2c binary not found at {self.binary_path}")
 
@@ -109,10 +171,10 @@ class Aria2Backend:
         last_error = None
 
         for port in ports_to_try:
-            self.rpc_port = port
-            self.rpc_url = f'http://localhost:{self.rpc_port}/jsonrpc'
+            self._set_rpc_port(port)
             try:
                 if self._rpc_ping():
+                    save_endpoint(port, None, self.rpc_secret, self.endpoint_path)
                     return
             except RuntimeError as auth_err:
                 # Port in use with different secret; try another port
@@ -136,24 +198,24 @@ class Aria2Backend:
                 f'--rpc-secret={self.rpc_secret}',
                 f'--dir={downloads_dir}'
             ]
-            self.aria2c_proc = subprocess.Popen(rpc_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-            # Wait for RPC server to start
-            for _ in range(10):
-                try:
-                    if self._rpc_ping():
-                        return
-                except RuntimeError as auth_err:
-                    last_error = auth_err
-                    break
-                except Exception:
-                    time.sleep(0.5)
+            # Output goes to a log file: a pipe nobody reads would block aria2c, and would break
+            # (SIGPIPE) once this process exits while aria2c keeps serving later runs
+            start = time.perf_counter()
+            with tracing.span('spawn aria2c', port=self.rpc_port), open(ARIA2_LOG_PATH, 'w') as log:
+                self.aria2c_proc = subprocess.Popen(
+                    rpc_cmd, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                    start_new_session=(os.name != 'nt'),
+                )
+            metrics.SPAWN_SECONDS.observe(time.perf_counter() - start, process='aria2c')
+            try:
+                if self._wait_ready(self.aria2c_proc):
+                    save_endpoint(self.rpc_port, self.aria2c_proc.pid, self.rpc_secret, self.endpoint_path)
+                    return
+            except RuntimeError as auth_err:
+                last_error = auth_err
             # If process died, capture output and try next port
             if self.aria2c_proc.poll() is not None:
-                try:
-                    output = (self.aria2c_proc.stdout.read() or "").strip()
-                except Exception:
-                    output = ""
-                last_error = RuntimeError(f"aria2 RPC failed to start on port {self.rpc_port} (exit {self.aria2c_proc.returncode}). Output: {output}")
+                last_error = RuntimeError(f"aria2 RPC failed to start on port {self.rpc_port} (exit {self.aria2c_proc.returncode}). Output: {self._log_tail()}")
                 self.aria2c_proc = None
                 continue
 
@@ -161,6 +223,97 @@ class Aria2Backend:
             raise last_error
         raise RuntimeError("aria2 RPC server not reachable after trying alternate ports")
 
+    def _log_tail(self, limit=2000):
+        try:
+            with open(ARIA2_LOG_PATH, 'r', errors='replace') as f:
+                return f.read()[-limit:].strip()
+        except OSError:
+            return ""
+
+    def _endpoint_is_ours(self, endpoint):
+        # Recorded with this RPC secret; anything else is another aria2c or a stale record
+        return endpoint.get("secret_fingerprint") == secret_fingerprint(self.rpc_secret)
+
+    def health(self):
+        """Report on the recorded aria2c: endpoint, process liveness, version and queue counts.
+
+        A record made with a different RPC secret is reported as ``stale`` and not contacted.
+        """
+        endpoint = load_endpoint(self.endpoint_path) or {}
+        stale = bool(endpoint) and not self._endpoint_is_ours(endpoint)
+        if endpoint.get("port") and not stale:
+            self._set_rpc_port(endpoint["port"])
+        pid = endpoint.get("pid")
+        info = {
+            "port": endpoint.get("port") or self.rpc_port,
+            "pid": pid,
+            "pid_alive": pid_alive(pid) if pid else None,
+            "started_at": endpoint.get("started_at"),
+            "recorded": bool(endpoint),
+            "stale": stale,
+            "reachable": False,
+        }
+        if stale:
+            info["error"] = "the recorded aria2c was started with a different RPC secret"
+            return info
+        try:
+            version = self.rpc.call("aria2.getVersion", timeout=2)
+            stat = self.rpc.call("aria2.getGlobalStat", timeout=2)
+        except Exception as e:
+            info["error"] = str(e)
+            return info
+        info.update(
+            reachable=True,
+            version=version.get("version"),
+            active=int(stat.get("numActive", 0)),
+            waiting=int(stat.get("numWaiting", 0)),
+            stopped=int(stat.get("numStopped", 0)),
+            download_speed=int(stat.get("downloadSpeed", 0)),
+        )
+        return info
+
+    def shutdown_rpc(self, timeout=5.0):
+        """Stop the recorded aria2c cleanly (aria2.shutdown, then forceShutdown, then SIGTERM).
+
+        Returns True when aria2c is gone (or was not running); the endpoint record is cleared.
+        """
+        endpoint = load_endpoint(self.endpoint_path) or {}
+        if not self._endpoint_is_ours(endpoint):
+            # Not ours to stop (another secret): only the configured port is tried
+            endpoint = {}
+        if endpoint.get("port"):
+            self._set_rpc_port(endpoint["port"])
+        pid = endpoint.get("pid") or (self.aria2c_proc.pid if self.aria2c_proc else None)
+
+        def _gone():
+            if pid:
+                return not pid_alive(pid) or (self.aria2c_proc is not None and self.aria2c_proc.poll() is not None)
+            return not self._rpc_ping()
+
+        for method in ("aria2.shutdown", "aria2.forceShutdown"):
+            try:
+                self.rpc.call(method, timeout=2)
+            except Exception:
+                pass
+            self.rpc.close()
+            deadline = time.monotonic() + timeout / 2
+            delay = 0.01
+            while not _gone() and time.monotonic() < deadline:
+                time.sleep(delay)
+                delay = min(delay * 2, 0.25)
+            if _gone():
+                break
+        else:
+            if pid:
+                try:
+                    import signal
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+        clear_endpoint(self.endpoint_path)
+        self.aria2c_proc = None
+        return _gone()
+
     def _find_aria2c(self):
         # Prefer portable binary in aria2_portable, then project tree, then PATH
         exe_name = 'aria2c.exe' if os.name == 'nt' else 'aria2c'
@@ -175,146 +328,258 @@ class Aria2Backend:
         return exe_name  # fallback to PATH
 
     def _precheck_url(self, url):
-        """Lightweight reachability check before handing off to aria2.
-
-        For http/https, issue a HEAD (or byte-range GET fallback) with certificate checks disabled
-        to mirror aria2's default `--check-certificate=false`. Other schemes are skipped.
-        """
-        if not (url.startswith("http://") or url.startswith("https://")):
+        if self.metadata is not None and self.metadata.get(url) is not None:
             return
+        metadata = precheck_url(url)
+        if self.metadata is not None and metadata:
+            self.metadata.put(url, metadata)
 
-        ctx = None
-        if url.startswith("https://"):
-            try:
-                ctx = ssl._create_unverified_context()
-            except Exception:
-                ctx = None
-
-        def _try_request(method, headers=None):
-            req = urllib.request.Request(url, method=method, headers=headers or {})
-            with urllib.request.urlopen(req, timeout=5, context=ctx):
-                return True
-
-        try:
-            _try_request("HEAD")
-            return
-        except urllib.error.HTTPError as he:
-            if he.code not in (400, 403, 405):
-                raise RuntimeError(f"URL precheck failed: HTTP {he.code}") from he
-            # HEAD refused, fall through to range GET fallback
-        except Exception:
-            # Connection-level failure on HEAD; try range GET next
-            pass
+    def _tuned_options(self, url, options):
+        """``options`` plus the host's tuned split/connection count, unless the caller set them."""
+        if self.host_tuning is None or "split" in options or "max-connection-per-server" in options:
+            return options
+        n = str(self.host_tuning.connections(url))
+        return dict(options, **{"split": n, "max-connection-per-server": n})
 
-        # Fallback: tiny range GET to detect reachability
-        try:
-            _try_request("GET", {"Range": "bytes=0-0"})
-            return
-        except Exception as e:
-            raise RuntimeError(f"URL precheck failed (range GET): {e}") from e
+    def _remember_connections(self, gid, options):
+        if isinstance(gid, str) and options.get("max-connection-per-server"):
+            self.connection_settings[gid] = int(options["max-connection-per-server"])
 
-    def add(self, url, options=None, return_proc=False, progress_callback=None):
-        # Basic reachability check before spinning up aria2/RPC
-        self._precheck_url(url)
+    def add(self, url, options=None, return_proc=False, progress_callback=None, precheck=True, throttle=None,
+            mirrors=None):
+        # ``mirrors``: every URL serving this file, ``url`` included, in preference order
+        # Basic reachability check before spinning up aria2/RPC (callers may run it elsewhere)
+        if precheck:
+            self._precheck_url(url)
         downloads_dir = os.fspath(ensure_download_dir())
         options = (options or {}).copy()
         options.setdefault("dir", downloads_dir)
         options.setdefault("check-certificate", "false")
+        options = self._tuned_options(url, options)
 
         try:
             # Ensure aria2 RPC is running (start if not)
             self._ensure_rpc(downloads_dir)
         except Exception as ensure_err:
             if self._is_socket_permission_error(ensure_err):
-                print("[aria2] RPC start blocked by socket permissions; switching to standalone aria2c.")
-                return self._spawn_cli_download(url, downloads_dir, options, return_proc=return_proc)
+                echo("[aria2] RPC start blocked by socket permissions; switching to standalone aria2c.")
+                return self._spawn_cli_download(url, downloads_dir, options, return_proc=return_proc, mirrors=mirrors)
             raise
 
         # Add download via RPC, specifying the download directory per-download
-        payload = {
-            "jsonrpc": "2.0",
-            "id": "addUri",
-            "method": "aria2.addUri",
-            "params": [f"token:{self.rpc_secret}", [url], options]
-        }
         try:
-            req = urllib.request.Request(self.rpc_url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
-            with urllib.request.urlopen(req) as resp:
-                result = json.loads(resp.read())
-                gid = result['result']
-                print(f"Added download (GID: {gid}) via aria2 RPC.")
-                # If RPC immediately reports a permission error, fall back to direct download when allowed
-                try:
-                    status = self.get_status(gid)
-                    err_msg = (status or {}).get('errorMessage') if isinstance(status, dict) else None
-                    if err_msg and self._is_socket_permission_error(err_msg):
-                        print("aria2 RPC blocked by socket permissions; switching to standalone aria2c.")
-                        return self._spawn_cli_download(url, downloads_dir, options, return_proc=return_proc)
-                    if self.allow_direct_fallback and err_msg and 'forbidden by its access permissions' in err_msg:
-                        print("aria2 RPC blocked by socket permissions; using direct download fallback.")
-                        return self._direct_download(url, downloads_dir)
-                except Exception:
-                    # ignore status probe failures
-                    pass
-                return gid
+            gid = self.rpc.call("aria2.addUri", list(mirrors or [url]), options)
+            self._remember_connections(gid, options)
+            echo(f"Added download (GID: {gid}) via aria2 RPC.")
+            # If RPC immediately reports a permission error, fall back to direct download when allowed
+            try:
+                status = self.get_status(gid)
+                err_msg = (status or {}).get('errorMessage') if isinstance(status, dict) else None
+                if err_msg and self._is_socket_permission_error(err_msg):
+                    echo("aria2 RPC blocked by socket permissions; switching to standalone aria2c.")
+                    return self._spawn_cli_download(url, downloads_dir, options, return_proc=return_proc, mirrors=mirrors)
+                if self.allow_direct_fallback and err_msg and 'forbidden by its access permissions' in err_msg:
+                    echo("aria2 RPC blocked by socket permissions; using direct download fallback.")
+                    return self._direct_download(url, downloads_dir, progress_callback, throttle, mirrors,
+                                                 options.get("checksum"))
+            except Exception:
+                # ignore status probe failures
+                pass
+            return gid
         except Exception as e:
-            print(f"[aria2] Failed to add download via RPC: {e}")
+            echo(f"[aria2] Failed to add download via RPC: {e}")
             if self._is_socket_permission_error(e):
-                print("[aria2] RPC call blocked by socket permissions; switching to standalone aria2c.")
-                return self._spawn_cli_download(url, downloads_dir, options, return_proc=return_proc)
+                echo("[aria2] RPC call blocked by socket permissions; switching to standalone aria2c.")
+                return self._spawn_cli_download(url, downloads_dir, options, return_proc=return_proc, mirrors=mirrors)
             if self.allow_direct_fallback:
                 try:
-                    return self._direct_download(url, downloads_dir)
+                    return self._direct_download(url, downloads_dir, progress_callback, throttle, mirrors,
+                                                 options.get("checksum"))
                 except Exception as fallback_err:
-                    print(f"[aria2] Fallback direct download failed: {fallback_err}")
+                    echo(f"[aria2] Fallback direct download failed: {fallback_err}")
             raise
 
-    def _direct_download(self, url, downloads_dir):
-        """Synchronous direct download as a fallback when aria2 RPC cannot start or connect."""
+    def add_many(self, urls, options=None, mirrors=None, extra_options=None):
+        """Queue many URLs with one ``system.multicall`` of ``aria2.addUri``.
+
+        Returns one entry per URL: its GID, a standalone aria2c process when RPC sockets are
+        blocked, or the exception that URL failed with. There is no per-URL precheck here;
+        callers check the batch concurrently first (see ``PrecheckPool``). ``mirrors`` maps a
+        URL to all the URLs serving that file, as ``add`` takes them; ``extra_options`` maps a URL
+        to options of its own (e.g. its ``checksum``) on top of the shared ``options``.
+        """
+        urls = list(urls)
+        mirrors = mirrors or {}
+        extra_options = extra_options or {}
+        if not urls:
+            return []
+        downloads_dir = os.fspath(ensure_download_dir())
+        options = (options or {}).copy()
+        options.setdefault("dir", downloads_dir)
+        options.setdefault("check-certificate", "false")
+
+        try:
+            self._ensure_rpc(downloads_dir)
+        except Exception as ensure_err:
+            if not self._is_socket_permission_error(ensure_err):
+                raise
+            echo("[aria2] RPC start blocked by socket permissions; switching to standalone aria2c.")
+            results = []
+            for url in urls:
+                try:
+                    results.append(self._spawn_cli_download(url, downloads_dir, dict(options, **extra_options.get(url, {})),
+                                                           return_proc=True, mirrors=mirrors.get(url)))
+                except Exception as e:
+                    results.append(e)
+            return results
+
+        per_url = [self._tuned_options(url, dict(options, **extra_options.get(url, {}))) for url in urls]
+        results = self.rpc.multicall(
+            ("aria2.addUri", [list(mirrors.get(url) or [url]), opts]) for url, opts in zip(urls, per_url)
+        )
+        for gid, opts in zip(results, per_url):
+            self._remember_connections(gid, opts)
+        echo(f"Added {sum(isinstance(r, str) for r in results)} downloads via aria2 RPC.")
+        return results
+
+    def _direct_download(self, url, downloads_dir, progress_callback=None, throttle=None, mirrors=None, checksum=None):
+        """Direct download as a fallback when aria2 RPC cannot start or connect.
+
+        Uses the segmented engine. With ``progress_callback`` the download runs in the background
+        and the callback gets aria2-style status dicts; without one this call blocks until done.
+        ``throttle`` (a ``TokenBucket``) caps its speed; ``mirrors`` are fetched from alongside ``url``.
+        ``checksum`` (our or aria2's ``ALGO=HEX`` form) is verified while the file is written.
+        """
+        dest = self._direct_destination(url, downloads_dir)
+        # Known size/redirect target/range support let the engine skip its probe
+        known = self.metadata.get(url, fresh=False) if self.metadata is not None else None
+
+        def _on_progress(status):
+            if status["status"] == "complete":
+                if self.metadata is not None and engine.metadata:
+                    self.metadata.put(url, engine.metadata)
+                if self.content_index is not None and engine.metadata:
+                    sha256 = engine.digest if checksum and checksum.startswith("sha256=") else None
+                    self.content_index.add(dest, etag=engine.metadata.get("etag"), sha256=sha256, size=engine.total)
+                    self.content_index.flush()
+                if self.mirror_stats is not None:
+                    for source, speed in engine.source_speeds.items():
+                        self.mirror_stats.record_throughput(source, speed)
+                if progress_callback is not None:
+                    echo(f"[aria2] Direct download completed: {dest}")
+            elif status["status"] == "error" and progress_callback is not None:
+                echo(f"[aria2] Direct download failed: {status.get('errorMessage')}")
+            if progress_callback is not None:
+                progress_callback(status)
+
+        checksum = parse_checksum(checksum) if checksum else None
+        connections = self.host_tuning.connections(url) if self.host_tuning is not None else 4
+        engine = SegmentedDownload(
+            url, dest, connections=connections, progress_callback=_on_progress, known=known, throttle=throttle,
+            mirrors=mirrors, checksum=checksum,
+        )
+        echo(f"[aria2] Falling back to direct download -> {dest}")
+        if progress_callback is not None:
+            engine.start()
+            return DIRECT_DOWNLOAD_GID
+        engine.run()
+        echo(f"[aria2] Direct download completed: {dest}")
+        return DIRECT_DOWNLOAD_GID
+
+    def _direct_destination(self, url, downloads_dir):
+        """Target path for a direct download of ``url``.
+
+        An unfinished download of the same URL is resumed in place; otherwise the first name
+        (``name``, ``name_1``, ...) that neither an existing file nor another partial download uses.
+        """
         parsed = urllib.parse.urlparse(url)
         filename = os.path.basename(parsed.path) or "download.bin"
-        dest = os.path.join(downloads_dir, filename)
-        # Avoid overwriting an existing file with the same name
-        if os.path.exists(dest):
-            base, ext = os.path.splitext(filename)
-            dest = os.path.join(downloads_dir, f"{base}_1{ext}")
-        print(f"[aria2] Falling back to direct download -> {dest}")
-        with urllib.request.urlopen(url) as resp, open(dest, "wb") as f:
-            shutil.copyfileobj(resp, f)
-        print(f"[aria2] Direct download completed: {dest}")
-        return "direct-download"
+        base, ext = os.path.splitext(filename)
+        n = 0
+        while True:
+            dest = os.path.join(downloads_dir, f"{base}_{n}{ext}" if n else filename)
+            state = read_chunk_map(dest)
+            if state is not None and state.get("url") == url:
+                return dest
+            if not os.path.exists(dest) and not any(map(os.path.exists, part_paths(dest))):
+                return dest
+            n += 1
 
+    @tracing.traced('get_status')
     def get_status(self, gid):
         # Query aria2c RPC for download status
-        payload = {
-            "jsonrpc": "2.0",
-            "id": "tellStatus",
-            "method": "aria2.tellStatus",
-            "params": [f"token:{self.rpc_secret}", gid, ["status", "completedLength", "totalLength", "downloadSpeed", "errorCode", "errorMessage"]]
-        }
         try:
-            req = urllib.request.Request(self.rpc_url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
-            with urllib.request.urlopen(req) as resp:
-                result = json.loads(resp.read())
-                return result['result']
+            return self.rpc.call("aria2.tellStatus", gid, STATUS_KEYS)
         except Exception as e:
-            print(f"[aria2] Failed to get status via RPC: {e}")
+            echo(f"[aria2] Failed to get status via RPC: {e}")
             return None
 
+    def get_status_many(self, gids):
+        """Fetch the status of many GIDs in a single ``system.multicall`` round trip.
+
+        Returns a dict mapping each GID to its status, or to None when aria2 does not know it.
+        """
+        gids = list(dict.fromkeys(gids))
+        if not gids:
+            return {}
+        try:
+            results = self.rpc.multicall(("aria2.tellStatus", [gid, STATUS_KEYS]) for gid in gids)
+        except Exception as e:
+            echo(f"[aria2] Failed to get status via RPC: {e}")
+            return {}
+        return {gid: (None if isinstance(res, Exception) else res) for gid, res in zip(gids, results)}
+
+    def get_activity(self):
+        """``aria2.getGlobalStat`` and ``aria2.tellActive`` in one multicall: ``(stat, [{"gid", "downloadSpeed"}, ...])``.
+
+        Raises when aria2 is unreachable.
+        """
+        stat, active = self.rpc.multicall([
+            ("aria2.getGlobalStat", []),
+            ("aria2.tellActive", [["gid", "downloadSpeed"]]),
+        ])
+        for result in (stat, active):
+            if isinstance(result, Exception):
+                raise result
+        return stat or {}, active or []
+
+    def get_servers_many(self, gids):
+        """``aria2.getServers`` for many GIDs in one multicall: ``{gid: [{"uri", "downloadSpeed"}, ...]}``.
+
+        Lists one entry per URI aria2 is currently downloading from; GIDs that fail are left out.
+        """
+        gids = list(dict.fromkeys(gids))
+        if not gids:
+            return {}
+        try:
+            results = self.rpc.multicall(("aria2.getServers", [gid]) for gid in gids)
+        except Exception as e:
+            echo(f"[aria2] Failed to get servers via RPC: {e}")
+            return {}
+        servers = {}
+        for gid, res in zip(gids, results):
+            if isinstance(res, list):
+                servers[gid] = [server for files in res for server in files.get("servers", [])]
+        return servers
+
+    def get_files_many(self, gids):
+        """``aria2.getFiles`` for many GIDs in one multicall: ``{gid: [path, ...]}``; failed GIDs are left out."""
+        gids = list(dict.fromkeys(gids))
+        if not gids:
+            return {}
+        try:
+            results = self.rpc.multicall(("aria2.getFiles", [gid]) for gid in gids)
+        except Exception as e:
+            echo(f"[aria2] Failed to get files via RPC: {e}")
+            return {}
+        return {gid: [f["path"] for f in res if f.get("path")] for gid, res in zip(gids, results) if isinstance(res, list)}
+
     def pause(self, download_id):
         gid = download_id
         if not self.rpc_url:
             raise RuntimeError("aria2 RPC not initialized")
-        payload = {
-            "jsonrpc": "2.0",
-            "id": "pause",
-            "method": "aria2.pause",
-            "params": [f"token:{self.rpc_secret}", gid]
-        }
         try:
-            req = urllib.request.Request(self.rpc_url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
-            with urllib.request.urlopen(req) as resp:
-                json.loads(resp.read())
+            self.rpc.call("aria2.pause", gid)
         except Exception as e:
             raise RuntimeError(f"Failed to pause GID {gid}: {e}")
 
@@ -322,19 +587,18 @@ class Aria2Backend:
         gid = download_id
         if not self.rpc_url:
             raise RuntimeError("aria2 RPC not initialized")
-        payload = {
-            "jsonrpc": "2.0",
-            "id": "resume",
-            "method": "aria2.unpause",
-            "params": [f"token:{self.rpc_secret}", gid]
-        }
         try:
-            req = urllib.request.Request(self.rpc_url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
-            with urllib.request.urlopen(req) as resp:
-                json.loads(resp.read())
+            self.rpc.call("aria2.unpause", gid)
         except Exception as e:
             raise RuntimeError(f"Failed to resume GID {gid}: {e}")
 
+    def change_position(self, gid, pos, how="POS_SET"):
+        """Move a GID within aria2's waiting queue (``how`` is POS_SET, POS_CUR or POS_END)."""
+        try:
+            return self.rpc.call("aria2.changePosition", gid, pos, how)
+        except Exception as e:
+            raise RuntimeError(f"Failed to move GID {gid}: {e}")
+
     def remove(self, download_id):
         pass
 
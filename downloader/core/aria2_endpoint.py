@@ -0,0 +1,70 @@
+# Record of the live aria2 RPC endpoint so later runs can reuse it
+import hashlib
+import json
+import os
+import time
+from .utils import ARIA2_ENDPOINT_PATH
+
+
+def secret_fingerprint(secret):
+    """Short digest of the RPC secret; the secret itself is never written to the endpoint file."""
+    return hashlib.sha256((secret or "").encode("utf-8")).hexdigest()[:16]
+
+
+def load_endpoint(path=None):
+    try:
+        with open(os.fspath(path or ARIA2_ENDPOINT_PATH), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return data if isinstance(data, dict) and data.get("port") else None
+
+
+def save_endpoint(port, pid, secret, path=None):
+    """Remember the endpoint that answered; ``pid`` is None when aria2c was not started by us."""
+    path = os.fspath(path or ARIA2_ENDPOINT_PATH)
+    data = {
+        "port": port,
+        "pid": pid,
+        "secret_fingerprint": secret_fingerprint(secret),
+        "started_at": time.time(),
+    }
+    previous = load_endpoint(path)
+    if previous and previous.get("port") == port and previous.get("pid") == pid:
+        # Same aria2c as before: keep its original start time
+        data["started_at"] = previous.get("started_at", data["started_at"])
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+    return data
+
+
+def clear_endpoint(path=None):
+    try:
+        os.remove(os.fspath(path or ARIA2_ENDPOINT_PATH))
+    except FileNotFoundError:
+        pass
+
+
+def pid_alive(pid):
+    """Best-effort liveness check; returns True when it cannot tell (e.g. Windows without psutil)."""
+    try:
+        import psutil  # optional dependency
+        return psutil.pid_exists(pid)
+    except ImportError:
+        pass
+    if os.name == "nt":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    # An exited child that nobody reaped yet still answers kill(0); Linux shows it as a zombie
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            return f.read().rsplit(b")", 1)[1].split()[0] != b"Z"
+    except (OSError, IndexError):
+        return True
@@ -0,0 +1,202 @@
+# aria2 WebSocket notification listener (onDownloadStart/Pause/Stop/Complete/Error)
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Notifications aria2 pushes over its WebSocket RPC endpoint
+ARIA2_EVENTS = (
+    "aria2.onDownloadStart",
+    "aria2.onDownloadPause",
+    "aria2.onDownloadStop",
+    "aria2.onDownloadComplete",
+    "aria2.onDownloadError",
+    "aria2.onBtDownloadComplete",
+)
+
+
+class WebSocketClosed(ConnectionError):
+    pass
+
+
+class _WebSocket:
+    """Just enough of an RFC 6455 client to receive aria2 notifications."""
+
+    def __init__(self, host, port, path="/jsonrpc", timeout=5):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        try:
+            self._handshake(host, port, path)
+        except Exception:
+            self.sock.close()
+            raise
+
+    def _handshake(self, host, port, path):
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        )
+        self.sock.sendall(request.encode())
+        head = b""
+        while b"\r\n\r\n" not in head:
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise WebSocketClosed("connection closed during WebSocket handshake")
+            head += chunk
+        head, self._pending = head.split(b"\r\n\r\n", 1)
+        lines = head.decode("latin-1").split("\r\n")
+        if " 101 " not in f"{lines[0]} ":
+            raise ConnectionError(f"WebSocket upgrade refused: {lines[0]}")
+        headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(":") for l in lines[1:])}
+        expected = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        if headers.get("sec-websocket-accept") != expected:
+            raise ConnectionError("WebSocket upgrade returned a bad Sec-WebSocket-Accept")
+
+    def _read(self, n):
+        while len(self._pending) < n:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise WebSocketClosed("WebSocket connection closed")
+            self._pending += chunk
+        data, self._pending = self._pending[:n], self._pending[n:]
+        return data
+
+    def _send_frame(self, opcode, payload=b""):
+        # Client frames must be masked
+        mask = os.urandom(4)
+        header = bytes([0x80 | opcode])
+        n = len(payload)
+        if n < 126:
+            header += bytes([0x80 | n])
+        elif n < 1 << 16:
+            header += bytes([0x80 | 126]) + struct.pack("!H", n)
+        else:
+            header += bytes([0x80 | 127]) + struct.pack("!Q", n)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        self.sock.sendall(header + mask + masked)
+
+    def send_text(self, text):
+        self._send_frame(0x1, text.encode())
+
+    def recv_text(self):
+        """Return the next text message, answering pings and reassembling fragments."""
+        parts = []
+        while True:
+            b0, b1 = self._read(2)
+            opcode = b0 & 0x0F
+            n = b1 & 0x7F
+            if n == 126:
+                n = struct.unpack("!H", self._read(2))[0]
+            elif n == 127:
+                n = struct.unpack("!Q", self._read(8))[0]
+            mask = self._read(4) if b1 & 0x80 else None
+            payload = self._read(n)
+            if mask:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            if opcode == 0x8:
+                raise WebSocketClosed("WebSocket closed by peer")
+            if opcode == 0x9:
+                self._send_frame(0xA, payload)
+                continue
+            if opcode == 0xA:
+                continue
+            parts.append(payload)
+            if b0 & 0x80:
+                return b"".join(parts).decode("utf-8", errors="replace")
+
+    def close(self):
+        try:
+            self._send_frame(0x8)
+        except Exception:
+            pass
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+
+
+class Aria2EventListener(threading.Thread):
+    """Background thread that turns aria2 WebSocket notifications into callbacks.
+
+    ``on_event(method, gid)`` is called for every download notification. ``on_connect`` is
+    called after each (re)connect so the owner can resync anything missed while offline.
+    The listener reconnects with backoff until ``stop()`` is called.
+    """
+
+    def __init__(self, port, on_event, on_connect=None, host="localhost", path="/jsonrpc", reconnect_delay=1.0):
+        super().__init__(name="aria2-events", daemon=True)
+        self.host = host
+        self.port = port
+        self.path = path
+        self.on_event = on_event
+        self.on_connect = on_connect
+        self.reconnect_delay = reconnect_delay
+        self._ws = None
+        self._stop_event = threading.Event()
+        self._connected = threading.Event()
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def wait_connected(self, timeout=None):
+        return self._connected.wait(timeout)
+
+    def stop(self):
+        self._stop_event.set()
+        ws = self._ws
+        if ws is not None:
+            ws.close()
+
+    def run(self):
+        delay = self.reconnect_delay
+        while not self._stop_event.is_set():
+            try:
+                self._ws = _WebSocket(self.host, self.port, self.path)
+                # Notifications can arrive at any time; block on reads instead of timing out
+                self._ws.sock.settimeout(None)
+            except Exception:
+                self._stop_event.wait(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+            delay = self.reconnect_delay
+            self._connected.set()
+            if self.on_connect:
+                try:
+                    self.on_connect()
+                except Exception as e:
+                    print(f"[aria2] Event resync failed: {e}")
+            try:
+                while not self._stop_event.is_set():
+                    self._dispatch(self._ws.recv_text())
+            except (OSError, ValueError):
+                pass
+            finally:
+                self._connected.clear()
+                self._ws.close()
+                self._ws = None
+
+    def _dispatch(self, text):
+        try:
+            message = json.loads(text)
+        except ValueError:
+            return
+        method = message.get("method") if isinstance(message, dict) else None
+        if method not in ARIA2_EVENTS:
+            return
+        for event in message.get("params") or []:
+            gid = event.get("gid") if isinstance(event, dict) else None
+            if gid:
+                try:
+                    self.on_event(method, gid)
+                except Exception as e:
+                    print(f"[aria2] Event handler failed for {method} {gid}: {e}")
@@ -0,0 +1,180 @@
+# Persistent JSON-RPC client for aria2
+import http.client
+import itertools
+import json
+import threading
+import time
+from . import metrics, tracing
+
+
+class Aria2RpcError(RuntimeError):
+    """aria2 answered a call with a JSON-RPC error (or an unusable response)."""
+
+    def __init__(self, message, code=None, method=None):
+        super().__init__(message)
+        self.code = code
+        self.method = method
+
+
+class Aria2RpcAuthError(Aria2RpcError):
+    """aria2 rejected the RPC secret."""
+
+
+class Aria2RpcConnectionError(Aria2RpcError):
+    """The aria2 RPC endpoint could not be reached."""
+
+
+# Errors that mean a kept-alive connection went stale and the request never reached aria2
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+class Aria2RpcClient:
+    """Keep-alive HTTP/1.1 JSON-RPC client shared by every aria2 call.
+
+    One TCP connection is reused across calls and reopened transparently when aria2
+    (or the OS) drops it. Calls are serialised with a lock so the client can be shared
+    between the GUI thread and background pollers.
+    """
+
+    def __init__(self, port=6800, secret=None, host="localhost", timeout=30):
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.timeout = timeout
+        self._conn = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/jsonrpc"
+
+    def set_port(self, port):
+        """Point the client at another port, dropping the current connection."""
+        with self._lock:
+            if port != self.port:
+                self._close_locked()
+            self.port = port
+
+    def close(self):
+        with self._lock:
+            self._close_locked()
+
+    def _close_locked(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _params(self, method, params):
+        # system.* methods take no token; aria2.* methods take it as the first parameter
+        if self.secret is not None and method.startswith("aria2."):
+            return [f"token:{self.secret}", *params]
+        return list(params)
+
+    def call(self, method, *params, timeout=None):
+        """Invoke one RPC method and return its ``result``."""
+        payload = {
+            "jsonrpc": "2.0",
+            "id": str(next(self._ids)),
+            "method": method,
+            "params": self._params(method, params),
+        }
+        start = time.perf_counter()
+        try:
+            with tracing.span(method):
+                response = self._post(payload, timeout)
+        except Aria2RpcError:
+            metrics.RPC_ERRORS.inc(method=method)
+            raise
+        finally:
+            metrics.RPC_SECONDS.observe(time.perf_counter() - start, method=method)
+        if "error" in response:
+            metrics.RPC_ERRORS.inc(method=method)
+            raise self._error(response["error"], method)
+        return response.get("result")
+
+    def multicall(self, calls, timeout=None):
+        """Run several calls in one ``system.multicall`` round trip.
+
+        ``calls`` is a sequence of ``(method, params)`` pairs. Returns one entry per call:
+        the call's result, or an ``Aria2RpcError`` instance when that call failed.
+        """
+        calls = list(calls)
+        if not calls:
+            return []
+        methods = [{"methodName": m, "params": self._params(m, p)} for m, p in calls]
+        with tracing.span("multicall", method=calls[0][0], calls=len(calls)):
+            results = self.call("system.multicall", methods, timeout=timeout)
+        out = []
+        for (method, _params), item in zip(calls, results or []):
+            if isinstance(item, list):
+                out.append(item[0] if item else None)
+            else:
+                out.append(self._error(item, method))
+        return out
+
+    def _error(self, err, method):
+        err = err if isinstance(err, dict) else {"message": str(err)}
+        message = err.get("message") or "unknown error"
+        code = err.get("code")
+        if message == "Unauthorized":
+            return Aria2RpcAuthError("aria2 RPC reachable but authentication failed; check rpc-secret", code=code, method=method)
+        return Aria2RpcError(f"aria2 RPC {method} failed: {message}", code=code, method=method)
+
+    def _connect_locked(self, timeout):
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+            return False
+        # Reused connection: adjust the timeout of the live socket for this call
+        self._conn.timeout = timeout
+        if self._conn.sock is not None:
+            try:
+                self._conn.sock.settimeout(timeout)
+            except OSError:
+                self._close_locked()
+                return self._connect_locked(timeout)
+        return True
+
+    def _post(self, payload, timeout):
+        body = json.dumps(payload).encode()
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        timeout = self.timeout if timeout is None else timeout
+        method = payload["method"]
+        with self._lock:
+            for attempt in range(2):
+                reused = self._connect_locked(timeout)
+                try:
+                    self._conn.request("POST", "/jsonrpc", body=body, headers=headers)
+                    resp = self._conn.getresponse()
+                    data = resp.read()
+                except _STALE_CONNECTION_ERRORS as e:
+                    self._close_locked()
+                    if reused and attempt == 0:
+                        continue
+                    raise Aria2RpcConnectionError(f"aria2 RPC unreachable at {self.url}: {e}", method=method) from e
+                except OSError as e:
+                    self._close_locked()
+                    raise Aria2RpcConnectionError(f"aria2 RPC unreachable at {self.url}: {e}", method=method) from e
+                if resp.will_close:
+                    self._close_locked()
+                break
+
+        try:
+            response = json.loads(data)
+        except ValueError:
+            response = None
+        if resp.status == 401:
+            raise Aria2RpcAuthError("aria2 RPC reachable but authentication failed; check rpc-secret", code=401, method=method)
+        if not isinstance(response, dict):
+            raise Aria2RpcError(f"aria2 RPC {method} failed: HTTP {resp.status}", code=resp.status, method=method)
+        return response
@@ -0,0 +1,95 @@
+# Download speed limits: rate parsing, a token-bucket throttle and sharing a global budget
+import threading
+import time
+
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_rate(text):
+    """Bytes per second from ``"500K"``, ``"2M"``, ``"1.5M"`` or ``"0"`` (aria2 style; 0 = unlimited)."""
+    value = str(text).strip().upper()
+    if value.endswith("/S"):
+        value = value[:-2]
+    if value.endswith("B"):
+        value = value[:-1]
+    unit = value[-1:] if value[-1:] in _UNITS else ""
+    number = value[:-1] if unit else value
+    try:
+        rate = float(number) * _UNITS[unit]
+    except ValueError:
+        raise ValueError(f"Invalid rate {text!r}; use bytes per second with an optional K/M/G suffix") from None
+    if rate < 0:
+        raise ValueError("A rate cannot be negative")
+    return int(rate)
+
+
+def format_rate(rate):
+    if not rate:
+        return "unlimited"
+    for unit in ("G", "M", "K"):
+        if rate >= _UNITS[unit]:
+            return f"{rate / _UNITS[unit]:.4g}{unit}/s"
+    return f"{rate}B/s"
+
+
+class TokenBucket:
+    """Blocking throttle for a byte stream; ``rate`` is bytes per second, 0 means unlimited.
+
+    Up to one second of bytes may be spent in a burst. ``set_rate`` takes effect for the next
+    ``consume`` call, so a running download can be slowed down or sped up.
+    """
+
+    def __init__(self, rate=0, clock=time.monotonic, sleep=time.sleep):
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self.rate = rate or 0
+        self._tokens = float(self.rate)
+        self._stamp = clock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate or 0
+            self._tokens = min(self._tokens, float(self.rate))
+
+    def consume(self, n):
+        """Account for ``n`` bytes, sleeping as long as needed to stay under the rate."""
+        with self._lock:
+            now = self._clock()
+            if not self.rate:
+                self._stamp = now
+                return
+            self._tokens = min(float(self.rate), self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= n
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            self._sleep(wait)
+
+
+def share_budget(budget, jobs):
+    """Per-job rates ``{job.id: bytes/s}`` (0 = unlimited) for the running ``jobs``.
+
+    With a global ``budget`` each job gets a share weighted by priority (each level doubles it),
+    capped by its own ``max_speed``; what a capped job leaves unused is shared among the rest.
+    Without a budget, jobs keep just their own limits.
+    """
+    limits = {job.id: job.max_speed or 0 for job in jobs}
+    if not budget or not jobs:
+        return limits
+    open_jobs = list(jobs)
+    remaining = budget
+    while open_jobs:
+        weights = {job.id: 2.0 ** max(-10, min(10, job.priority)) for job in open_jobs}
+        total = sum(weights.values())
+        shares = {job.id: max(1, int(remaining * weights[job.id] / total)) for job in open_jobs}
+        capped = [job for job in open_jobs if job.max_speed and job.max_speed < shares[job.id]]
+        if not capped:
+            limits.update(shares)
+            break
+        for job in capped:
+            limits[job.id] = job.max_speed
+            remaining -= job.max_speed
+            open_jobs.remove(job)
+        remaining = max(remaining, len(open_jobs))
+    return limits
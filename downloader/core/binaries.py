@@ -0,0 +1,58 @@
+# Cached resolution of external tool paths (aria2c, mega-get)
+import json
+import os
+from .utils import BINARY_CACHE_PATH
+
+# name -> path already validated in this process
+_resolved = {}
+
+
+def _load(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def cached_binary(name, find, path=None):
+    """Return the path for tool ``name``, calling ``find()`` only when the cached path is stale.
+
+    A cached entry is reused while the file still exists with the same mtime, so replacing or
+    deleting the binary triggers a fresh search. Results that are not files (e.g. a bare name
+    left for PATH lookup) are not cached.
+    """
+    if name in _resolved:
+        return _resolved[name]
+    path = os.fspath(path or BINARY_CACHE_PATH)
+    cache = _load(path)
+    entry = cache.get(name)
+    if entry:
+        try:
+            if os.stat(entry["path"]).st_mtime_ns == entry["mtime_ns"]:
+                _resolved[name] = entry["path"]
+                return entry["path"]
+        except (OSError, KeyError, TypeError):
+            pass
+    found = find()
+    if os.path.isfile(found):
+        cache[name] = {"path": found, "mtime_ns": os.stat(found).st_mtime_ns}
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(cache, f, indent=2)
+        except OSError:
+            pass
+        _resolved[name] = found
+    elif entry:
+        invalidate_binary(name, path)
+    return found
+
+
+def invalidate_binary(name, path=None):
+    """Forget the cached path for ``name`` (e.g. after installing a portable copy)."""
+    _resolved.pop(name, None)
+    path = os.fspath(path or BINARY_CACHE_PATH)
+    cache = _load(path)
+    if cache.pop(name, None) is not None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2)
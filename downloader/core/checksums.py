@@ -0,0 +1,182 @@
+# Expected digests: parsing, checksum manifests, streaming hashes and a process pool for finished files
+import bisect
+import hashlib
+import os
+import re
+import threading
+
+# Our algorithm names -> the names aria2's ``checksum`` option uses
+ALGORITHMS = {
+    "md5": "md5",
+    "sha1": "sha-1",
+    "sha224": "sha-224",
+    "sha256": "sha-256",
+    "sha384": "sha-384",
+    "sha512": "sha-512",
+}
+
+# Bare digests in manifests are recognised by length
+_BY_HEX_LENGTH = {32: "md5", 40: "sha1", 56: "sha224", 64: "sha256", 96: "sha384", 128: "sha512"}
+
+# "SHA256 (name) = hex", as written by BSD sha256 / shasum --tag
+_BSD_LINE = re.compile(r"^([A-Za-z0-9-]+) \((.+)\) = ([0-9A-Fa-f]+)$")
+
+
+class ChecksumMismatch(RuntimeError):
+    """A finished file does not have the expected digest."""
+
+
+def parse_checksum(text):
+    """Normalise ``"sha256=<hex>"`` (also ``sha-256=``, ``SHA256:``) to ``"sha256=<lower-case hex>"``.
+
+    A bare hex digest is accepted when its length identifies the algorithm.
+    """
+    text = str(text).strip()
+    algorithm, sep, digest = text.replace(":", "=", 1).partition("=")
+    if not sep:
+        algorithm, digest = _BY_HEX_LENGTH.get(len(text), ""), text
+    algorithm = algorithm.strip().lower().replace("-", "")
+    digest = digest.strip().lower()
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unsupported checksum {text!r}; use ALGO=HEX with ALGO one of {', '.join(ALGORITHMS)}")
+    if len(digest) != hashlib.new(algorithm).digest_size * 2 or any(c not in "0123456789abcdef" for c in digest):
+        raise ValueError(f"Invalid {algorithm} digest {digest!r}")
+    return f"{algorithm}={digest}"
+
+
+def split_checksum(checksum):
+    """``(algorithm, hex digest)`` of a normalised checksum."""
+    algorithm, _, digest = checksum.partition("=")
+    return algorithm, digest
+
+
+def aria2_checksum(checksum):
+    """The value of aria2's ``checksum`` option for a normalised checksum."""
+    algorithm, digest = split_checksum(checksum)
+    return f"{ALGORITHMS[algorithm]}={digest}"
+
+
+def read_manifest(path):
+    """``{file name: checksum}`` from a ``sha256sum``-style (``HEX  name``) or BSD-style
+    (``SHA256 (name) = HEX``) manifest; blank lines and ``#`` comments are skipped."""
+    checksums = {}
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            bsd = _BSD_LINE.match(line)
+            if bsd:
+                algorithm, name, digest = bsd.groups()
+                checksum = f"{algorithm}={digest}"
+            else:
+                digest, _, name = line.partition(" ")
+                name = name.strip().lstrip("*")
+                checksum = digest
+            try:
+                checksums[os.path.basename(name)] = parse_checksum(checksum)
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: {e}") from None
+    return checksums
+
+
+def hash_file(path, algorithm, block=1 << 20):
+    """Hex digest of the file at ``path``; runs in pool worker processes, so it stays top-level."""
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(block)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+class IncrementalHash:
+    """Digest of a file that is written out of order, computed while it is written.
+
+    Bytes written at the hashed frontier are hashed straight from the write buffer. Bytes
+    written ahead of it are only remembered as ranges; once the frontier reaches them they are
+    read back with ``read_at(offset, n)``, while still in the page cache. With pieces handed out
+    in order the frontier trails the writes by a few pieces, so there is no second pass over
+    the finished file.
+    """
+
+    def __init__(self, algorithm, read_at):
+        self._hash = hashlib.new(algorithm)
+        self._read_at = read_at
+        self._lock = threading.Lock()
+        self._pending = []
+        self.position = 0
+
+    def update(self, offset, data):
+        """Account for ``data`` just written at ``offset``."""
+        end = offset + len(data)
+        with self._lock:
+            if offset <= self.position < end:
+                self._hash.update(memoryview(data)[self.position - offset:])
+                self.position = end
+                self._catch_up_locked()
+            elif offset > self.position:
+                bisect.insort(self._pending, (offset, end))
+
+    def written(self, ranges):
+        """Account for ``[start, end)`` ranges already in the file (e.g. from an earlier run)."""
+        with self._lock:
+            for start, end in ranges:
+                bisect.insort(self._pending, (start, end))
+            self._catch_up_locked()
+
+    def _catch_up_locked(self):
+        while self._pending and self._pending[0][0] <= self.position:
+            _, end = self._pending.pop(0)
+            while self.position < end:
+                data = self._read_at(self.position, min(1 << 20, end - self.position))
+                if not data:
+                    raise RuntimeError(f"Could not read back bytes at {self.position} for hashing")
+                self._hash.update(data)
+                self.position += len(data)
+
+    def hexdigest(self, total):
+        """Digest of the first ``total`` bytes; anything not seen yet is read back first."""
+        self.written([(self.position, total)])
+        return self._hash.hexdigest()
+
+
+class HashPool:
+    """Hashes finished files in worker processes, so several large files use several cores.
+
+    The process pool is started on first use. ``callback(digest, error)`` runs in a pool thread
+    once the file is hashed.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, path, algorithm, callback):
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            future = self._executor.submit(hash_file, path, algorithm)
+
+        def _done(f):
+            try:
+                digest, error = f.result(), None
+            except Exception as e:
+                digest, error = None, e
+            try:
+                callback(digest, error)
+            except Exception as e:
+                print(f"[checksum] Verification callback failed: {e}")
+
+        future.add_done_callback(_done)
+        return future
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -59,3 +59,129 @@ class Config:
     def get_mega(self):
         return self.data.get("mega", {})
 
+
+    def set_persistence(self, *, mode=None, compact_bytes=None):
+        section = self.data.setdefault("persistence", {})
+        if mode is not None:
+            if mode not in ("json", "journal", "sqlite"):
+                raise ValueError("persistence mode must be 'json', 'journal' or 'sqlite'")
+            section["mode"] = mode
+        if compact_bytes is not None:
+            if not isinstance(compact_bytes, int) or compact_bytes < 1:
+                raise ValueError("compact_bytes must be a positive integer")
+            section["compact_bytes"] = compact_bytes
+        self.save()
+
+    def get_persistence(self):
+        return self.data.get("persistence", {})
+
+    def set_precheck(self, *, mode=None, workers=None, per_host=None, timeout=None, deadline=None):
+        section = self.data.setdefault("precheck", {})
+        if mode is not None:
+            if mode not in ("blocking", "background", "off"):
+                raise ValueError("precheck mode must be 'blocking', 'background' or 'off'")
+            section["mode"] = mode
+        for key, value in (("workers", workers), ("per_host", per_host)):
+            if value is not None:
+                if not isinstance(value, int) or value < 1:
+                    raise ValueError(f"{key} must be a positive integer")
+                section[key] = value
+        for key, value in (("timeout", timeout), ("deadline", deadline)):
+            if value is not None:
+                if not isinstance(value, (int, float)) or value <= 0:
+                    raise ValueError(f"{key} must be a positive number of seconds")
+                section[key] = value
+        self.save()
+
+    def get_precheck(self):
+        return self.data.get("precheck", {})
+
+    def set_scheduler(self, *, max_active=None, per_host=None, per_backend=None, policy=None):
+        """Limits are positive integers, or 0 to remove them; ``per_backend`` maps backend name to a cap."""
+        from .scheduler import POLICIES
+        section = self.data.setdefault("scheduler", {})
+        for key, value in (("max_active", max_active), ("per_host", per_host)):
+            if value is not None:
+                if not isinstance(value, int) or value < 0:
+                    raise ValueError(f"{key} must be a non-negative integer")
+                if value:
+                    section[key] = value
+                else:
+                    section.pop(key, None)
+        if per_backend is not None:
+            caps = section.setdefault("per_backend", {})
+            for name, value in per_backend.items():
+                if name not in ("aria2", "mega"):
+                    raise ValueError("per_backend keys must be 'aria2' or 'mega'")
+                if not isinstance(value, int) or value < 0:
+                    raise ValueError(f"per_backend {name} must be a non-negative integer")
+                if value:
+                    caps[name] = value
+                else:
+                    caps.pop(name, None)
+            if not caps:
+                section.pop("per_backend")
+        if policy is not None:
+            if policy not in POLICIES:
+                raise ValueError(f"policy must be one of: {', '.join(POLICIES)}")
+            section["policy"] = policy
+        self.save()
+
+    def get_scheduler(self):
+        return self.data.get("scheduler", {})
+
+    def set_bandwidth(self, *, global_limit=None):
+        """``global_limit`` is the overall download limit in bytes per second; 0 removes it."""
+        section = self.data.setdefault("bandwidth", {})
+        if global_limit is not None:
+            if not isinstance(global_limit, int) or global_limit < 0:
+                raise ValueError("global limit must be a non-negative number of bytes per second")
+            if global_limit:
+                section["global"] = global_limit
+            else:
+                section.pop("global", None)
+        self.save()
+
+    def get_bandwidth(self):
+        return self.data.get("bandwidth", {})
+
+    def set_dedup(self, *, enabled=None, methods=None):
+        """``methods``: how a known file is placed for a new job, tried in order (see ``LINK_METHODS``)."""
+        from .content_index import LINK_METHODS
+        section = self.data.setdefault("dedup", {})
+        if enabled is not None:
+            section["enabled"] = bool(enabled)
+        if methods is not None:
+            unknown = [m for m in methods if m not in LINK_METHODS]
+            if unknown or not methods:
+                raise ValueError(f"methods must be some of: {', '.join(LINK_METHODS)}")
+            section["methods"] = list(methods)
+        self.save()
+
+    def get_dedup(self):
+        return self.data.get("dedup", {})
+
+    def set_checksum(self, *, retries=None, workers=None):
+        """``retries``: downloads after a checksum mismatch; ``workers``: hashing processes (0 = one per CPU)."""
+        section = self.data.setdefault("checksum", {})
+        if retries is not None:
+            if not isinstance(retries, int) or retries < 0:
+                raise ValueError("retries must be a non-negative integer")
+            section["retries"] = retries
+        if workers is not None:
+            if not isinstance(workers, int) or workers < 0:
+                raise ValueError("workers must be a non-negative integer")
+            if workers:
+                section["workers"] = workers
+            else:
+                section.pop("workers", None)
+        self.save()
+
+    def get_checksum(self):
+        return self.data.get("checksum", {})
+
+    def get_host_tuning(self):
+        return self.data.get("host_tuning", {})
+
+    def get_metadata_cache(self):
+        return self.data.get("metadata_cache", {})
@@ -0,0 +1,164 @@
+# Index of finished downloads by content (size + ETag, SHA-256) so known files are not fetched again
+import json
+import os
+import shutil
+import threading
+from .utils import CONTENT_INDEX_PATH
+
+# Ways to place a copy of an indexed file, in the default order of preference
+LINK_METHODS = ("hardlink", "reflink", "copy")
+
+# Linux FICLONE ioctl: share the source's extents copy-on-write (btrfs, XFS, ...)
+_FICLONE = 0x40049409
+
+
+def strong_etag(etag):
+    """``etag`` if it identifies exact bytes; weak (``W/``) and missing ETags give None."""
+    if not etag or etag.startswith(("W/", "w/")):
+        return None
+    return etag
+
+
+def _reflink(src, dest):
+    import fcntl
+    with open(src, "rb") as s, open(dest, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dest)
+            raise
+
+
+def place_copy(src, dest, methods=LINK_METHODS):
+    """Make ``dest`` hold the content of ``src`` with the first method that works; returns its name."""
+    error = None
+    for method in methods:
+        try:
+            if method == "hardlink":
+                os.link(src, dest)
+            elif method == "reflink":
+                _reflink(src, dest)
+            elif method == "copy":
+                shutil.copyfile(src, dest)
+            else:
+                raise ValueError(f"Unknown link method: {method}")
+            return method
+        except (OSError, ImportError) as e:
+            # Different filesystems, no reflink support, no fcntl on this platform, ...
+            error = e
+    raise error or RuntimeError("No link method configured")
+
+
+class ContentIndex:
+    """Finished files keyed by content: ``(size, strong ETag)`` and SHA-256 when it is known.
+
+    An entry also keeps the file's size and mtime when indexed; a file that has since been
+    changed or deleted no longer matches and its entry is dropped. Changes are kept in memory
+    until ``flush()`` writes the JSON file.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.fspath(path or CONTENT_INDEX_PATH)
+        self._lock = threading.Lock()
+        self._files = None
+        self._by_etag = {}
+        self._by_hash = {}
+        self._dirty = False
+
+    def _load_locked(self):
+        if self._files is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._files = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._files = {}
+            for path, entry in self._files.items():
+                self._link_locked(path, entry)
+        return self._files
+
+    def _link_locked(self, path, entry):
+        if entry.get("etag"):
+            self._by_etag.setdefault(f"{entry['size']}:{entry['etag']}", []).append(path)
+        if entry.get("sha256"):
+            self._by_hash.setdefault(entry["sha256"], []).append(path)
+
+    def _unlink_locked(self, path):
+        entry = self._files.pop(path, None)
+        if entry is None:
+            return
+        for index, key in ((self._by_etag, f"{entry['size']}:{entry.get('etag')}"), (self._by_hash, entry.get("sha256"))):
+            paths = index.get(key)
+            if paths and path in paths:
+                paths.remove(path)
+                if not paths:
+                    del index[key]
+        self._dirty = True
+
+    def add(self, path, etag=None, sha256=None, size=None):
+        """Index the finished file at ``path``; without a strong ETag or a hash it cannot be matched.
+
+        With ``size`` (the size the server reported) a file of any other size is not indexed.
+        """
+        path = os.path.abspath(path)
+        etag = strong_etag(etag)
+        sha256 = sha256.lower() if sha256 else None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        if size is not None and st.st_size != size:
+            return
+        with self._lock:
+            files = self._load_locked()
+            previous = files.get(path)
+            if previous is not None:
+                etag = etag or previous.get("etag")
+                sha256 = sha256 or previous.get("sha256")
+                self._unlink_locked(path)
+            if not etag and not sha256:
+                return
+            entry = {"size": st.st_size, "mtime": st.st_mtime, "etag": etag, "sha256": sha256}
+            files[path] = entry
+            self._link_locked(path, entry)
+            self._dirty = True
+
+    def lookup(self, size=None, etag=None, sha256=None):
+        """Path of an indexed file with this content, or None.
+
+        Matches on ``sha256`` or on ``size`` plus a strong ``etag``; entries whose file was
+        changed or removed since it was indexed are dropped.
+        """
+        etag = strong_etag(etag)
+        keys = []
+        if sha256:
+            keys.append((self._by_hash, sha256.lower()))
+        if size is not None and etag:
+            keys.append((self._by_etag, f"{size}:{etag}"))
+        if not keys:
+            return None
+        with self._lock:
+            self._load_locked()
+            for index, key in keys:
+                for path in list(index.get(key, ())):
+                    entry = self._files[path]
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        st = None
+                    if st is None or st.st_size != entry["size"] or st.st_mtime != entry["mtime"]:
+                        self._unlink_locked(path)
+                        continue
+                    if size is None or st.st_size == size:
+                        return path
+        return None
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._files, f)
+            os.replace(tmp, self.path)
@@ -0,0 +1,214 @@
+# Long-running downloader daemon and its thin client over a local Unix socket
+import io
+import json
+import os
+import socket
+import threading
+from . import metrics, tracing
+from .utils import DAEMON_SOCKET_PATH, echo, output_to
+
+
+class DaemonUnavailable(ConnectionError):
+    """No daemon is listening; callers fall back to running the command in-process."""
+
+
+def run_command(manager, command, params, out=None):
+    """Run one CLI-level manager command (add/pause/resume/remove/status/list/schedule/limit/tune/metrics).
+
+    Its output goes to ``out`` (stdout if None); output of other threads is not captured.
+    """
+    with output_to(out):
+        _run_command(manager, command, params)
+
+
+def _run_command(manager, command, params):
+    if command == "add":
+        limits = {"priority": params.get("priority") or 0, "max_speed": params.get("max_speed")}
+        mirrors = params.get("mirrors") or {}
+        checksums = params.get("checksums") or {}
+        if params.get("urls") is not None:
+            manager.add_many(params["urls"], backend=params.get("backend"), mirrors=mirrors, checksums=checksums, **limits)
+        else:
+            manager.add(params["url"], backend=params.get("backend"), mirrors=mirrors.get(params["url"]),
+                        checksum=checksums.get(params["url"]), **limits)
+    elif command in ("pause", "resume", "remove"):
+        getattr(manager, command)(params["id"])
+    elif command == "status":
+        manager.status(params.get("id"))
+    elif command == "list":
+        # One batched aria2 query serves both the refresh and the printout
+        jobs = manager.find_jobs(status=params["status"]) if params.get("status") else None
+        aria2_statuses = manager.refresh(jobs)
+        manager.status(aria2_statuses=aria2_statuses, jobs=jobs)
+    elif command == "tune":
+        manager.tune(params.get("host"), params.get("connections"), params.get("unpin", False))
+    elif command == "limit":
+        manager.set_limit(params["target"], params["rate"])
+    elif command == "schedule":
+        # Refreshing frees the slots of finished jobs and starts whatever fits
+        manager.refresh()
+        manager.show_schedule(params.get("limit") or 20)
+    elif command == "metrics":
+        manager.collect_metrics()
+        echo(metrics.render(), end="")
+    else:
+        raise ValueError(f"Unknown command: {command}")
+
+
+def _socket_path(path):
+    return os.fspath(path or DAEMON_SOCKET_PATH)
+
+
+def send_command(command, params=None, path=None, timeout=None):
+    """Ask a running daemon to run ``command``; returns ``{'ok': bool, 'output': str, 'error': str}``.
+
+    Raises ``DaemonUnavailable`` when no daemon is listening on ``path``.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+        raise DaemonUnavailable("Unix sockets are not supported on this platform")
+    with tracing.span("daemon request", command=command):
+        line = _request(command, params, path, timeout)
+    if not line:
+        raise RuntimeError("Downloader daemon closed the connection without replying")
+    return json.loads(line)
+
+
+def _request(command, params, path, timeout):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(_socket_path(path))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise DaemonUnavailable(f"No downloader daemon at {_socket_path(path)}") from e
+        request = json.dumps({"command": command, "params": params or {}}) + "\n"
+        sock.sendall(request.encode("utf-8"))
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    finally:
+        sock.close()
+    return line
+
+
+class DownloaderDaemon:
+    """Keeps one DownloadManager (RPC connection, job registry, caches) alive between CLI calls.
+
+    Each client connection carries one JSON request line and gets one JSON reply line holding
+    the command's printed output. Commands run one at a time; each writes to its own reply buffer.
+    """
+
+    def __init__(self, manager, path=None, metrics_port=None):
+        if not hasattr(socket, "AF_UNIX"):
+            raise RuntimeError("The downloader daemon needs Unix domain sockets, which this platform lacks")
+        self.manager = manager
+        self.path = _socket_path(path)
+        # With a port, metrics are also served over HTTP at http://localhost:<port>/metrics
+        self.metrics_port = metrics_port
+        self._command_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._sock = None
+        self._metrics_server = None
+
+    def _bind(self):
+        if os.path.exists(self.path):
+            try:
+                send_command("ping", path=self.path, timeout=2)
+            except (DaemonUnavailable, OSError, ValueError, RuntimeError):
+                # Left behind by a daemon that did not exit cleanly
+                os.remove(self.path)
+            else:
+                raise RuntimeError(f"A downloader daemon is already running at {self.path}")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Created owner-only: a chmod after bind() would leave a window for other local users to connect
+        old_umask = os.umask(0o177)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        sock.listen(64)
+        sock.settimeout(0.5)
+        self._sock = sock
+
+    def serve_forever(self, ready=None):
+        """Accept clients until ``stop()``; ``ready`` (an Event) is set once the socket is listening."""
+        self._bind()
+        if self.metrics_port is not None:
+            self._start_metrics_server()
+        if ready is not None:
+            ready.set()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    conn, _ = self._sock.accept()
+                except socket.timeout:
+                    continue
+                except OSError:
+                    break
+                threading.Thread(target=self._serve_client, args=(conn,), name="daemon-client", daemon=True).start()
+        finally:
+            self._sock.close()
+            if self._metrics_server is not None:
+                self._metrics_server.shutdown()
+                self._metrics_server.server_close()
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _start_metrics_server(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        daemon = self
+
+        class _MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                with daemon._command_lock:
+                    daemon.manager.collect_metrics()
+                    body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._metrics_server = ThreadingHTTPServer(("localhost", self.metrics_port), _MetricsHandler)
+        self._metrics_server.daemon_threads = True
+        self.metrics_port = self._metrics_server.server_address[1]
+        threading.Thread(target=self._metrics_server.serve_forever, name="daemon-metrics", daemon=True).start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _serve_client(self, conn):
+        with conn:
+            conn.settimeout(None)
+            with conn.makefile("rb") as f:
+                line = f.readline()
+            try:
+                request = json.loads(line)
+                reply = self.handle(request.get("command"), request.get("params") or {})
+            except ValueError as e:
+                reply = {"ok": False, "output": "", "error": f"Bad request: {e}"}
+            try:
+                conn.sendall((json.dumps(reply) + "\n").encode("utf-8"))
+            except OSError:
+                pass
+
+    def handle(self, command, params):
+        if command == "ping":
+            return {"ok": True, "output": "", "pid": os.getpid()}
+        if command == "shutdown":
+            self.stop()
+            return {"ok": True, "output": "Downloader daemon stopping.\n"}
+        out = io.StringIO()
+        with self._command_lock, tracing.span("command", command=command):
+            try:
+                run_command(self.manager, command, params, out)
+            except Exception as e:
+                return {"ok": False, "output": out.getvalue(), "error": str(e)}
+        return {"ok": True, "output": out.getvalue()}
@@ -0,0 +1,154 @@
+# Per-host connection tuning learned from observed download speeds
+import json
+import os
+import threading
+import time
+import urllib.parse
+from .utils import HOST_TUNING_PATH
+
+# Error text that means the server is limiting us rather than failing
+_THROTTLE_MARKERS = ("429", "503", "too many", "throttl", "rate limit")
+
+
+def host_of(url):
+    return (urllib.parse.urlsplit(url).hostname or "").lower() or url
+
+
+class HostTuning:
+    """Connection counts per host (aria2 ``split`` / ``max-connection-per-server``, and the
+    segmented engine's connections), tuned from observed per-download speeds.
+
+    Speeds are averaged (EWMA) per connection count. Once the current count has ``min_samples``
+    samples and ``cooldown`` seconds have passed since the last change, the host moves to the
+    best count seen so far, or tries double the current one if that has not been measured yet.
+    A throttling error (HTTP 429/503, "too many connections") halves the count at once. Counts
+    stay within ``[min_connections, max_connections]``; a pinned count is never changed.
+    Profiles are kept in memory until ``flush()`` writes the JSON file.
+    """
+
+    def __init__(self, path=None, min_connections=1, max_connections=16, initial=4, min_samples=3,
+                 cooldown=60, alpha=0.3, clock=time.time):
+        self.path = os.fspath(path or HOST_TUNING_PATH)
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.initial = initial
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._profiles = None
+        self._dirty = False
+
+    def _load_locked(self):
+        if self._profiles is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._profiles = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._profiles = {}
+        return self._profiles
+
+    def _clamp(self, n):
+        return max(self.min_connections, min(self.max_connections, int(n)))
+
+    def _profile_locked(self, host):
+        profiles = self._load_locked()
+        profile = profiles.get(host)
+        if profile is None:
+            profile = profiles[host] = {"connections": self._clamp(self.initial), "pinned": False, "stats": {}, "changed_at": 0}
+        return profile
+
+    def connections(self, url):
+        """Connection count to use for a new download of ``url``."""
+        host = host_of(url)
+        with self._lock:
+            profile = self._load_locked().get(host)
+            if profile is None:
+                return self._clamp(self.initial)
+            return profile["connections"] if profile.get("pinned") else self._clamp(profile["connections"])
+
+    def observe(self, url, connections, speed):
+        """Record one speed sample (bytes/s) of a download that uses ``connections``.
+
+        Returns the host's new connection count when this sample changed it, else None.
+        """
+        if not connections or speed <= 0:
+            return None
+        host = host_of(url)
+        with self._lock:
+            profile = self._profile_locked(host)
+            stat = profile["stats"].setdefault(str(connections), {"speed": float(speed), "samples": 0})
+            if stat["samples"]:
+                stat["speed"] += self.alpha * (speed - stat["speed"])
+            stat["samples"] += 1
+            self._dirty = True
+            return self._retune_locked(profile)
+
+    def throttled(self, url):
+        """The server pushed back: halve the host's connection count. Returns the new count or None."""
+        host = host_of(url)
+        with self._lock:
+            profile = self._profile_locked(host)
+            current = profile["connections"]
+            if profile.get("pinned") or current <= self.min_connections:
+                return None
+            # Remember that this count was too many so the climb does not come straight back
+            stat = profile["stats"].setdefault(str(current), {"speed": 0.0, "samples": 0})
+            stat["speed"] /= 2
+            stat["samples"] = max(stat["samples"], self.min_samples)
+            return self._set_locked(profile, self._clamp(current // 2))
+
+    def _retune_locked(self, profile):
+        if profile.get("pinned"):
+            return None
+        current = profile["connections"]
+        stats = profile["stats"]
+        stat = stats.get(str(current))
+        if not stat or stat["samples"] < self.min_samples or self._clock() - profile["changed_at"] < self.cooldown:
+            return None
+        measured = {int(n): s["speed"] for n, s in stats.items() if s["samples"] >= self.min_samples}
+        best = max(measured, key=measured.get)
+        if best != current:
+            return self._set_locked(profile, self._clamp(best))
+        up = self._clamp(current * 2)
+        if up != current and str(up) not in stats:
+            return self._set_locked(profile, up)
+        return None
+
+    def _set_locked(self, profile, connections):
+        profile["connections"] = connections
+        profile["changed_at"] = self._clock()
+        self._dirty = True
+        return connections
+
+    def pin(self, host, connections):
+        """Fix ``host`` at ``connections`` (the guard rails do not apply); None unpins it."""
+        if connections is not None and not 1 <= int(connections) <= 16:
+            raise ValueError("aria2 accepts 1 to 16 connections per server")
+        with self._lock:
+            profile = self._profile_locked(host.lower())
+            if connections is None:
+                profile["pinned"] = False
+            else:
+                profile["pinned"] = True
+                profile["connections"] = int(connections)
+            self._dirty = True
+
+    def is_throttle_error(self, message):
+        message = (message or "").lower()
+        return any(marker in message for marker in _THROTTLE_MARKERS)
+
+    def profiles(self):
+        with self._lock:
+            return json.loads(json.dumps(self._load_locked()))
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._profiles, f)
+            os.replace(tmp, self.path)
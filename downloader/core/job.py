@@ -0,0 +1,139 @@
+# Compact job record shared by the manager, persistence and GUI
+import enum
+import sys
+
+# gid recorded for jobs finished by the Python direct-download fallback
+DIRECT_DOWNLOAD_GID = 'direct-download'
+
+
+class JobStatus(str, enum.Enum):
+    QUEUED = 'queued'
+    STARTED = 'started'
+    PAUSED = 'paused'
+    COMPLETED = 'completed'
+    ERROR = 'error'
+    REMOVED = 'removed'
+
+    def __str__(self):
+        return self.value
+
+
+class Backend(str, enum.Enum):
+    ARIA2 = 'aria2'
+    MEGA = 'mega'
+
+    def __str__(self):
+        return self.value
+
+    @classmethod
+    def from_name(cls, name):
+        """Map stored/user-supplied names ('Aria2Backend', 'aria2', 'MegaBackend', ...) to a member."""
+        if isinstance(name, cls):
+            return name
+        name = str(name or '').lower()
+        if name.startswith('aria2'):
+            return cls.ARIA2
+        if name.startswith('mega'):
+            return cls.MEGA
+        raise ValueError(f"Unknown backend: {name}")
+
+
+def _coerce(enum_cls, value):
+    # Unknown values (e.g. written by a newer version) are kept as plain strings
+    try:
+        return enum_cls(value)
+    except ValueError:
+        return value
+
+
+class Job:
+    """One download. ``__slots__`` keeps 100k-job queues small; status and backend are enums."""
+
+    __slots__ = ('id', 'url', 'backend', 'status', 'pid', 'gid', 'extra')
+
+    # Keys written by to_dict() in this order; anything else round-trips through ``extra``
+    FIELDS = ('id', 'url', 'backend', 'status', 'pid', 'gid')
+
+    def __init__(self, id, url, backend, status=JobStatus.QUEUED, pid=None, gid=None, extra=None):
+        self.id = id
+        self.url = sys.intern(url)
+        self.backend = backend
+        self.status = status
+        self.pid = pid
+        self.gid = gid
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, data):
+        extra = {k: v for k, v in data.items() if k not in cls.FIELDS} or None
+        backend = data.get('backend')
+        try:
+            backend = Backend.from_name(backend)
+        except ValueError:
+            pass
+        return cls(
+            data['id'],
+            data.get('url') or '',
+            backend,
+            _coerce(JobStatus, data.get('status', 'queued')),
+            data.get('pid'),
+            data.get('gid'),
+            extra,
+        )
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'url': self.url,
+            'backend': str(self.backend),
+            'status': str(self.status),
+            'pid': self.pid,
+            'gid': self.gid,
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @property
+    def priority(self):
+        """Scheduling priority (higher starts first); kept in ``extra`` so stores need no new column."""
+        return (self.extra or {}).get('priority', 0)
+
+    @property
+    def options(self):
+        """Backend options given at add time, applied when the scheduler starts the job."""
+        return (self.extra or {}).get('options')
+
+    @property
+    def max_speed(self):
+        """This job's own speed limit in bytes per second, or None for no limit of its own."""
+        return (self.extra or {}).get('max_speed')
+
+    @property
+    def mirrors(self):
+        """Every URL serving this file (``url`` included), fastest first, or None for a single source."""
+        return (self.extra or {}).get('mirrors')
+
+    @property
+    def checksum(self):
+        """Expected digest of the finished file (``"sha256=<hex>"``), or None."""
+        return (self.extra or {}).get('checksum')
+
+    @property
+    def is_direct(self):
+        return self.gid == DIRECT_DOWNLOAD_GID
+
+    @property
+    def aria2_gid(self):
+        """The aria2 RPC GID tracking this job, or None for process/direct jobs."""
+        if self.backend is Backend.ARIA2 and self.gid and self.gid != DIRECT_DOWNLOAD_GID:
+            return self.gid
+        return None
+
+    def __repr__(self):
+        return f"Job(id={self.id!r}, url={self.url!r}, backend={str(self.backend)!r}, status={str(self.status)!r})"
+
+
+def as_record(job):
+    """Persisted (dict) form of a Job; dicts pass through unchanged."""
+    return job.to_dict() if isinstance(job, Job) else job
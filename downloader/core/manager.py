@@ -1,25 +1,303 @@
 # Download manager: handles queue, state, and operations
 
-from .aria2_backend import Aria2Backend, DEFAULT_RPC_SECRET
-from .mega_backend import MegaBackend
-from .persistence import Persistence
+from . import metrics, tracing
+from .persistence import open_persistence
+from .precheck import PrecheckPool
+from .metadata_cache import MetadataCache
+from .registry import JobRegistry
+from .scheduler import Scheduler
+from .bandwidth import TokenBucket, share_budget, format_rate
+from .host_tuning import HostTuning, host_of
+from .mirrors import MirrorStats, rank_mirrors
+from .content_index import ContentIndex, LINK_METHODS, place_copy, strong_etag
+from .checksums import HashPool, aria2_checksum, parse_checksum, split_checksum
+from .job import Job, JobStatus, Backend, DIRECT_DOWNLOAD_GID
 from .config import Config
-from .utils import ensure_download_dir
+from .utils import echo, ensure_download_dir, SCHEDULER_LOG_PATH
 import re
 import os
+import shutil
+import urllib.parse
+import atexit
+import json
+import time
+import threading
+
+# aria2 tellStatus states mapped onto job statuses
+ARIA2_STATUS_MAP = {
+    'active': JobStatus.STARTED,
+    'waiting': JobStatus.QUEUED,
+    'paused': JobStatus.PAUSED,
+    'complete': JobStatus.COMPLETED,
+    'error': JobStatus.ERROR,
+    'removed': JobStatus.REMOVED,
+}
+
+# aria2 WebSocket notifications mapped onto job statuses
+ARIA2_EVENT_STATUS_MAP = {
+    'aria2.onDownloadStart': JobStatus.STARTED,
+    'aria2.onDownloadPause': JobStatus.PAUSED,
+    'aria2.onDownloadStop': JobStatus.REMOVED,
+    'aria2.onDownloadComplete': JobStatus.COMPLETED,
+    'aria2.onBtDownloadComplete': JobStatus.COMPLETED,
+    'aria2.onDownloadError': JobStatus.ERROR,
+}
+
+# aria2 errorCode for "checksum validation failed"
+ARIA2_CHECKSUM_ERROR = '32'
+
+def _job_extra(options, priority, max_speed=None, mirrors=None, checksum=None):
+    # Per-job settings the scheduler needs when it starts a held job later
+    extra = {}
+    if options:
+        extra['options'] = options
+    if priority:
+        extra['priority'] = priority
+    if max_speed:
+        extra['max_speed'] = max_speed
+    if mirrors:
+        extra['mirrors'] = mirrors
+    if checksum:
+        extra['checksum'] = parse_checksum(checksum)
+    return extra or None
+
+
+def _free_path(directory, filename, keep=None):
+    """``directory/filename``, or ``name_N`` when that is taken by a file other than ``keep``."""
+    base, ext = os.path.splitext(filename)
+    n = 0
+    while True:
+        path = os.path.abspath(os.path.join(directory, f"{base}_{n}{ext}" if n else filename))
+        if path == keep or not os.path.exists(path):
+            return path
+        n += 1
+
+
+def _preempted(job):
+    """True for an aria2 job the scheduler paused to make room; it is queued again, not user-paused."""
+    return job.status == JobStatus.QUEUED and bool((job.extra or {}).get('preempted'))
+
 
 class DownloadManager:
     def __init__(self, aria2_direct_fallback=None, config: Config | None = None):
         self.config = config or Config()
-        aria2_cfg = self.config.get_aria2()
-        rpc_secret = aria2_cfg.get("rpc_secret", DEFAULT_RPC_SECRET)
-        rpc_port = aria2_cfg.get("rpc_port", 6800)
-        self.aria2 = Aria2Backend(rpc_secret=rpc_secret, rpc_port=rpc_port, allow_direct_fallback=aria2_direct_fallback)
-        self.mega = MegaBackend()
-        self.persistence = Persistence()
+        self.aria2_direct_fallback = aria2_direct_fallback
+        # Backends (and their subprocess/network imports) are built on first use
+        self._aria2 = None
+        self._mega = None
+        persistence_cfg = dict(self.config.get_persistence())
+        self.persistence = open_persistence(persistence_cfg.pop("mode", None), **persistence_cfg)
+        cache_cfg = self.config.get_metadata_cache()
+        self.metadata = MetadataCache(ttl=cache_cfg.get("ttl", 3600), max_entries=cache_cfg.get("max_entries", 10000))
+        # Background prechecks may still be adding entries when a CLI command returns
+        atexit.register(self.metadata.flush)
+        tuning_cfg = dict(self.config.get_host_tuning())
+        # Apply a host's new connection count to its running aria2 jobs too (aria2 restarts them)
+        self.retune_running = tuning_cfg.pop("retune_running", True)
+        self.host_tuning = HostTuning(**tuning_cfg)
+        atexit.register(self.host_tuning.flush)
+        # aria2 gids already counted as throttled, so one error halves a host only once
+        self._throttle_seen = set()
+        # Per-mirror latency/throughput used to order a job's mirrors when it is added
+        self.mirror_stats = MirrorStats()
+        atexit.register(self.mirror_stats.flush)
+        dedup_cfg = self.config.get_dedup()
+        # Jobs whose content is already on disk are completed from it instead of downloaded
+        self.dedup = dedup_cfg.get("enabled", True)
+        self.dedup_methods = tuple(dedup_cfg.get("methods", LINK_METHODS))
+        self.content_index = ContentIndex()
+        atexit.register(self.content_index.flush)
+        checksum_cfg = self.config.get_checksum()
+        # A download that fails its checksum is fetched again this many times before it is an error
+        self.checksum_retries = checksum_cfg.get("retries", 1)
+        # Finished files of process-based jobs (Mega, standalone aria2c) are hashed here
+        self.hash_pool = HashPool(checksum_cfg.get("workers"))
+        precheck_cfg = self.config.get_precheck()
+        # 'blocking' checks before queueing, 'background' after, 'off' leaves it to aria2
+        self.precheck_mode = precheck_cfg.get("mode", "blocking")
+        self.precheck_deadline = precheck_cfg.get("deadline", 30)
+        self.prechecks = PrecheckPool(
+            workers=precheck_cfg.get("workers", 8),
+            per_host=precheck_cfg.get("per_host", 2),
+            timeout=precheck_cfg.get("timeout", 5),
+            cache=self.metadata,
+        )
+        sched_cfg = self.config.get_scheduler()
+        # Without limits (the default) jobs start as soon as they are added
+        self.scheduler = Scheduler(
+            max_active=sched_cfg.get("max_active"),
+            per_host=sched_cfg.get("per_host"),
+            per_backend=sched_cfg.get("per_backend"),
+            policy=sched_cfg.get("policy", "fifo"),
+            size_of=self._known_size,
+            can_preempt=lambda job: job.aria2_gid is not None,
+            log_path=SCHEDULER_LOG_PATH,
+        )
+        self._schedule_lock = threading.RLock()
+        # Overall download limit (bytes/s, 0 = none), shared among running jobs by priority
+        self.bandwidth_limit = self.config.get_bandwidth().get("global", 0)
+        # job id -> TokenBucket throttling its direct download
+        self._throttles = {}
+        # Limits last sent to aria2: gid -> bytes/s, plus the global one
+        self._applied_limits = {}
+        self._applied_global = None
+        # Loaded on first use so point queries against an indexed store never read the whole state
+        self._queue = None
+        self._history = None
+        # Guards queue mutations coming from the aria2 event listener thread
+        self._lock = threading.RLock()
+        self._events = None
+        self._events_resync = False
+        # job id -> latest aria2-style status of a background direct download
+        self.direct_progress = {}
+
+    @property
+    def aria2(self):
+        if self._aria2 is None:
+            from .aria2_backend import Aria2Backend, DEFAULT_RPC_SECRET
+            aria2_cfg = self.config.get_aria2()
+            self._aria2 = Aria2Backend(
+                rpc_secret=aria2_cfg.get("rpc_secret", DEFAULT_RPC_SECRET),
+                rpc_port=aria2_cfg.get("rpc_port", 6800),
+                allow_direct_fallback=self.aria2_direct_fallback,
+            )
+            self._aria2.metadata = self.metadata
+            self._aria2.host_tuning = self.host_tuning
+            self._aria2.mirror_stats = self.mirror_stats
+            self._aria2.content_index = self.content_index
+        return self._aria2
+
+    @property
+    def mega(self):
+        if self._mega is None:
+            from .mega_backend import MegaBackend
+            self._mega = MegaBackend()
+        return self._mega
+
+    def _load_state(self):
         data = self.persistence.load()
-        self.queue = data.get('queue', [])
-        self.history = data.get('history', [])
+        if self._queue is None:
+            self._queue = JobRegistry(map(Job.from_dict, data.get('queue', [])))
+        if self._history is None:
+            self._history = [Job.from_dict(j) for j in data.get('history', [])]
+
+    @property
+    def queue(self):
+        if self._queue is None:
+            self._load_state()
+        return self._queue
+
+    @queue.setter
+    def queue(self, value):
+        if not isinstance(value, JobRegistry):
+            value = JobRegistry(j if isinstance(j, Job) else Job.from_dict(j) for j in value)
+        self._queue = value
+
+    @property
+    def history(self):
+        if self._history is None:
+            self._load_state()
+        return self._history
+
+    @history.setter
+    def history(self, value):
+        self._history = [j if isinstance(j, Job) else Job.from_dict(j) for j in value]
+
+    def _point_queries(self):
+        # Indexed stores can answer lookups directly until something needs the whole queue
+        return self._queue is None and not self.persistence.needs_snapshot
+
+    def get_job(self, download_id):
+        if self._point_queries():
+            record = self.persistence.get_job(download_id)
+            return Job.from_dict(record) if record else None
+        return self.queue.get(download_id)
+
+    def find_jobs(self, **filters):
+        """Queued jobs whose fields equal all of ``filters``, e.g. ``find_jobs(status='started')``."""
+        if self._point_queries():
+            return [Job.from_dict(j) for j in self.persistence.find_jobs(**filters)]
+        return self.queue.find(**filters)
+
+    def _update(self, job, **fields):
+        # Route field changes through the registry so its indexes follow every transition
+        if self._queue is not None:
+            self._queue.update(job, **fields)
+        else:
+            for field, value in fields.items():
+                setattr(job, field, value)
+
+    @property
+    def events_active(self):
+        """True while aria2 WebSocket notifications are keeping job statuses current."""
+        return self._events is not None and self._events.connected
+
+    def start_event_listener(self, timeout=2.0):
+        """Subscribe to aria2 download notifications over WebSocket.
+
+        Returns False (and keeps relying on polling) when the WebSocket endpoint is not reachable.
+        """
+        from .aria2_events import Aria2EventListener
+        if self._events is not None and self._events.is_alive():
+            return self._events.wait_connected(timeout)
+        self._events = Aria2EventListener(self.aria2.rpc_port, self._on_aria2_event, on_connect=self._on_events_connected)
+        self._events.start()
+        if self._events.wait_connected(timeout):
+            return True
+        self.stop_event_listener()
+        echo("[aria2] WebSocket notifications unavailable; falling back to polling.")
+        return False
+
+    def stop_event_listener(self):
+        if self._events is not None:
+            self._events.stop()
+            self._events = None
+
+    def _on_events_connected(self):
+        # Anything that happened while disconnected is only visible by polling once
+        self._events_resync = True
+
+    def _on_aria2_event(self, method, gid):
+        new_status = ARIA2_EVENT_STATUS_MAP.get(method)
+        if not new_status:
+            return
+        with self._lock:
+            job = next((j for j in self.find_jobs(gid=gid) if j.aria2_gid), None)
+            if not job or job.status == new_status or _preempted(job):
+                return
+            self._update(job, status=new_status)
+            retry = []
+            if job.checksum and new_status in (JobStatus.COMPLETED, JobStatus.ERROR):
+                gid = job.gid
+                retry = self._aria2_checksum_results([job], {gid: self.aria2.get_status(gid)})
+            self._record('update', job)
+        if not self.scheduler.limited:
+            for retried in retry:
+                self._start_job(retried)
+        if new_status == JobStatus.COMPLETED:
+            self._index_completed([job])
+        if new_status in (JobStatus.COMPLETED, JobStatus.ERROR, JobStatus.REMOVED):
+            self.schedule()
+
+    def _record(self, op, job):
+        """Persist one change ('add', 'update' or 'remove') to a job.
+
+        Serialised so the GUI poller and event listener never interleave writes with UI actions.
+        """
+        with self._lock:
+            if self.persistence.needs_snapshot:
+                self.persistence.record(op, job, self.queue.jobs(), self.history)
+            else:
+                self.persistence.record(op, job)
+
+    def _record_many(self, op, jobs):
+        with self._lock:
+            if not jobs:
+                return
+            if self.persistence.needs_snapshot:
+                self.persistence.record_many(op, jobs, self.queue.jobs(), self.history)
+            else:
+                self.persistence.record_many(op, jobs)
 
     def _select_backend(self, url, backend=None):
         if backend:
@@ -33,200 +311,909 @@ class DownloadManager:
             return self.mega
         return self.aria2
 
-    def add(self, url, backend=None, options=None):
+    def _rank_mirrors(self, url, mirrors):
+        """``url`` and its ``mirrors`` ordered fastest first, or None when there is nothing to rank."""
+        urls = list(dict.fromkeys([url, *(mirrors or ())]))
+        if len(urls) < 2:
+            return None
+        ranked = rank_mirrors(urls, self.mirror_stats, timeout=self.prechecks.timeout)
+        self.mirror_stats.flush()
+        echo(f"Mirrors for {url}, fastest first: {', '.join(ranked)}")
+        return ranked
+
+    @tracing.traced('add')
+    def add(self, url, backend=None, options=None, priority=0, max_speed=None, mirrors=None, checksum=None):
+        """Queue ``url``; ``mirrors`` are other URLs of the same file (aria2 only), ranked now by probing.
+
+        ``checksum`` (``ALGO=HEX``) is the digest the finished file must have.
+        """
+        # `b is self._aria2` below: only the selected backend has been built at this point
         b = self._select_backend(url, backend)
         download_id = self.persistence.generate_id()
-        backend_name = backend or b.__class__.__name__
-        job = {
-            'id': download_id,
-            'url': url,
-            'backend': backend_name,
-            'status': 'queued',
-            'pid': None,
-            'gid': None
-        }
-        self.queue.append(job)
-        self.persistence.save(self.queue, self.history)
+        ranked = self._rank_mirrors(url, mirrors) if b is self._aria2 else None
+        job = Job(
+            download_id, url, Backend.ARIA2 if b is self._aria2 else Backend.MEGA,
+            extra=_job_extra(options, priority, max_speed, ranked, checksum),
+        )
+        if self._queue is not None or self.persistence.needs_snapshot:
+            self.queue.add(job)
+        if not self.scheduler.limited:
+            self._record('add', job)
+            self._start_job(job, precheck=self.precheck_mode == 'blocking')
+            self.rebalance_bandwidth()
+            self.metadata.flush()
+            return job
+        if b is self._aria2 and self.precheck_mode == 'blocking':
+            # Check now so a held job is known to be reachable (and its size known for shortest-first)
+            error = self.prechecks.check_many([url], self.precheck_deadline)[url]
+            if error is not None:
+                self._update(job, status=JobStatus.ERROR)
+                echo(f"Failed to queue download {download_id}: {error}")
+        self._record('add', job)
+        if job.status == JobStatus.QUEUED:
+            self.schedule()
+            job = self.get_job(download_id) or job
+            if job.status == JobStatus.QUEUED:
+                echo(f"Queued download {download_id} ({url}) using {job.backend}; waiting for a free slot.")
+        self.metadata.flush()
+        return job
+
+    @tracing.traced('start_job')
+    def _start_job(self, job, precheck=False):
+        """Hand ``job`` to its backend, record the GID/PID it got and mark it started (or errored)."""
+        download_id, url, options = job.id, job.url, self._backend_options(job)
+        b = self.aria2 if job.backend is Backend.ARIA2 else self.mega
+        if b is self.aria2 and job.checksum:
+            options = dict(options or {}, checksum=aria2_checksum(job.checksum))
         try:
-            # Start the process and store its PID or GID
-            result = b.add(url, options, return_proc=True)
-            if b.__class__.__name__.lower().startswith('aria2') and isinstance(result, str):
-                job['gid'] = result
-                if result == 'direct-download':
-                    job['status'] = 'completed'
-                    print(f"Added download {download_id} ({url}) using {job['backend']} via direct fallback.")
+            if _preempted(job):
+                # Paused by the scheduler: let aria2 continue it ahead of its own waiting queue
+                self.aria2.resume(job.gid)
+                self.aria2.change_position(job.gid, 0, 'POS_SET')
+                self._update(job, status=JobStatus.STARTED, extra={k: v for k, v in job.extra.items() if k != 'preempted'} or None)
+                echo(f"Resumed download {download_id} (GID: {job.gid})")
+            elif self._satisfy_locally(job, precheck):
+                pass
+            else:
+                # Start the process and store its PID or GID
+                if b is self._aria2:
+                    result = b.add(
+                        url, options, return_proc=True, precheck=precheck,
+                        progress_callback=lambda status, job=job: self._on_direct_progress(job, status),
+                        throttle=self._throttle(job), mirrors=job.mirrors,
+                    )
+                else:
+                    result = self._add_mega(job, options)
+                if b is self._aria2 and isinstance(result, str):
+                    self._update(job, gid=result)
+                    if result == DIRECT_DOWNLOAD_GID:
+                        with self._lock:
+                            # The background download may already have finished and set the status
+                            if job.status == JobStatus.QUEUED:
+                                self._update(job, status=JobStatus.STARTED)
+                        echo(f"Added download {download_id} ({url}) using {job.backend} via direct fallback.")
+                    else:
+                        self._update(job, status=JobStatus.STARTED)
+                        echo(f"Added download {download_id} ({url}) using {job.backend} (GID: {job.gid})")
+                elif result and hasattr(result, 'pid'):
+                    self._update(job, pid=result.pid, status=JobStatus.STARTED)
+                    echo(f"Added download {download_id} ({url}) using {job.backend} (PID: {job.pid})")
                 else:
-                    job['status'] = 'started'
-                    print(f"Added download {download_id} ({url}) using {job['backend']} (GID: {job['gid']})")
-            elif result and hasattr(result, 'pid'):
-                job['pid'] = result.pid
-                job['status'] = 'started'
-                print(f"Added download {download_id} ({url}) using {job['backend']} (PID: {job['pid']})")
+                    self._update(job, status=JobStatus.STARTED)
+                    echo(f"Added download {download_id} ({url}) using {job.backend}")
+        except Exception as e:
+            self._update(job, status=JobStatus.ERROR)
+            echo(f"Failed to start download {download_id}: {e}")
+        self._record('update', job)
+        if b is self._aria2 and self.precheck_mode == 'background' and job.status == JobStatus.STARTED:
+            self._precheck_in_background([job])
+
+    def _satisfy_locally(self, job, precheck=False):
+        """Complete a new aria2 ``job`` from an already downloaded file with the same content.
+
+        The remote size and ETag come from the metadata cache (``precheck`` fetches them first).
+        The file is hardlinked, reflinked or copied to the job's target name, as configured.
+        Returns True when the job was completed this way.
+        """
+        if not self.dedup or job.backend is not Backend.ARIA2 or job.gid or job.pid:
+            return False
+        if precheck:
+            self.aria2._precheck_url(job.url)
+        known = self.metadata.get(job.url) or {}
+        algorithm, digest = split_checksum(job.checksum) if job.checksum else (None, None)
+        source = self.content_index.lookup(
+            size=known.get('size'), etag=known.get('etag'), sha256=digest if algorithm == 'sha256' else None,
+        )
+        if source is None:
+            return False
+        dest = self._local_destination(job, source)
+        try:
+            method = 'existing' if dest == source else place_copy(source, dest, self.dedup_methods)
+        except Exception as e:
+            echo(f"[dedup] Could not reuse {source} for download {job.id}: {e}")
+            return False
+        if dest != source:
+            self.content_index.add(dest, etag=known.get('etag'), sha256=digest if algorithm == 'sha256' else None)
+            self.content_index.flush()
+        extra = self._checksum_result(job, 'ok', 'index') if job.checksum else dict(job.extra or {})
+        extra['local_copy'] = {'path': dest, 'source': source, 'method': method}
+        self._update(job, status=JobStatus.COMPLETED, extra=extra)
+        echo(f"Completed download {job.id} ({job.url}) from {source} ({method}); nothing was downloaded.")
+        return True
+
+    @staticmethod
+    def _local_destination(job, source):
+        """Where a deduplicated ``job`` puts its file: its aria2 target name, or ``name_N`` if that is taken."""
+        options = job.options or {}
+        downloads_dir = options.get('dir') or os.fspath(ensure_download_dir())
+        filename = options.get('out') or os.path.basename(urllib.parse.urlsplit(job.url).path) or 'download.bin'
+        return _free_path(downloads_dir, filename, keep=source)
+
+    def _index_completed(self, jobs):
+        """Add the files of finished single-file aria2 ``jobs`` to the content index."""
+        if not self.dedup:
+            return
+        # Only files with a known ETag can be matched later, so only those are looked up
+        known = {}
+        for job in jobs:
+            metadata = dict(self.metadata.get(job.url, fresh=False) or {})
+            if job.checksum and job.checksum.startswith('sha256='):
+                # aria2 verified the file against it
+                metadata['sha256'] = split_checksum(job.checksum)[1]
+            if job.aria2_gid and job.status == JobStatus.COMPLETED and (strong_etag(metadata.get('etag')) or metadata.get('sha256')):
+                known[job.aria2_gid] = metadata
+        if not known:
+            return
+        for gid, paths in self.aria2.get_files_many(known).items():
+            if len(paths) == 1:
+                self.content_index.add(
+                    paths[0], etag=known[gid].get('etag'), sha256=known[gid].get('sha256'), size=known[gid].get('size'),
+                )
+        self.content_index.flush()
+
+    def _add_mega(self, job, options):
+        """Start a Mega download; with a checksum it goes to a staging directory until verified."""
+        staging = None
+        if job.checksum:
+            staging = os.path.join(os.fspath(ensure_download_dir()), f".verify-{job.id}")
+            self._update(job, extra=dict(job.extra or {}, staging=staging))
+        return self.mega.add(job.url, options, return_proc=True, dest_dir=staging)
+
+    def _checksum_result(self, job, status, by, detail=None):
+        # ``extra`` for ``job`` with its latest verification outcome
+        result = {'status': status, 'by': by}
+        if detail:
+            result['detail'] = detail
+        return dict(job.extra or {}, checksum_result=result)
+
+    def _checksum_failed(self, job, by, detail):
+        """Record a failed verification; returns True when ``job`` was re-queued for another try.
+
+        After ``checksum_retries`` further attempts the job is marked 'error' instead.
+        """
+        attempts = (job.extra or {}).get('checksum_attempts', 0)
+        extra = self._checksum_result(job, 'mismatch', by, detail)
+        if attempts >= self.checksum_retries:
+            self._update(job, status=JobStatus.ERROR, extra=extra)
+            echo(f"[checksum] {job.id}: {detail}")
+            return False
+        extra['checksum_attempts'] = attempts + 1
+        echo(f"[checksum] {job.id}: {detail}; downloading again (retry {attempts + 1} of {self.checksum_retries})")
+        self._update(job, status=JobStatus.QUEUED, gid=None, pid=None, extra=extra)
+        return True
+
+    def _aria2_checksum_results(self, jobs, statuses):
+        """Record aria2's own verification of finished jobs that have a checksum; returns those re-queued."""
+        retry = []
+        for job in jobs:
+            gid = job.aria2_gid
+            if not job.checksum or not gid:
+                continue
+            status = statuses.get(gid) or {}
+            if job.status == JobStatus.COMPLETED:
+                self._update(job, extra=self._checksum_result(job, 'ok', 'aria2'))
+            elif job.status == JobStatus.ERROR and str(status.get('errorCode')) == ARIA2_CHECKSUM_ERROR:
+                detail = status.get('errorMessage') or 'checksum validation failed'
+                if self._checksum_failed(job, 'aria2', detail):
+                    self._discard_aria2_output(gid)
+                    retry.append(job)
+        return retry
+
+    def _discard_aria2_output(self, gid):
+        # Drop a failed download and its file so the retry does not resume it or save it as name.1
+        paths = self.aria2.get_files_many([gid]).get(gid, [])
+        try:
+            self.aria2.rpc.call('aria2.removeDownloadResult', gid)
+        except Exception as e:
+            echo(f"[checksum] Could not remove aria2 result {gid}: {e}")
+        for path in paths:
+            for leftover in (path, path + '.aria2'):
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+
+    def _process_output(self, job):
+        """The finished file of a process-based job (Mega, standalone aria2c), or None if not found."""
+        staging = (job.extra or {}).get('staging')
+        if staging:
+            try:
+                names = os.listdir(staging)
+            except OSError:
+                return None
+            return os.path.join(staging, names[0]) if len(names) == 1 else None
+        filename = (job.options or {}).get('out') or os.path.basename(urllib.parse.urlsplit(job.url).path)
+        path = os.path.join(os.fspath(ensure_download_dir()), filename or 'download.bin')
+        return path if os.path.isfile(path) else None
+
+    def _verify_output(self, job):
+        """Hash the finished file of a process-based ``job`` in the process pool."""
+        path = self._process_output(job)
+        if path is None:
+            self._update(job, extra=self._checksum_result(job, 'error', 'pool', 'downloaded file not found'))
+            return
+        self._update(job, extra=self._checksum_result(job, 'pending', 'pool'))
+        self.hash_pool.submit(
+            path, split_checksum(job.checksum)[0],
+            lambda digest, error, job=job, path=path: self._on_hashed(job, path, digest, error),
+        )
+
+    def _on_hashed(self, job, path, digest, error):
+        retry = False
+        staging = (job.extra or {}).get('staging')
+        with self._lock:
+            if error is not None:
+                self._update(job, extra=self._checksum_result(job, 'error', 'pool', str(error)))
+            elif digest == split_checksum(job.checksum)[1]:
+                extra = self._checksum_result(job, 'ok', 'pool')
+                if staging:
+                    # Verified: move it out of staging into the downloads directory
+                    dest = _free_path(os.path.dirname(staging), os.path.basename(path))
+                    os.replace(path, dest)
+                    shutil.rmtree(staging, ignore_errors=True)
+                    extra.pop('staging')
+                    extra['path'] = dest
+                self._update(job, extra=extra)
+                echo(f"[checksum] {job.id}: verified {job.checksum.partition('=')[0]}")
+            else:
+                if staging:
+                    shutil.rmtree(staging, ignore_errors=True)
+                else:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                algorithm = split_checksum(job.checksum)[0]
+                retry = self._checksum_failed(job, 'pool', f"expected {job.checksum}, got {algorithm}={digest}")
+            self._record('update', job)
+        if retry and not self.scheduler.limited:
+            self._start_job(job)
+        self.schedule()
+
+    @staticmethod
+    def _backend_options(job):
+        options = dict(job.options or {})
+        if job.max_speed:
+            # Applied from the first byte; rebalance_bandwidth() adjusts it to the job's share later
+            options.setdefault('max-download-limit', str(job.max_speed))
+        return options or None
+
+    def _throttle(self, job):
+        """The token bucket for ``job``'s direct download (only used if it falls back to one)."""
+        bucket = self._throttles.get(job.id)
+        if bucket is None:
+            bucket = self._throttles[job.id] = TokenBucket(job.max_speed or 0)
+        return bucket
+
+    def rebalance_bandwidth(self, force=False):
+        """Apply speed limits to running jobs: their own limits and their share of the global one.
+
+        aria2 jobs get ``changeOption`` (and aria2 itself ``changeGlobalOption``) in one multicall;
+        direct downloads get their token buckets updated. Only changed limits are sent unless
+        ``force`` is set. Process backends (Mega, standalone aria2c) keep the limit they started with.
+        """
+        with self._lock:
+            active = self.find_jobs(status=JobStatus.STARTED)
+        if not (force or self.bandwidth_limit or self._applied_limits or self._applied_global
+                or any(job.max_speed for job in active)):
+            return {}
+        limits = share_budget(self.bandwidth_limit, active)
+        for job in active:
+            bucket = self._throttles.get(job.id)
+            if bucket is not None:
+                bucket.set_rate(limits[job.id])
+        changes = [
+            (job.aria2_gid, limits[job.id]) for job in active
+            if job.aria2_gid and (force or self._applied_limits.get(job.aria2_gid) != limits[job.id])
+        ]
+        send_global = force or self._applied_global != self.bandwidth_limit
+        if (changes or send_global) and self._aria2 is not None:
+            calls = [('aria2.changeOption', [gid, {'max-download-limit': str(rate)}]) for gid, rate in changes]
+            if send_global:
+                calls.append(('aria2.changeGlobalOption', [{'max-overall-download-limit': str(self.bandwidth_limit)}]))
+            try:
+                results = self.aria2.rpc.multicall(calls)
+            except Exception as e:
+                echo(f"[bandwidth] Could not apply limits via aria2 RPC: {e}")
+                return limits
+            for (gid, rate), result in zip(changes, results):
+                if not isinstance(result, Exception):
+                    self._applied_limits[gid] = rate
+            if send_global and not isinstance(results[-1], Exception):
+                self._applied_global = self.bandwidth_limit
+        # Forget jobs that stopped running
+        running = {job.aria2_gid for job in active}
+        self._applied_limits = {gid: rate for gid, rate in self._applied_limits.items() if gid in running}
+        return limits
+
+    def set_limit(self, target, rate):
+        """Change a speed limit at runtime: ``target`` is a download id or ``'global'``; 0 removes it."""
+        if target == 'global':
+            self.bandwidth_limit = rate
+            self.config.set_bandwidth(global_limit=rate)
+            echo(f"Global download limit: {format_rate(rate)}")
+        else:
+            job = self.get_job(target)
+            if not job:
+                echo(f"Download {target} not found")
+                return
+            extra = {k: v for k, v in (job.extra or {}).items() if k != 'max_speed'}
+            if rate:
+                extra['max_speed'] = rate
+            with self._lock:
+                self._update(job, extra=extra or None)
+                self._record('update', job)
+            if job.pid and not job.aria2_gid:
+                echo(f"Download {target} runs as a separate process; the new limit applies when it is restarted.")
+            echo(f"Download {target} limit: {format_rate(rate)}")
+        self.rebalance_bandwidth(force=True)
+
+    def _apply_aria2_results(self, jobs, results):
+        """Record what ``Aria2Backend.add_many`` returned per job; returns ``[(job, error)]`` for failures."""
+        failures = []
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                self._update(job, status=JobStatus.ERROR)
+                failures.append((job, result))
+            elif isinstance(result, str):
+                self._update(job, gid=result, status=JobStatus.STARTED)
             else:
-                job['status'] = 'started'
-                print(f"Added download {download_id} ({url}) using {job['backend']}")
+                self._update(job, pid=getattr(result, 'pid', None), status=JobStatus.STARTED)
+        return failures
+
+    def _known_size(self, url):
+        return (self.metadata.get(url, fresh=False) or {}).get('size')
+
+    def schedule(self):
+        """Start queued jobs as far as the scheduler's limits allow; returns the jobs started.
+
+        Called after adds and whenever a job finishes. Under the priority policy, aria2 jobs of
+        lower priority may be paused (and put back in the queue) to make room. Speed limits are
+        rebalanced afterwards.
+        """
+        started = []
+        if self.scheduler.limited:
+            with self._schedule_lock:
+                started = self._schedule_locked()
+        # Running jobs changed, so their shares of the global limit did too
+        self.rebalance_bandwidth()
+        return started
+
+    def _schedule_locked(self):
+        with self._lock:
+            queued, active = [], list(self.find_jobs(status=JobStatus.STARTED))
+            for job in self.find_jobs(status=JobStatus.QUEUED):
+                # A queued job with a GID is waiting inside aria2, which already owns it
+                (queued if not job.gid or _preempted(job) else active).append(job)
+        if not queued:
+            return []
+        start, preempt = self.scheduler.plan(queued, active)
+        for job in preempt:
+            try:
+                self.aria2.pause(job.gid)
+            except Exception as e:
+                echo(f"[scheduler] Could not pause {job.id}: {e}")
+                continue
+            with self._lock:
+                self._update(job, status=JobStatus.QUEUED, extra=dict(job.extra or {}, preempted=True))
+                self._record('update', job)
+            echo(f"Paused download {job.id} for a higher-priority download")
+        self._start_jobs([job for job in start if job.status == JobStatus.QUEUED])
+        return start
+
+    def show_schedule(self, limit=20):
+        """Print the scheduler limits, queue counts and its most recent decisions."""
+        sched = self.scheduler
+        if sched.limited:
+            caps = ', '.join(f"{k}={v}" for k, v in sched.per_backend.items()) or '-'
+            echo(f"Policy: {sched.policy}  max_active: {sched.max_active or '-'}  per_host: {sched.per_host or '-'}  per_backend: {caps}")
+        else:
+            echo("No scheduler limits set; downloads start as soon as they are added.")
+        queued = sum(1 for j in self.find_jobs(status=JobStatus.QUEUED) if not j.gid or _preempted(j))
+        echo(f"Waiting: {queued}  Started: {len(self.find_jobs(status=JobStatus.STARTED))}")
+        for d in sched.recent(limit):
+            when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(d['at']))
+            echo(f"{when} {d['decision']:<7} {d['job']}: {d['reason']} ({d['url']})")
+
+    def _start_jobs(self, jobs):
+        """Start scheduled jobs: new aria2 jobs sharing options in one multicall, the rest one by one."""
+        batches = {}
+        local = []
+        for job in jobs:
+            if job.backend is Backend.ARIA2 and not job.gid and len(jobs) > 1:
+                if self._satisfy_locally(job):
+                    local.append(job)
+                    continue
+                batches.setdefault(json.dumps(self._backend_options(job), sort_keys=True), []).append(job)
+            else:
+                self._start_job(job)
+        self._record_many('update', local)
+        for batch in batches.values():
+            try:
+                results = self.aria2.add_many(
+                    [j.url for j in batch], self._backend_options(batch[0]),
+                    mirrors={j.url: j.mirrors for j in batch if j.mirrors},
+                    extra_options={j.url: {'checksum': aria2_checksum(j.checksum)} for j in batch if j.checksum},
+                )
+            except Exception as e:
+                results = [e] * len(batch)
+            for job, error in self._apply_aria2_results(batch, results):
+                echo(f"Failed to start download {job.id}: {error}")
+            self._record_many('update', batch)
+            if self.precheck_mode == 'background':
+                self._precheck_in_background([j for j in batch if j.status == JobStatus.STARTED])
+
+    def _on_direct_progress(self, job, status):
+        # Progress from a background direct download (segmented engine), aria2 status format
+        self.direct_progress[job.id] = status
+        if status.get('status') == 'active':
+            self.host_tuning.observe(job.url, int(status.get('connections') or 0), int(status.get('downloadSpeed') or 0))
+        elif status.get('status') == 'error' and self.host_tuning.is_throttle_error(status.get('errorMessage')):
+            self.host_tuning.throttled(job.url)
+        new_status = {'complete': JobStatus.COMPLETED, 'error': JobStatus.ERROR}.get(status.get('status'))
+        if new_status:
+            retry = False
+            with self._lock:
+                message = status.get('errorMessage') or ''
+                if job.checksum and new_status == JobStatus.COMPLETED:
+                    # The engine hashed the file as it wrote it
+                    self._update(job, extra=self._checksum_result(job, 'ok', 'stream'))
+                elif job.checksum and message.startswith('Checksum mismatch'):
+                    retry = self._checksum_failed(job, 'stream', message)
+                if not retry:
+                    self._update(job, gid=DIRECT_DOWNLOAD_GID, status=new_status)
+                self._record('update', job)
+            self._throttles.pop(job.id, None)
+            if retry and not self.scheduler.limited:
+                self._start_direct(job)
+            self.schedule()
+
+    def _start_direct(self, job):
+        """(Re)start ``job`` as a background direct download; an unfinished ``.part`` of it is resumed."""
+        with self._lock:
+            self._update(job, gid=DIRECT_DOWNLOAD_GID, pid=None, status=JobStatus.STARTED)
+            self._record('update', job)
+        self.direct_progress.pop(job.id, None)
+        self.aria2._direct_download(
+            job.url, os.fspath(ensure_download_dir()),
+            progress_callback=lambda status, job=job: self._on_direct_progress(job, status),
+            throttle=self._throttle(job), mirrors=job.mirrors, checksum=job.checksum,
+        )
+
+    def _precheck_in_background(self, jobs):
+        for job in jobs:
+            self.prechecks.submit(job.url, lambda _url, err, job=job: self._on_precheck_done(job, err))
+
+    def _on_precheck_done(self, job, error):
+        # Background precheck verdict for a job that was queued without waiting for it
+        if error is None:
+            return
+        echo(f"[precheck] {job.id}: {job.url}: {error}")
+        with self._lock:
+            if job.aria2_gid:
+                try:
+                    self.aria2.rpc.call("aria2.forceRemove", job.gid)
+                except Exception:
+                    pass
+            self._update(job, status=JobStatus.ERROR)
+            self._record('update', job)
+
+    @tracing.traced('add_many')
+    def add_many(self, urls, backend=None, options=None, priority=0, max_speed=None, mirrors=None, checksums=None):
+        """Queue many URLs at once: aria2 URLs in one RPC round trip, state persisted once.
+
+        A URL that fails is marked 'error' and listed in the summary; the rest of the batch goes on.
+        With scheduler limits set, the batch is queued and only as many jobs as allowed start now.
+        ``mirrors`` maps a URL to other URLs of the same file, and ``checksums`` a URL to its
+        expected digest, as for ``add``.
+        """
+        aria2_jobs, mega_jobs = [], []
+        urls = list(urls)
+        ranked = self._rank_many({url: mirrors[url] for url in urls if (mirrors or {}).get(url)}, backend)
+        for url in urls:
+            b = self._select_backend(url, backend)
+            job = Job(
+                self.persistence.generate_id(), url, Backend.ARIA2 if b is self._aria2 else Backend.MEGA,
+                extra=_job_extra(options, priority, max_speed, ranked.get(url), (checksums or {}).get(url)),
+            )
+            (aria2_jobs if b is self._aria2 else mega_jobs).append(job)
+        jobs = aria2_jobs + mega_jobs
+        if self._queue is not None or self.persistence.needs_snapshot:
+            for job in jobs:
+                self.queue.add(job)
+        failures = []
+        if aria2_jobs and self.precheck_mode == 'blocking':
+            # All hosts are checked concurrently, so this waits about as long as the slowest one
+            errors = self.prechecks.check_many([j.url for j in aria2_jobs], self.precheck_deadline)
+            for job in aria2_jobs:
+                if errors[job.url] is not None:
+                    self._update(job, status=JobStatus.ERROR)
+                    failures.append((job, errors[job.url]))
+            aria2_jobs = [j for j in aria2_jobs if j.status != JobStatus.ERROR]
+        if self.scheduler.limited:
+            self._record_many('add', jobs)
+            started = self.schedule()
+            echo(f"Queued {len(jobs) - len(failures)} of {len(jobs)} downloads; {len(started)} started now.")
+            self._print_failures(failures)
+            self.metadata.flush()
+            return jobs
+        aria2_jobs = [j for j in aria2_jobs if not self._satisfy_locally(j)]
+        # Every job of the batch shares the same options and limit
+        options = self._backend_options(jobs[0]) if jobs else None
+        try:
+            results = self.aria2.add_many(
+                [j.url for j in aria2_jobs], options, mirrors={j.url: j.mirrors for j in aria2_jobs if j.mirrors},
+                extra_options={j.url: {'checksum': aria2_checksum(j.checksum)} for j in aria2_jobs if j.checksum},
+            )
         except Exception as e:
-            job['status'] = 'error'
-            print(f"Failed to start download {download_id}: {e}")
-        self.persistence.save(self.queue, self.history)
+            results = [e] * len(aria2_jobs)
+        failures += self._apply_aria2_results(aria2_jobs, results)
+        for job in mega_jobs:
+            try:
+                result = self._add_mega(job, options)
+                self._update(job, pid=getattr(result, 'pid', None), status=JobStatus.STARTED)
+            except Exception as e:
+                self._update(job, status=JobStatus.ERROR)
+                failures.append((job, e))
+        self._record_many('add', jobs)
+        if self.precheck_mode == 'background':
+            self._precheck_in_background([j for j in aria2_jobs if j.status == JobStatus.STARTED])
+        self.rebalance_bandwidth()
+        echo(f"Added {len(jobs) - len(failures)} of {len(jobs)} downloads.")
+        self._print_failures(failures)
+        self.metadata.flush()
+        return jobs
+
+    def _rank_many(self, mirrors, backend=None):
+        """Rank the mirrors of several aria2 URLs concurrently: ``{url: ranked URLs}``."""
+        mirrors = {url: m for url, m in mirrors.items() if self._select_backend(url, backend) is self._aria2}
+        if not mirrors:
+            return {}
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(len(mirrors), 8)) as pool:
+            ranked = dict(zip(mirrors, pool.map(lambda url: self._rank_mirrors(url, mirrors[url]), mirrors)))
+        return {url: r for url, r in ranked.items() if r}
+
+    @staticmethod
+    def _print_failures(failures):
+        if failures:
+            echo(f"{len(failures)} failed:")
+            for job, err in failures:
+                echo(f"  {job.id}: {job.url}: {err}")
 
 
     def pause(self, download_id):
-        job = next((j for j in self.queue if j['id'] == download_id), None)
+        job = self.get_job(download_id)
         if not job:
-            print(f"Download {download_id} not found")
+            echo(f"Download {download_id} not found")
             return
-        backend_name = str(job.get('backend', '')).lower()
         # aria2 RPC (gid)
-        if job.get('gid') and 'aria2' in backend_name and job['gid'] != 'direct-download':
+        if job.aria2_gid:
             try:
-                self.aria2.pause(job['gid'])
-                job['status'] = 'paused'
-                print(f"Paused download {download_id} (GID: {job['gid']})")
+                self.aria2.pause(job.gid)
+                self._update(job, status=JobStatus.PAUSED)
+                echo(f"Paused download {download_id} (GID: {job.gid})")
             except Exception as e:
-                print(f"Failed to pause download {download_id}: {e}")
+                echo(f"Failed to pause download {download_id}: {e}")
         # Process-backed (pid)
-        elif job.get('pid'):
+        elif job.pid:
             try:
                 import os
                 if os.name == 'nt':
                     import ctypes
                     kernel32 = ctypes.windll.kernel32
-                    handle = kernel32.OpenProcess(0x0002 | 0x0400, False, job['pid'])
+                    handle = kernel32.OpenProcess(0x0002 | 0x0400, False, job.pid)
                     if handle:
                         kernel32.SuspendThread(handle)
                         kernel32.CloseHandle(handle)
                 else:
                     import signal
-                    os.kill(job['pid'], signal.SIGSTOP)
-                job['status'] = 'paused'
-                print(f"Paused download {download_id} (PID: {job['pid']})")
+                    os.kill(job.pid, signal.SIGSTOP)
+                self._update(job, status=JobStatus.PAUSED)
+                echo(f"Paused download {download_id} (PID: {job.pid})")
             except Exception as e:
-                print(f"Failed to pause download {download_id}: {e}")
+                echo(f"Failed to pause download {download_id}: {e}")
         else:
-            print(f"Pause not supported for download {download_id} (no pid/gid)")
-        self.persistence.save(self.queue, self.history)
+            echo(f"Pause not supported for download {download_id} (no pid/gid)")
+        self._record('update', job)
+        # A paused job no longer holds a slot
+        self.schedule()
 
     def resume(self, download_id):
-        job = next((j for j in self.queue if j['id'] == download_id), None)
+        job = self.get_job(download_id)
         if not job:
-            print(f"Download {download_id} not found")
+            echo(f"Download {download_id} not found")
             return
-        backend_name = str(job.get('backend', '')).lower()
         # aria2 RPC (gid)
-        if job.get('gid') and 'aria2' in backend_name and job['gid'] != 'direct-download':
+        if job.aria2_gid:
             try:
-                self.aria2.resume(job['gid'])
-                job['status'] = 'started'
-                print(f"Resumed download {download_id} (GID: {job['gid']})")
+                self.aria2.resume(job.gid)
+                self._update(job, status=JobStatus.STARTED)
+                echo(f"Resumed download {download_id} (GID: {job.gid})")
             except Exception as e:
-                print(f"Failed to resume download {download_id}: {e}")
+                echo(f"Failed to resume download {download_id}: {e}")
+        # Direct download: continue from its .part file (e.g. after the process died)
+        elif job.is_direct:
+            if job.status == JobStatus.COMPLETED:
+                echo(f"Download {download_id} is already completed")
+            elif (self.direct_progress.get(job.id) or {}).get('status') == 'active':
+                echo(f"Download {download_id} is already running")
+            else:
+                try:
+                    self._start_direct(job)
+                    echo(f"Resumed download {download_id} (direct download)")
+                except Exception as e:
+                    echo(f"Failed to resume download {download_id}: {e}")
         # Process-backed (pid)
-        elif job.get('pid'):
+        elif job.pid:
             try:
                 import os
                 if os.name == 'nt':
                     import ctypes
                     kernel32 = ctypes.windll.kernel32
-                    handle = kernel32.OpenProcess(0x0002 | 0x0400, False, job['pid'])
+                    handle = kernel32.OpenProcess(0x0002 | 0x0400, False, job.pid)
                     if handle:
                         kernel32.ResumeThread(handle)
                         kernel32.CloseHandle(handle)
                 else:
                     import signal
-                    os.kill(job['pid'], signal.SIGCONT)
-                job['status'] = 'started'
-                print(f"Resumed download {download_id} (PID: {job['pid']})")
+                    os.kill(job.pid, signal.SIGCONT)
+                self._update(job, status=JobStatus.STARTED)
+                echo(f"Resumed download {download_id} (PID: {job.pid})")
             except Exception as e:
-                print(f"Failed to resume download {download_id}: {e}")
+                echo(f"Failed to resume download {download_id}: {e}")
         else:
-            print(f"Resume not supported for download {download_id} (no pid/gid)")
-        self.persistence.save(self.queue, self.history)
+            echo(f"Resume not supported for download {download_id} (no pid/gid)")
+        self._record('update', job)
 
     def remove(self, download_id):
-        job = next((j for j in self.queue if j['id'] == download_id), None)
-        if job and job.get('pid'):
+        job = self.get_job(download_id)
+        if job and job.pid:
             try:
                 import os
                 if os.name == 'nt':
                     import signal
-                    os.kill(job['pid'], signal.SIGTERM)
+                    os.kill(job.pid, signal.SIGTERM)
                 else:
                     import signal
-                    os.kill(job['pid'], signal.SIGTERM)
-                print(f"Terminated download {download_id} (PID: {job['pid']})")
+                    os.kill(job.pid, signal.SIGTERM)
+                echo(f"Terminated download {download_id} (PID: {job.pid})")
             except Exception as e:
-                print(f"Failed to terminate download {download_id}: {e}")
-        self.queue = [j for j in self.queue if j['id'] != download_id]
-        self.persistence.save(self.queue, self.history)
+                echo(f"Failed to terminate download {download_id}: {e}")
+        if self._queue is not None:
+            self.queue.remove(download_id)
+            self.history = [j for j in self.history if j.id != download_id]
+        self._record('remove', {'id': download_id})
+        self.schedule()
 
-    def status(self, download_id=None):
+    def fetch_aria2_statuses(self, jobs=None):
+        """Fetch aria2 status for every RPC-tracked job in one round trip, keyed by GID."""
+        jobs = self.queue if jobs is None else jobs
+        gids = [job.aria2_gid for job in jobs if job.aria2_gid]
+        if not gids:
+            return {}
+        statuses = self.aria2.get_status_many(gids)
+        self._observe_speeds(jobs, statuses)
+        self._observe_mirrors(jobs, statuses)
+        return statuses
+
+    def _observe_mirrors(self, jobs, statuses):
+        """Record what each mirror of an active multi-source aria2 job is delivering."""
+        gids = [job.aria2_gid for job in jobs
+                if job.mirrors and (statuses.get(job.aria2_gid) or {}).get('status') == 'active']
+        if not gids:
+            return
+        for servers in self.aria2.get_servers_many(gids).values():
+            for server in servers:
+                self.mirror_stats.record_throughput(server['uri'], int(server.get('downloadSpeed') or 0))
+
+    def _observe_speeds(self, jobs, statuses):
+        """Feed aria2 speed samples and throttling errors to the per-host tuning."""
+        retuned = {}
+        settings = self.aria2.connection_settings
+        for job in jobs:
+            gid = job.aria2_gid
+            status = statuses.get(gid) if gid else None
+            if not status:
+                continue
+            if status.get('status') == 'active':
+                connections = settings.get(gid) or int(status.get('connections') or 0)
+                changed = self.host_tuning.observe(job.url, connections, int(status.get('downloadSpeed') or 0))
+            elif status.get('status') == 'error' and gid not in self._throttle_seen \
+                    and self.host_tuning.is_throttle_error(status.get('errorMessage')):
+                self._throttle_seen.add(gid)
+                changed = self.host_tuning.throttled(job.url)
+            else:
+                continue
+            if changed:
+                retuned[host_of(job.url)] = changed
+        if retuned:
+            echo(f"[tuning] {', '.join(f'{h}: {n} connections' for h, n in retuned.items())}")
+            self.host_tuning.flush()
+            if self.retune_running:
+                self._retune_running(jobs, statuses, retuned)
+
+    def _retune_running(self, jobs, statuses, retuned):
+        settings = self.aria2.connection_settings
+        changes = []
+        for job in jobs:
+            n = retuned.get(host_of(job.url))
+            gid = job.aria2_gid
+            if n and gid and (statuses.get(gid) or {}).get('status') in ('active', 'waiting') and settings.get(gid) != n:
+                changes.append((gid, n))
+        if not changes:
+            return
+        try:
+            results = self.aria2.rpc.multicall(
+                ('aria2.changeOption', [gid, {'split': str(n), 'max-connection-per-server': str(n)}]) for gid, n in changes
+            )
+        except Exception as e:
+            echo(f"[tuning] Could not update running downloads: {e}")
+            return
+        for (gid, n), result in zip(changes, results):
+            if not isinstance(result, Exception):
+                settings[gid] = n
+
+    def collect_metrics(self):
+        """Sample aria2's aggregate and per-job download speeds into the metrics gauges.
+
+        Per-job speeds are labelled with the job id (the GID for downloads this manager does
+        not track). Nothing is sampled while metrics are disabled or aria2 is unreachable.
+        """
+        if not metrics.enabled():
+            return
+        try:
+            stat, active = self.aria2.get_activity()
+        except Exception:
+            return
+        metrics.DOWNLOAD_SPEED.set(int(stat.get('downloadSpeed') or 0))
+        for state in ('active', 'waiting', 'stopped'):
+            metrics.ARIA2_DOWNLOADS.set(int(stat.get('num' + state.capitalize()) or 0), state=state)
+        ids = {job.aria2_gid: job.id for job in self.queue if job.aria2_gid}
+        metrics.JOB_DOWNLOAD_SPEED.clear()
+        for download in active:
+            gid = download.get('gid')
+            metrics.JOB_DOWNLOAD_SPEED.set(int(download.get('downloadSpeed') or 0), job=ids.get(gid, gid))
+
+    def tune(self, host=None, connections=None, unpin=False):
+        """Pin or unpin a host's connection count, then print the tuned hosts."""
+        if host and (connections or unpin):
+            self.host_tuning.pin(host, None if unpin else connections)
+            self.host_tuning.flush()
+        profiles = self.host_tuning.profiles()
+        if host:
+            profiles = {h: p for h, p in profiles.items() if h == host.lower()}
+        if not profiles:
+            echo("No host profiles yet.")
+        for h, profile in sorted(profiles.items()):
+            speeds = ', '.join(
+                f"{n}: {format_rate(int(stat['speed']))} ({stat['samples']})"
+                for n, stat in sorted(profile['stats'].items(), key=lambda item: int(item[0]))
+            ) or '-'
+            pinned = ' (pinned)' if profile.get('pinned') else ''
+            echo(f"{h}: {profile['connections']} connections{pinned}; measured {speeds}")
+
+    def status(self, download_id=None, aria2_statuses=None, jobs=None):
         if download_id:
-            jobs = [j for j in self.queue if j['id'] == download_id]
-        else:
+            job = self.get_job(download_id)
+            jobs = [job] if job else []
+        elif jobs is None:
             jobs = self.queue
         if not jobs:
-            print("No downloads yet. Use 'add <url>' to start one.")
+            echo("No downloads yet. Use 'add <url>' to start one.")
             return
+        if aria2_statuses is None:
+            aria2_statuses = self.fetch_aria2_statuses(jobs)
         for job in jobs:
-            gid_part = f" GID={job['gid']}" if job.get('gid') else ''
-            pid_part = f" PID={job['pid']}" if job.get('pid') else ''
-            if job.get('gid') and 'aria2' in str(job.get('backend')).lower() and job['gid'] != 'direct-download':
-                status = self.aria2.get_status(job['gid'])
+            gid_part = f" GID={job.gid}" if job.gid else ''
+            pid_part = f" PID={job.pid}" if job.pid else ''
+            if job.aria2_gid:
+                status = aria2_statuses.get(job.gid)
                 if status and status.get('status') == 'error':
                     err = status.get('errorMessage') or ''
                     if getattr(self.aria2, '_is_socket_permission_error', lambda _x: False)(err):
                         try:
-                            proc = self.aria2._spawn_cli_download(job['url'], os.fspath(ensure_download_dir()), return_proc=True)
-                            job['pid'] = getattr(proc, 'pid', None)
-                            job['gid'] = None
-                            job['status'] = 'started'
-                            self.persistence.save(self.queue, self.history)
+                            proc = self.aria2._spawn_cli_download(job.url, os.fspath(ensure_download_dir()), return_proc=True)
+                            self._update(job, pid=getattr(proc, 'pid', None), gid=None, status=JobStatus.STARTED)
+                            self._record('update', job)
                             gid_part = ''
-                            pid_part = f" PID={job['pid']}" if job.get('pid') else ''
+                            pid_part = f" PID={job.pid}" if job.pid else ''
                         except Exception:
                             if getattr(self.aria2, 'allow_direct_fallback', False):
                                 try:
-                                    fallback_gid = self.aria2._direct_download(job['url'], os.fspath(ensure_download_dir()))
-                                    job['gid'] = fallback_gid
-                                    job['status'] = 'completed'
-                                    self.persistence.save(self.queue, self.history)
-                                    gid_part = f" GID={job['gid']}"
+                                    self._start_direct(job)
+                                    gid_part = f" GID={job.gid}"
                                 except Exception:
                                     pass
                     elif getattr(self.aria2, 'allow_direct_fallback', False) and 'forbidden by its access permissions' in err:
                         try:
-                            fallback_gid = self.aria2._direct_download(job['url'], os.fspath(ensure_download_dir()))
-                            job['gid'] = fallback_gid
-                            job['status'] = 'completed'
-                            self.persistence.save(self.queue, self.history)
-                            gid_part = f" GID={job['gid']}"
+                            self._start_direct(job)
+                            gid_part = f" GID={job.gid}"
                         except Exception:
                             pass
-            print(f"{job['id']}: {job['url']} [{job['backend']}] {job['status']}{gid_part}{pid_part}")
-
-    def refresh(self):
-        """Refresh job statuses for process-based backends (mega/aria2 CLI)."""
-        changed = False
-        for job in self.queue:
-            if job.get('status') == 'started' and job.get('pid'):
-                backend_name = job.get('backend', '').lower()
-                pid = job['pid']
-                is_process_backend = backend_name.startswith('aria2') or backend_name == 'mega'
-                if not is_process_backend:
+            known = self.metadata.get(job.url, fresh=False)
+            size_part = f" SIZE={known['size']}" if known and known.get('size') is not None else ''
+            verified = (job.extra or {}).get('checksum_result')
+            check_part = f" CHECKSUM={verified['status']}" if verified else ''
+            echo(f"{job.id}: {job.url} [{job.backend}] {job.status}{gid_part}{pid_part}{size_part}{check_part}")
+
+    @tracing.traced('refresh')
+    def refresh(self, jobs=None):
+        """Refresh job statuses: aria2 RPC jobs in one batched call, process-based backends by PID.
+
+        Returns the aria2 status map so callers (e.g. ``list``) can reuse it without another round trip,
+        or None when aria2 notifications already keep RPC jobs current and no query was made.
+        """
+        with self._lock:
+            aria2_statuses = self._refresh_locked(self.queue if jobs is None else jobs)
+        # Finished jobs free their slots
+        self.schedule()
+        return aria2_statuses
+
+    def _refresh_locked(self, jobs):
+        changed = []
+        if self.events_active and not self._events_resync:
+            aria2_statuses = None
+        else:
+            self._events_resync = False
+            aria2_statuses = self.fetch_aria2_statuses(jobs)
+        for job in jobs:
+            gid = job.aria2_gid
+            if gid:
+                if aria2_statuses is None:
+                    continue
+                new_status = ARIA2_STATUS_MAP.get((aria2_statuses.get(gid) or {}).get('status'))
+                if new_status == JobStatus.PAUSED and _preempted(job):
+                    continue
+                if new_status and new_status != job.status:
+                    self._update(job, status=new_status)
+                    changed.append(job)
+                continue
+            if job.status == JobStatus.STARTED and job.pid:
+                pid = job.pid
+                if job.backend not in (Backend.ARIA2, Backend.MEGA):
                     continue
                 try:
                     import psutil  # optional dependency
                     if not psutil.pid_exists(pid):
-                        job['status'] = 'completed'
-                        changed = True
+                        self._update(job, status=JobStatus.COMPLETED)
+                        changed.append(job)
                 except ImportError:
                     # Fallback: if pid not found via OS
                     try:
                         import os, signal
                         os.kill(pid, 0)
                     except OSError:
-                        job['status'] = 'completed'
-                        changed = True
-        if changed:
-            self.persistence.save(self.queue, self.history)
+                        self._update(job, status=JobStatus.COMPLETED)
+                        changed.append(job)
+        retry = self._aria2_checksum_results(changed, aria2_statuses or {})
+        for job in changed:
+            if job.checksum and job.status == JobStatus.COMPLETED and not job.aria2_gid \
+                    and 'checksum_result' not in job.extra:
+                self._verify_output(job)
+            self._record('update', job)
+        self._index_completed(changed)
+        if not self.scheduler.limited:
+            for job in retry:
+                self._start_job(job)
+        return aria2_statuses
@@ -2,12 +2,15 @@
 import subprocess
 import sys
 import os
+import time
 from pathlib import Path
-from .utils import PROJECT_ROOT
+from . import metrics, tracing
+from .utils import echo, PROJECT_ROOT
+from .binaries import cached_binary
 
 class MegaBackend:
     def __init__(self, binary_path=None):
-        self.binary_path = binary_path or self._find_megacmd()
+        self.binary_path = binary_path or cached_binary("mega-get", self._find_megacmd)
 
     def _find_megacmd(self):
         # Prefer bundled binaries, then user install, then PATH
@@ -42,8 +45,9 @@ class MegaBackend:
                 return os.fspath(cand)
         return exe_name  # fallback to PATH
 
-    def add(self, url, options=None, return_proc=False):
-        print(f"[mega] Adding download: {url}")
+    def add(self, url, options=None, return_proc=False, dest_dir=None):
+        # ``dest_dir``: download into this directory instead of the downloads directory
+        echo(f"[mega] Adding download: {url}")
         if not os.path.isfile(self.binary_path):
             raise RuntimeError(f"mega-get binary not found at {self.binary_path}")
 
@@ -56,6 +60,11 @@ class MegaBackend:
         else:
             cmd = [self.binary_path, url]
 
+        if dest_dir:
+            # mega-get <link> <local path>
+            os.makedirs(dest_dir, exist_ok=True)
+            cmd.append(os.fspath(dest_dir))
+
         if options:
             if isinstance(options, (list, tuple)):
                 cmd.extend(options)
@@ -68,20 +77,23 @@ class MegaBackend:
                 cmd.append(str(options))
 
         try:
-            proc = subprocess.Popen(cmd, cwd=downloads_dir)
+            start = time.perf_counter()
+            with tracing.span('spawn mega-get'):
+                proc = subprocess.Popen(cmd, cwd=downloads_dir)
+            metrics.SPAWN_SECONDS.observe(time.perf_counter() - start, process='mega-get')
             return proc if return_proc else None
         except Exception as e:
-            print(f"[mega] Failed to start: {e}")
+            echo(f"[mega] Failed to start: {e}")
             raise
 
     def pause(self, download_id):
-        print(f"[mega] Pausing: {download_id}")
+        echo(f"[mega] Pausing: {download_id}")
 
     def resume(self, download_id):
-        print(f"[mega] Resuming: {download_id}")
+        echo(f"[mega] Resuming: {download_id}")
 
     def remove(self, download_id):
-        print(f"[mega] Removing: {download_id}")
+        echo(f"[mega] Removing: {download_id}")
 
     def status(self, download_id=None):
-        print(f"[mega] Status: {download_id if download_id else 'all'}")
+        echo(f"[mega] Status: {download_id if download_id else 'all'}")
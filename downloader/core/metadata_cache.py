@@ -0,0 +1,122 @@
+# Persistent cache of remote file metadata learned from URL prechecks
+import json
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from .utils import METADATA_CACHE_PATH
+
+# Fields kept per URL; anything a probe did not report is stored as None
+METADATA_FIELDS = ("size", "etag", "last_modified", "accept_ranges", "final_url")
+
+_DEFAULT_PORTS = {"http": 80, "https": 443, "ftp": 21}
+
+
+def normalize_url(url):
+    """Cache key for ``url``: lower-case scheme/host, default port and fragment dropped."""
+    parts = urllib.parse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port in (None, _DEFAULT_PORTS.get(scheme)) else f"{host}:{port}"
+    if parts.username:
+        netloc = f"{parts.username}@{netloc}"
+    return urllib.parse.urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def metadata_from_response(resp):
+    """Extract cacheable metadata from an ``http.client``/``urllib`` response."""
+    headers = resp.headers
+    size = headers.get("Content-Length")
+    accept_ranges = headers.get("Accept-Ranges")
+    content_range = headers.get("Content-Range") or ""
+    if getattr(resp, "status", None) == 206 and "/" in content_range:
+        # A range probe only transfers one byte; the full size is after the slash
+        size = content_range.rsplit("/", 1)[1]
+        accept_ranges = accept_ranges or "bytes"
+    return {
+        "size": int(size) if size and size.isdigit() else None,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "accept_ranges": accept_ranges,
+        "final_url": resp.geturl(),
+    }
+
+
+class MetadataCache:
+    """Remote metadata (size, ETag, Last-Modified, Accept-Ranges, redirect target) keyed by URL.
+
+    Entries expire after ``ttl`` seconds and the least recently used ones are dropped beyond
+    ``max_entries``. Changes are kept in memory until ``flush()`` writes the JSON file.
+    """
+
+    def __init__(self, path=None, ttl=3600, max_entries=10000, clock=time.time):
+        self.path = os.fspath(path or METADATA_CACHE_PATH)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = None
+        self._dirty = False
+
+    def _load_locked(self):
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = OrderedDict(json.load(f))
+            except (FileNotFoundError, ValueError):
+                self._entries = OrderedDict()
+        return self._entries
+
+    def get(self, url, fresh=True):
+        """Cached metadata for ``url``, or None. ``fresh=False`` also returns expired entries."""
+        key = normalize_url(url)
+        with self._lock:
+            entries = self._load_locked()
+            entry = entries.get(key)
+            if entry is None:
+                return None
+            if fresh and self._clock() - entry.get("checked_at", 0) > self.ttl:
+                return None
+            entries.move_to_end(key)
+            return dict(entry)
+
+    def put(self, url, metadata):
+        key = normalize_url(url)
+        entry = {field: metadata.get(field) for field in METADATA_FIELDS}
+        entry["checked_at"] = self._clock()
+        with self._lock:
+            entries = self._load_locked()
+            entries[key] = entry
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+            self._dirty = True
+        return entry
+
+    def invalidate(self, url):
+        with self._lock:
+            if self._load_locked().pop(normalize_url(url), None) is not None:
+                self._dirty = True
+
+    def flush(self):
+        """Write pending changes, dropping entries that have expired."""
+        with self._lock:
+            if not self._dirty:
+                return
+            now = self._clock()
+            entries = OrderedDict(
+                (k, v) for k, v in self._entries.items() if now - v.get("checked_at", 0) <= self.ttl
+            )
+            self._entries = entries
+            self._dirty = False
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp, self.path)
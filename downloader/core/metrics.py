@@ -0,0 +1,211 @@
+# Counters, gauges and histograms for the downloader, rendered in the Prometheus text format
+import bisect
+import math
+import os
+import threading
+
+# Latency buckets in seconds: RPC round trips and state saves up to process spawns and slow probes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, registry, name, help, labels=()):
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labels)
+
+    def clear(self):
+        """Forget every label set (e.g. per-job gauges of jobs that finished)."""
+        with self._lock:
+            self._values.clear()
+
+    def value(self, **labels):
+        """Current value for one label set (None if never recorded); mostly for tests."""
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_label_text(self.labels, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """A value that only goes up (calls, bytes, errors)."""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        if not self._registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value sampled as it is now (speeds, sizes)."""
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        if not self._registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Observations (latencies, durations) counted into cumulative ``le`` buckets."""
+
+    type = "histogram"
+
+    def __init__(self, registry, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        if not self._registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last one is +Inf), then sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def value(self, **labels):
+        """``(count, sum)`` for one label set, or None."""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return (sum(state[0]), state[1]) if state else None
+
+    def _samples(self, key, state):
+        counts, total = state
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = 'le="' + _format_value(float(bound)) + '"'
+            lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+        labels = _label_text(self.labels, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Every metric of one process. While ``enabled`` is False recording is a single attribute check."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels=()):
+        return self._register(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, help, labels, buckets=buckets)
+
+    def reset(self):
+        """Drop every recorded value (the metrics themselves stay registered)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide registry; off unless DOWNLOADER_METRICS is set or enable() is called
+REGISTRY = Registry(enabled=os.getenv("DOWNLOADER_METRICS", "").lower() in ("1", "true", "yes", "on"))
+
+
+def enable(enabled=True):
+    REGISTRY.enabled = bool(enabled)
+
+
+def enabled():
+    return REGISTRY.enabled
+
+
+def render():
+    return REGISTRY.render()
+
+
+RPC_SECONDS = REGISTRY.histogram(
+    "downloader_aria2_rpc_seconds", "aria2 JSON-RPC round-trip time by method", ("method",))
+RPC_ERRORS = REGISTRY.counter(
+    "downloader_aria2_rpc_errors_total", "aria2 JSON-RPC calls that failed, by method", ("method",))
+SAVE_SECONDS = REGISTRY.histogram(
+    "downloader_state_save_seconds", "Time to write a full snapshot of the queue and history", ("store",))
+STATE_BYTES = REGISTRY.gauge(
+    "downloader_state_file_bytes", "Size of the state file after the last full save", ("store",))
+PRECHECK_SECONDS = REGISTRY.histogram(
+    "downloader_precheck_seconds", "URL precheck latency by outcome", ("result",))
+SPAWN_SECONDS = REGISTRY.histogram(
+    "downloader_process_spawn_seconds", "Time to start a download process", ("process",))
+DOWNLOAD_SPEED = REGISTRY.gauge(
+    "downloader_download_speed_bytes", "Aggregate aria2 download speed in bytes per second")
+JOB_DOWNLOAD_SPEED = REGISTRY.gauge(
+    "downloader_job_download_speed_bytes", "Download speed of each active aria2 job in bytes per second", ("job",))
+ARIA2_DOWNLOADS = REGISTRY.gauge(
+    "downloader_aria2_downloads", "Downloads aria2 holds, by state", ("state",))
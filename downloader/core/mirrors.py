@@ -0,0 +1,127 @@
+# Mirror ranking from first-byte latency probes and recorded per-mirror throughput
+import json
+import os
+import threading
+import time
+import urllib.parse
+from .utils import MIRROR_STATS_PATH
+
+# Piece size used to weigh latency against throughput when estimating a mirror's speed
+_ESTIMATE_BYTES = 4 << 20
+
+
+def mirror_key(url):
+    """Stats key of a mirror: its host and port, so mirrors sharing a host name stay apart."""
+    return urllib.parse.urlsplit(url).netloc.lower() or url
+
+
+def probe_latency(url, timeout=5):
+    """Seconds until the first byte of a one-byte range GET arrives; raises on failure."""
+    import ssl
+    import urllib.request
+
+    ctx = ssl._create_unverified_context() if url.startswith("https://") else None
+    req = urllib.request.Request(url, headers={"Range": "bytes=0-0"})
+    started = time.monotonic()
+    with urllib.request.urlopen(req, timeout=timeout, context=ctx) as resp:
+        resp.read(1)
+    return time.monotonic() - started
+
+
+class MirrorStats:
+    """Per-server mirror measurements: EWMA throughput, last probe latency and failure count.
+
+    Kept in memory until ``flush()`` writes the JSON file, like the metadata cache.
+    """
+
+    def __init__(self, path=None, alpha=0.3, clock=time.time):
+        self.path = os.fspath(path or MIRROR_STATS_PATH)
+        self.alpha = alpha
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._hosts = None
+        self._dirty = False
+
+    def _entry_locked(self, url):
+        if self._hosts is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._hosts = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._hosts = {}
+        return self._hosts.setdefault(mirror_key(url), {"throughput": None, "latency": None, "failures": 0})
+
+    def get(self, url):
+        with self._lock:
+            return dict(self._entry_locked(url))
+
+    def record_latency(self, url, latency):
+        """``latency`` in seconds, or None when the probe failed."""
+        with self._lock:
+            entry = self._entry_locked(url)
+            if latency is None:
+                entry["failures"] += 1
+            else:
+                entry["latency"] = latency
+                entry["failures"] = 0
+            entry["updated_at"] = self._clock()
+            self._dirty = True
+
+    def record_throughput(self, url, speed):
+        if not speed or speed <= 0:
+            return
+        with self._lock:
+            entry = self._entry_locked(url)
+            previous = entry.get("throughput")
+            entry["throughput"] = float(speed) if previous is None else previous + self.alpha * (speed - previous)
+            entry["updated_at"] = self._clock()
+            self._dirty = True
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._hosts, f)
+            os.replace(tmp, self.path)
+
+
+def rank_mirrors(urls, stats=None, probe=probe_latency, timeout=5):
+    """Order ``urls`` (one file's primary URL and mirrors) fastest first.
+
+    All URLs are probed concurrently. Each is scored by its estimated time to fetch a 4 MiB
+    piece: probe latency plus the piece size over the mirror's recorded throughput (the median
+    of the known throughputs when it has none yet). URLs whose probe failed go last, in their
+    given order, so aria2 can still fall back to them. Probe results are recorded in ``stats``.
+    """
+    urls = list(dict.fromkeys(urls))
+    if len(urls) < 2:
+        return urls
+    from concurrent.futures import ThreadPoolExecutor
+
+    def _probe(url):
+        try:
+            return probe(url, timeout)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(len(urls), 8), thread_name_prefix="mirror-probe") as pool:
+        latencies = dict(zip(urls, pool.map(_probe, urls)))
+    known = {}
+    if stats is not None:
+        for url, latency in latencies.items():
+            stats.record_latency(url, latency)
+        known = {url: stats.get(url).get("throughput") for url in urls}
+    speeds = sorted(v for v in known.values() if v)
+    fallback = speeds[len(speeds) // 2] if speeds else None
+
+    def _score(url):
+        latency = latencies[url]
+        if latency is None:
+            return (1, urls.index(url))
+        speed = known.get(url) or fallback
+        return (0, latency + (_ESTIMATE_BYTES / speed if speed else 0))
+
+    return sorted(urls, key=_score)
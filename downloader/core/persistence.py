@@ -1,11 +1,17 @@
 # Persistence for download queue and history
 import os
 import json
-import uuid
+import threading
+import time
+from . import metrics, tracing
 from .utils import STATE_PATH
+from .job import as_record
 
 
 class Persistence:
+    # Whether record() needs the full queue/history (snapshot-based stores) or just the changed job
+    needs_snapshot = True
+
     def __init__(self, path=None):
         self.path = os.fspath(path or STATE_PATH)
         self._ensure_file()
@@ -24,8 +30,208 @@ class Persistence:
             return {'queue': [], 'history': []}
 
     def save(self, queue, history):
-        with open(self.path, 'w') as f:
-            json.dump({'queue': queue, 'history': history}, f)
+        start = time.perf_counter()
+        with tracing.span('save', store='json'), open(self.path, 'w') as f:
+            json.dump({'queue': [as_record(j) for j in queue], 'history': [as_record(j) for j in history]}, f)
+            size = f.tell()
+        metrics.SAVE_SECONDS.observe(time.perf_counter() - start, store='json')
+        metrics.STATE_BYTES.set(size, store='json')
+
+    def record(self, op, job, queue, history):
+        """Persist a single change to ``job``.
+
+        ``op`` is 'add', 'update' or 'remove'. The snapshot store has no cheaper option than
+        rewriting everything; journaled stores append just the change.
+        """
+        self.save(queue, history)
+
+    def record_many(self, op, jobs, queue, history):
+        """Persist the same change to several jobs in one write (used by bulk add)."""
+        self.save(queue, history)
+
+    def get_job(self, job_id):
+        """Look up one queued job by id (indexed stores answer without loading everything)."""
+        return next((j for j in self.load().get('queue', []) if j.get('id') == job_id), None)
+
+    def find_jobs(self, **filters):
+        """Return queued jobs whose fields equal all of ``filters`` (e.g. ``status='started'``)."""
+        return [j for j in self.load().get('queue', []) if all(j.get(k) == v for k, v in filters.items())]
+
+    def close(self):
+        pass
 
     def generate_id(self):
+        import uuid
         return str(uuid.uuid4())
+
+
+class JournalPersistence(Persistence):
+    """Snapshot plus append-only journal of per-job changes.
+
+    Each change is one JSON line in ``<state>.journal``; ``load()`` replays it on top of the
+    snapshot. Once the journal grows past ``compact_bytes`` it is rotated to ``<state>.journal.old``
+    and a background thread folds the state into a fresh snapshot (the same JSON format the plain
+    store writes) before deleting the rotated file. A torn final line left by a crash is ignored.
+    """
+
+    def __init__(self, path=None, compact_bytes=1 << 20):
+        super().__init__(path)
+        self.journal_path = self.path + '.journal'
+        self.old_journal_path = self.journal_path + '.old'
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        self._compactor = None
+
+    def load(self):
+        data = super().load()
+        jobs = {}
+        order = []
+        for job in data.get('queue', []):
+            jobs[job['id']] = job
+            order.append(job['id'])
+        history = data.get('history', [])
+        for path in (self.old_journal_path, self.journal_path):
+            for entry in self._read_journal(path):
+                op = entry.get('op')
+                if op in ('add', 'update'):
+                    # Each record holds the whole job, so it replaces the previous state
+                    job = entry['job']
+                    if job['id'] not in jobs:
+                        order.append(job['id'])
+                    jobs[job['id']] = dict(job)
+                elif op == 'remove':
+                    jobs.pop(entry['id'], None)
+                    history = [j for j in history if j.get('id') != entry['id']]
+        return {'queue': [jobs[i] for i in order if i in jobs], 'history': history}
+
+    def _read_journal(self, path):
+        """Yield journal entries, truncating a torn final record so later appends stay line-aligned."""
+        try:
+            f = open(path, 'rb+')
+        except FileNotFoundError:
+            return
+        with f:
+            good = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                good += len(line)
+                yield entry
+            if good != f.seek(0, os.SEEK_END):
+                f.truncate(good)
+
+    def save(self, queue, history):
+        # A full snapshot supersedes everything journaled so far
+        with self._lock:
+            self._wait_compactor()
+            start = time.perf_counter()
+            with tracing.span('save', store='journal'):
+                size = self._write_snapshot([as_record(j) for j in queue], [as_record(j) for j in history])
+            metrics.SAVE_SECONDS.observe(time.perf_counter() - start, store='journal')
+            metrics.STATE_BYTES.set(size, store='journal')
+            for path in (self.old_journal_path, self.journal_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def record(self, op, job, queue, history):
+        self.record_many(op, [job], queue, history)
+
+    def record_many(self, op, jobs, queue, history):
+        lines = []
+        for job in map(as_record, jobs):
+            entry = {'op': op, 'id': job['id']} if op == 'remove' else {'op': op, 'job': job}
+            lines.append(json.dumps(entry) + '\n')
+        with self._lock, tracing.span('journal append', op=op, jobs=len(lines)):
+            with open(self.journal_path, 'a') as f:
+                f.write(''.join(lines))
+                size = f.tell()
+            if size >= self.compact_bytes and not self._compacting():
+                self._start_compaction(queue, history)
+
+    def close(self):
+        with self._lock:
+            self._wait_compactor()
+
+    def _compacting(self):
+        return self._compactor is not None and self._compactor.is_alive()
+
+    def _wait_compactor(self):
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+
+    def _start_compaction(self, queue, history):
+        # Rotate first so new records land in a fresh journal while the snapshot is written
+        if os.path.exists(self.old_journal_path):
+            # Left over from an interrupted compaction: keep its records ahead of the current ones
+            import shutil
+            with open(self.journal_path, 'rb') as src, open(self.old_journal_path, 'ab') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self.journal_path)
+        else:
+            os.replace(self.journal_path, self.old_journal_path)
+        # Copy now: the jobs keep changing on the caller's thread while the snapshot is written
+        queue = [dict(as_record(j)) for j in queue]
+        history = [dict(as_record(j)) for j in history]
+        # Not a daemon thread: a short-lived CLI process finishes the snapshot before exiting
+        self._compactor = threading.Thread(target=self._compact, args=(queue, history), name='state-compactor')
+        self._compactor.start()
+
+    def _compact(self, queue, history):
+        try:
+            self._write_snapshot(queue, history)
+            os.remove(self.old_journal_path)
+        except Exception as e:
+            print(f"[state] Journal compaction failed: {e}")
+
+    def _write_snapshot(self, queue, history):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'queue': queue, 'history': history}, f)
+            size = f.tell()
+        os.replace(tmp, self.path)
+        return size
+
+
+PERSISTENCE_MODES = {
+    'json': Persistence,
+    'journal': JournalPersistence,
+}
+
+
+def open_persistence(mode=None, path=None, db_path=None, **options):
+    """Build the state store selected in config (``persistence.mode``), defaulting to the JSON snapshot.
+
+    ``path`` is the JSON state file; the SQLite store lives at ``db_path`` and imports from ``path``.
+    """
+    mode = (mode or 'json').lower()
+    if mode == 'sqlite':
+        from .sqlite_persistence import SqlitePersistence
+        return SqlitePersistence(db_path, json_path=path)
+    if mode not in PERSISTENCE_MODES:
+        raise ValueError(f"Unknown persistence mode: {mode}")
+    if mode != 'journal':
+        options.pop('compact_bytes', None)
+    return PERSISTENCE_MODES[mode](path, **options)
+
+
+def migrate_persistence(old_mode, new_mode, **options):
+    """Carry the current state over when the configured store changes.
+
+    ``options`` are the rest of the ``persistence`` config section (paths, ``compact_bytes``),
+    so both stores are opened exactly as the manager opens them.
+    """
+    if (old_mode or 'json') == (new_mode or 'json'):
+        return
+    old = open_persistence(old_mode, **options)
+    data = old.load()
+    old.close()
+    new = open_persistence(new_mode, **options)
+    new.save(data.get('queue', []), data.get('history', []))
+    new.close()
@@ -0,0 +1,170 @@
+# URL reachability prechecks, run concurrently with a per-host cap
+import threading
+import time
+import urllib.parse
+from collections import deque
+from . import metrics, tracing
+from .metadata_cache import metadata_from_response
+
+PRECHECK_MODES = ("blocking", "background", "off")
+
+
+def precheck_url(url, timeout=5):
+    """Lightweight reachability check before handing off to aria2.
+
+    For http/https, issue a HEAD (or byte-range GET fallback) with certificate checks disabled
+    to mirror aria2's default `--check-certificate=false`. Other schemes are skipped.
+    Returns the remote metadata the probe revealed (see ``metadata_from_response``), or None.
+    """
+    if not (url.startswith("http://") or url.startswith("https://")):
+        return None
+    start = time.perf_counter()
+    result = "error"
+    try:
+        with tracing.span("precheck", url=url):
+            metadata = _probe(url, timeout)
+        result = "ok"
+        return metadata
+    finally:
+        metrics.PRECHECK_SECONDS.observe(time.perf_counter() - start, result=result)
+
+
+def _probe(url, timeout):
+    import ssl
+    import urllib.error
+    import urllib.request
+
+    ctx = None
+    if url.startswith("https://"):
+        try:
+            ctx = ssl._create_unverified_context()
+        except Exception:
+            ctx = None
+
+    def _try_request(method, headers=None):
+        req = urllib.request.Request(url, method=method, headers=headers or {})
+        with urllib.request.urlopen(req, timeout=timeout, context=ctx) as resp:
+            return metadata_from_response(resp)
+
+    try:
+        return _try_request("HEAD")
+    except urllib.error.HTTPError as he:
+        if he.code not in (400, 403, 405):
+            raise RuntimeError(f"URL precheck failed: HTTP {he.code}") from he
+        # HEAD refused, fall through to range GET fallback
+    except Exception:
+        # Connection-level failure on HEAD; try range GET next
+        pass
+
+    # Fallback: tiny range GET to detect reachability
+    try:
+        return _try_request("GET", {"Range": "bytes=0-0"})
+    except Exception as e:
+        raise RuntimeError(f"URL precheck failed (range GET): {e}") from e
+
+
+def _host(url):
+    return urllib.parse.urlsplit(url).netloc.lower() or url
+
+
+class PrecheckPool:
+    """Runs URL prechecks on a bounded thread pool, at most ``per_host`` at a time per host.
+
+    Each host gets up to ``per_host`` "lanes" that drain that host's pending URLs, so a slow
+    host only holds up its own URLs and a batch takes about as long as its slowest host.
+    With a ``MetadataCache``, URLs with fresh metadata pass without a probe and successful
+    probes are cached.
+    """
+
+    def __init__(self, workers=8, per_host=2, timeout=5, check=precheck_url, cache=None):
+        self.workers = workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.cache = cache
+        self._check = check
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._lanes = {}
+        self._executor = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="precheck")
+            return self._executor
+
+    def submit(self, url, callback, stop_at=None):
+        """Check ``url`` in the background and call ``callback(url, error)``; ``error`` is None on success.
+
+        ``stop_at`` is a ``time.monotonic()`` deadline after which the check is reported as timed out.
+        """
+        host = _host(url)
+        with self._lock:
+            self._pending.setdefault(host, deque()).append((url, callback, stop_at))
+            if self._lanes.get(host, 0) >= self.per_host:
+                return
+            self._lanes[host] = self._lanes.get(host, 0) + 1
+        self._pool().submit(self._run_lane, host)
+
+    def check_many(self, urls, deadline=None):
+        """Check ``urls`` concurrently and return ``{url: None or exception}``.
+
+        URLs still unchecked after ``deadline`` seconds are reported with a ``TimeoutError``.
+        """
+        urls = list(dict.fromkeys(urls))
+        results = {}
+        if not urls:
+            return results
+        done = threading.Event()
+        stop_at = time.monotonic() + deadline if deadline else None
+
+        def _collect(url, error):
+            results[url] = error
+            if len(results) == len(urls):
+                done.set()
+
+        for url in urls:
+            self.submit(url, _collect, stop_at)
+        done.wait(None if stop_at is None else max(0, stop_at - time.monotonic()))
+        return {url: results.get(url, TimeoutError("precheck deadline exceeded")) for url in urls}
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _run_lane(self, host):
+        while True:
+            with self._lock:
+                pending = self._pending.get(host)
+                if not pending:
+                    self._pending.pop(host, None)
+                    self._lanes[host] -= 1
+                    if not self._lanes[host]:
+                        del self._lanes[host]
+                    return
+                url, callback, stop_at = pending.popleft()
+            error = self._run_one(url, stop_at)
+            try:
+                callback(url, error)
+            except Exception as e:
+                print(f"[precheck] Callback failed for {url}: {e}")
+
+    def _run_one(self, url, stop_at):
+        if self.cache is not None and self.cache.get(url) is not None:
+            return None
+        timeout = self.timeout
+        if stop_at is not None:
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                return TimeoutError("precheck deadline exceeded")
+            timeout = min(timeout, remaining)
+        try:
+            metadata = self._check(url, timeout)
+        except Exception as e:
+            return e
+        if self.cache is not None and metadata:
+            self.cache.put(url, metadata)
+        return None
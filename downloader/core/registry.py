@@ -0,0 +1,106 @@
+# In-memory job registry with secondary indexes
+class JobRegistry:
+    """Ordered collection of job records indexed by id, gid, pid, status and backend.
+
+    Holds ``Job`` objects. Lookups by any indexed field are O(1) and per-status iteration only
+    touches matching jobs. Changes to indexed fields must go through ``update()`` so the indexes
+    stay in step.
+    """
+
+    INDEXED_FIELDS = ('gid', 'pid', 'status', 'backend')
+
+    def __init__(self, jobs=()):
+        self._jobs = {}
+        # field -> value -> {job_id: None}; dicts double as insertion-ordered sets
+        self._index = {field: {} for field in self.INDEXED_FIELDS}
+        for job in jobs:
+            self.add(job)
+
+    def __iter__(self):
+        # Iterate over a snapshot so callers may update or remove jobs while looping
+        return iter(list(self._jobs.values()))
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __bool__(self):
+        return bool(self._jobs)
+
+    def __contains__(self, job_id):
+        return job_id in self._jobs
+
+    def jobs(self):
+        return list(self._jobs.values())
+
+    def _index_add(self, job):
+        for field in self.INDEXED_FIELDS:
+            value = getattr(job, field)
+            if value is not None:
+                self._index[field].setdefault(value, {})[job.id] = None
+
+    def _index_discard(self, field, value, job_id):
+        bucket = self._index[field].get(value)
+        if bucket is not None:
+            bucket.pop(job_id, None)
+            if not bucket:
+                del self._index[field][value]
+
+    def add(self, job):
+        if job.id in self._jobs:
+            self.remove(job.id)
+        self._jobs[job.id] = job
+        self._index_add(job)
+        return job
+
+    append = add
+
+    def remove(self, job_id):
+        job = self._jobs.pop(job_id, None)
+        if job is not None:
+            for field in self.INDEXED_FIELDS:
+                self._index_discard(field, getattr(job, field), job_id)
+        return job
+
+    def update(self, job, **fields):
+        """Apply ``fields`` to ``job``, moving it between index buckets as needed."""
+        tracked = self._jobs.get(job.id) is job
+        for field, value in fields.items():
+            old = getattr(job, field)
+            setattr(job, field, value)
+            if tracked and field in self._index and old != value:
+                self._index_discard(field, old, job.id)
+                if value is not None:
+                    self._index[field].setdefault(value, {})[job.id] = None
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def _ids(self, field, value):
+        return self._index[field].get(value, {})
+
+    def by_gid(self, gid):
+        return next((self._jobs[i] for i in self._ids('gid', gid)), None)
+
+    def by_pid(self, pid):
+        return next((self._jobs[i] for i in self._ids('pid', pid)), None)
+
+    def with_status(self, status):
+        return [self._jobs[i] for i in self._ids('status', status)]
+
+    def with_backend(self, backend):
+        return [self._jobs[i] for i in self._ids('backend', backend)]
+
+    def find(self, **filters):
+        """Jobs whose fields equal all of ``filters``, narrowed through the smallest matching index."""
+        if 'id' in filters:
+            job = self._jobs.get(filters.pop('id'))
+            candidates = [job] if job is not None else []
+        else:
+            indexed = [(f, v) for f, v in filters.items() if f in self._index]
+            if indexed:
+                field, value = min(indexed, key=lambda fv: len(self._ids(*fv)))
+                candidates = [self._jobs[i] for i in self._ids(field, value)]
+            else:
+                candidates = self.jobs()
+        return [j for j in candidates if all(getattr(j, k, None) == v for k, v in filters.items())]
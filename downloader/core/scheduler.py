@@ -0,0 +1,148 @@
+# Queue scheduler: decides which queued jobs start, within global/per-host/per-backend limits
+import json
+import os
+import threading
+import time
+import urllib.parse
+from collections import Counter, deque
+
+
+def _host(url):
+    return urllib.parse.urlsplit(url).netloc.lower() or url
+
+
+def _fifo(jobs, size_of):
+    return list(jobs)
+
+
+def _priority(jobs, size_of):
+    # sorted() is stable, so equal priorities keep their queue order
+    return sorted(jobs, key=lambda job: -job.priority)
+
+
+def _shortest(jobs, size_of):
+    # Unknown sizes go last, in queue order
+    def key(job):
+        size = size_of(job.url)
+        return (size is None, size or 0)
+    return sorted(jobs, key=key)
+
+
+# Ordering policies: name -> function(queued_jobs, size_of) returning the jobs in start order
+POLICIES = {"fifo": _fifo, "priority": _priority, "shortest": _shortest}
+
+
+class Scheduler:
+    """Decides which queued jobs to start so the active set stays within its limits.
+
+    ``max_active`` caps running jobs overall, ``per_host`` per URL host and ``per_backend``
+    (``{"aria2": n, "mega": n}``) per backend; None means unlimited. The ``policy`` (a name from
+    ``POLICIES`` or a function with the same signature) orders the queued jobs; ``size_of(url)``
+    supplies known sizes for the shortest-first policy. Under the priority policy a queued job
+    may take the slot of a lower-priority job that ``can_preempt`` allows to be paused.
+
+    Every decision is kept in memory and, with ``log_path``, appended there as a JSON line so
+    ``recent()`` can show them from another process.
+    """
+
+    LOG_MAX_BYTES = 1 << 20
+
+    def __init__(self, max_active=None, per_host=None, per_backend=None, policy="fifo", size_of=None,
+                 can_preempt=None, log_path=None, clock=time.time):
+        self.max_active = max_active
+        self.per_host = per_host
+        self.per_backend = dict(per_backend or {})
+        self.policy = policy
+        self.size_of = size_of or (lambda url: None)
+        self.can_preempt = can_preempt or (lambda job: False)
+        self.log_path = os.fspath(log_path) if log_path else None
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._decisions = deque(maxlen=500)
+        # job id -> last reason it was held back, so a waiting job is logged once per reason
+        self._waiting = {}
+
+    @property
+    def limited(self):
+        """False when no limit is set: jobs then start as soon as they are added."""
+        return bool(self.max_active or self.per_host or self.per_backend)
+
+    def order(self, jobs):
+        policy = POLICIES[self.policy] if isinstance(self.policy, str) else self.policy
+        return policy(jobs, self.size_of)
+
+    def plan(self, queued, active):
+        """Return ``(start, preempt)``: queued jobs to start now and active jobs to pause for them."""
+        active = list(active)
+        hosts = Counter(_host(job.url) for job in active)
+        backends = Counter(str(job.backend) for job in active)
+        slots = self.max_active - len(active) if self.max_active else None
+        victims = sorted(
+            (job for job in active if self.can_preempt(job)), key=lambda job: job.priority
+        ) if self.policy == "priority" and self.max_active else []
+        start, preempt = [], []
+        with self._lock:
+            for job in self.order(queued):
+                reason = self._blocked(job, hosts, backends)
+                if reason is None and slots is not None and slots <= 0:
+                    if victims and victims[0].priority < job.priority:
+                        victim = victims.pop(0)
+                        preempt.append(victim)
+                        hosts[_host(victim.url)] -= 1
+                        backends[str(victim.backend)] -= 1
+                        slots += 1
+                        self._log(victim, "preempt", f"paused for higher-priority job {job.id}")
+                    else:
+                        reason = f"max_active {self.max_active} reached"
+                if reason is not None:
+                    if self._waiting.get(job.id) != reason:
+                        self._waiting[job.id] = reason
+                        self._log(job, "wait", reason)
+                    continue
+                start.append(job)
+                hosts[_host(job.url)] += 1
+                backends[str(job.backend)] += 1
+                if slots is not None:
+                    slots -= 1
+                self._waiting.pop(job.id, None)
+                self._log(job, "start", f"policy {self.policy if isinstance(self.policy, str) else 'custom'}")
+        return start, preempt
+
+    def _blocked(self, job, hosts, backends):
+        host = _host(job.url)
+        if self.per_host and hosts[host] >= self.per_host:
+            return f"host {host} at per_host cap {self.per_host}"
+        cap = self.per_backend.get(str(job.backend))
+        if cap and backends[str(job.backend)] >= cap:
+            return f"backend {job.backend} at per_backend cap {cap}"
+        return None
+
+    def _log(self, job, decision, reason):
+        entry = {"at": self._clock(), "job": job.id, "url": job.url, "decision": decision, "reason": reason}
+        self._decisions.append(entry)
+        if self.log_path is None:
+            return
+        try:
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > self.LOG_MAX_BYTES:
+                os.replace(self.log_path, self.log_path + ".1")
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"[scheduler] Could not write decision log: {e}")
+
+    def recent(self, limit=50):
+        """The last ``limit`` decisions, oldest first (read from the log file when there is one)."""
+        if self.log_path is None:
+            return list(self._decisions)[-limit:]
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                lines = deque(f, maxlen=limit)
+        except FileNotFoundError:
+            return []
+        decisions = []
+        for line in lines:
+            try:
+                decisions.append(json.loads(line))
+            except ValueError:
+                continue
+        return decisions
@@ -0,0 +1,483 @@
+# Segmented multi-connection HTTP engine for the direct-download fallback
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import deque
+from .metadata_cache import metadata_from_response
+from .checksums import ChecksumMismatch, IncrementalHash, split_checksum
+from .job import DIRECT_DOWNLOAD_GID
+
+_BLOCK = 64 * 1024
+
+
+def _connection(url, timeout):
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme == "https":
+        import ssl
+        # Mirror aria2's --check-certificate=false, as the RPC path does
+        return http.client.HTTPSConnection(parts.hostname, parts.port, timeout=timeout, context=ssl._create_unverified_context())
+    return http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+
+
+def _request_target(url):
+    parts = urllib.parse.urlsplit(url)
+    return urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+
+
+def part_paths(dest):
+    """The in-progress data file and its chunk map for a download that ends up at ``dest``."""
+    return dest + ".part", dest + ".part.json"
+
+
+def read_chunk_map(dest):
+    """The chunk map of an unfinished download of ``dest``, or None.
+
+    The map is ``{"url", "size", "validator", "done"}`` where ``done`` lists the byte ranges
+    (``[start, end)``) already written to the ``.part`` file.
+    """
+    try:
+        with open(part_paths(dest)[1], "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return data if isinstance(data, dict) and isinstance(data.get("done"), list) else None
+
+
+def _validator(metadata):
+    # If-Range needs a strong ETag; Last-Modified is the fallback
+    etag = metadata.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return metadata.get("last_modified")
+
+
+def _merge(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _missing_pieces(done, total, chunk_size):
+    """Inclusive ``(start, end)`` pieces of at most ``chunk_size`` bytes not covered by ``done``."""
+    pieces = []
+    position = 0
+    for start, end in _merge(done) + [[total, total]]:
+        for piece in range(position, start, chunk_size):
+            pieces.append((piece, min(piece + chunk_size, start) - 1))
+        position = max(position, end)
+    return pieces
+
+
+class _RemoteChanged(RuntimeError):
+    """The server sent the whole file for an If-Range request: the partial data is stale."""
+
+
+class _Redirect(Exception):
+    def __init__(self, location):
+        super().__init__(location)
+        self.location = location
+
+
+class SegmentedDownload:
+    """Download ``url`` into ``dest`` over several connections when the server allows ranges.
+
+    Data goes to ``dest + ".part"``, preallocated and split into ``chunk_size`` pieces that up
+    to ``connections`` workers fetch with ``Range`` requests, each worker reusing one keep-alive
+    connection and writing its bytes into place with positional writes. Finished pieces are
+    recorded in a chunk map next to it (see ``read_chunk_map``) together with the ETag or
+    Last-Modified validator, so a later run resumes only the missing ranges, sending ``If-Range``
+    to detect a changed file. The ``.part`` file is renamed to ``dest`` once complete.
+    Servers without range support get a single, non-resumable stream. ``start()`` runs it in
+    the background; ``progress_callback`` receives aria2-style status dicts (see ``status()``).
+    An optional ``throttle`` caps the combined speed of all connections.
+
+    ``mirrors`` are other URLs for the same file, fastest first. Connections are spread over
+    the primary URL and the mirrors, and each pulls pieces from the shared queue, so faster
+    sources end up fetching more of the file; ``source_speeds`` holds what each achieved. A
+    source that fails hands its piece back and drops out while others remain. Mirrors cannot
+    share the primary's validator, so their responses are checked against the file size instead.
+
+    With ``checksum`` (``"sha256=<hex>"``, see ``checksums.parse_checksum``) the file is hashed
+    as it is written (see ``checksums.IncrementalHash``) and ``digest`` holds the result. A file
+    that does not match is deleted and the download fails with ``ChecksumMismatch``.
+    """
+
+    def __init__(self, url, dest, connections=4, chunk_size=4 << 20, progress_callback=None, timeout=30, known=None,
+                 throttle=None, mirrors=None, checksum=None):
+        self.url = url
+        self.dest = dest
+        self.part_path, self.map_path = part_paths(dest)
+        self.connections = max(1, connections)
+        self.chunk_size = chunk_size
+        self.progress_callback = progress_callback
+        self.timeout = timeout
+        # Shared by all connections of this download (see bandwidth.TokenBucket)
+        self.throttle = throttle
+        self.mirrors = [m for m in (mirrors or []) if m != url]
+        # source URL -> average bytes/s of the pieces it served
+        self.source_speeds = {}
+        self.checksum = checksum
+        self.digest = None
+        self._hasher = None
+        # Metadata already known for the URL (e.g. from the metadata cache); skips the probe
+        self.metadata = dict(known) if known else None
+        self.total = None
+        self.completed = 0
+        self.state = "waiting"
+        self.error = None
+        self._lock = threading.Lock()
+        self._validator = None
+        self._done = []
+        self._started_at = None
+        self._last_report = 0.0
+        self._thread = None
+
+    def status(self):
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0
+        status = {
+            "gid": DIRECT_DOWNLOAD_GID,
+            "status": self.state,
+            "completedLength": str(self.completed),
+            "totalLength": str(self.total or 0),
+            "downloadSpeed": str(int(self.completed / elapsed) if elapsed > 0 else 0),
+            "connections": str(self.connections),
+        }
+        if self.error is not None:
+            status["errorMessage"] = str(self.error)
+        return status
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="direct-download")
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """Wait for a started download; raises its error, returns False if still running after ``timeout``."""
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return False
+        if self.error is not None:
+            raise self.error
+        return True
+
+    def run(self):
+        """Download in the calling thread and raise on failure."""
+        self._run()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        self._started_at = time.monotonic()
+        self.state = "active"
+        try:
+            self._download()
+            self.state = "complete"
+        except Exception as e:
+            self.error = e if isinstance(e, RuntimeError) else RuntimeError(f"Direct download failed: {e}")
+            self.state = "error"
+        self._report(force=True)
+
+    def _report(self, force=False):
+        if self.progress_callback is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < 0.2:
+            return
+        self._last_report = now
+        try:
+            self.progress_callback(self.status())
+        except Exception as e:
+            print(f"[direct] Progress callback failed: {e}")
+
+    def _probe(self):
+        # A one-byte range GET reveals size, range support and the redirect target in one request
+        req = urllib.request.Request(self.url, headers={"Range": "bytes=0-0"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            metadata = metadata_from_response(resp)
+            if resp.status != 206:
+                metadata["accept_ranges"] = None
+        return metadata
+
+    def _download(self, resume=True):
+        state = read_chunk_map(self.dest) if resume else None
+        if state is not None and state.get("url") != self.url:
+            state = None
+        if state is not None or not self.metadata or self.metadata.get("size") is None or not self.metadata.get("final_url"):
+            # A resume always revalidates against the server instead of trusting cached metadata
+            self.metadata = self._probe()
+        self.total = self.metadata.get("size")
+        ranged = (self.metadata.get("accept_ranges") or "").lower() == "bytes"
+        if ranged and self.total:
+            self._validator = _validator(self.metadata)
+            done = self._resumable(state)
+            if done:
+                print(f"[direct] Resuming {self.dest}: {sum(e - s for s, e in done)} of {self.total} bytes already present")
+            try:
+                self._download_segments(done)
+            except _RemoteChanged:
+                if not done:
+                    raise
+                print(f"[direct] {self.url} changed since the partial download; starting over")
+                self.metadata = None
+                return self._download(resume=False)
+        else:
+            self._download_stream()
+        if self.total is not None and self.completed != self.total:
+            raise RuntimeError(f"Direct download incomplete: got {self.completed} of {self.total} bytes")
+        if self._hasher is not None:
+            self._verify()
+        os.replace(self.part_path, self.dest)
+        try:
+            os.remove(self.map_path)
+        except FileNotFoundError:
+            pass
+
+    def _new_hasher(self, fd):
+        if self.checksum:
+            self._hasher = IncrementalHash(split_checksum(self.checksum)[0], lambda offset, n: _pread(fd, n, offset))
+
+    def _verify(self):
+        fd = os.open(self.part_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        try:
+            # Normally nothing is left to read; the reader is only used for bytes not yet hashed
+            self._hasher._read_at = lambda offset, n: _pread(fd, n, offset)
+            self.digest = self._hasher.hexdigest(self.completed)
+        finally:
+            os.close(fd)
+        expected = split_checksum(self.checksum)[1]
+        if self.digest != expected:
+            for path in (self.part_path, self.map_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            raise ChecksumMismatch(f"Checksum mismatch for {self.dest}: expected {self.checksum}, got {self.digest}")
+
+    def _resumable(self, state):
+        """Completed ranges of ``state`` that are still valid for the file the server has now."""
+        if state is None or not self._validator:
+            return []
+        if state.get("validator") != self._validator or state.get("size") != self.total:
+            return []
+        try:
+            if os.path.getsize(self.part_path) != self.total:
+                return []
+        except OSError:
+            return []
+        return _merge([start, end] for start, end in state["done"] if 0 <= start < end <= self.total)
+
+    def _save_map_locked(self):
+        data = {"url": self.url, "size": self.total, "validator": self._validator, "done": self._done}
+        tmp = self.map_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.map_path)
+
+    def _piece_done(self, start, end):
+        if not self._validator:
+            return
+        with self._lock:
+            self._done = _merge(self._done + [[start, end + 1]])
+            self._save_map_locked()
+
+    def _download_stream(self):
+        source = self.metadata.get("final_url") or self.url
+        try:
+            # Without ranges nothing can be resumed; drop any stale map
+            os.remove(self.map_path)
+        except FileNotFoundError:
+            pass
+        with urllib.request.urlopen(source, timeout=self.timeout) as resp, open(self.part_path, "wb") as f:
+            if self.total is None:
+                self.total = metadata_from_response(resp)["size"]
+            # A single stream arrives in order, so every byte is hashed from the buffer
+            self._new_hasher(None)
+            offset = 0
+            while True:
+                block = resp.read(_BLOCK)
+                if not block:
+                    break
+                f.write(block)
+                if self._hasher is not None:
+                    self._hasher.update(offset, block)
+                offset += len(block)
+                self._advance(len(block))
+
+    def _advance(self, n):
+        if self.throttle is not None and n > 0:
+            self.throttle.consume(n)
+        with self._lock:
+            self.completed += n
+        self._report()
+
+    def _download_segments(self, done):
+        pieces = deque(_missing_pieces(done, self.total, self.chunk_size))
+        with self._lock:
+            self._done = done
+            self.completed = sum(end - start for start, end in done)
+            if not done:
+                with open(self.part_path, "wb") as f:
+                    f.truncate(self.total)
+            if self._validator:
+                self._save_map_locked()
+        fd = os.open(self.part_path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        self._new_hasher(fd)
+        if self._hasher is not None and done:
+            # What an earlier run wrote is read back once; everything new is hashed as it arrives
+            self._hasher.written(done)
+        sources = [self._primary()] + [m for m in self.mirrors if m != self._primary()]
+        stop = threading.Event()
+        errors = []
+        count = min(max(self.connections, len(sources)), len(pieces))
+        live = [count]
+        try:
+            workers = [
+                threading.Thread(
+                    target=self._segment_worker, args=(fd, pieces, stop, errors, sources[i % len(sources)], live),
+                    name=f"direct-segment-{i}",
+                )
+                for i in range(count)
+            ]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+        finally:
+            os.close(fd)
+        if errors:
+            raise errors[0]
+        if pieces:
+            raise RuntimeError("Direct download incomplete: every source failed")
+
+    def _primary(self):
+        return self.metadata.get("final_url") or self.url
+
+    def _segment_worker(self, fd, pieces, stop, errors, source, live):
+        target = _request_target(source)
+        conn = None
+        piece = None
+        try:
+            while not stop.is_set():
+                with self._lock:
+                    if not pieces:
+                        live[0] -= 1
+                        return
+                    piece = pieces.popleft()
+                start, end = piece
+                began = time.monotonic()
+                attempt = redirects = 0
+                while True:
+                    if conn is None:
+                        conn = _connection(source, self.timeout)
+                    try:
+                        self._fetch_range(conn, target, fd, start, end, source)
+                        self._piece_done(start, end)
+                        break
+                    except _Redirect as r:
+                        # Mirrors are given as-is; follow their redirects here (http.client does not)
+                        conn.close()
+                        conn = None
+                        redirects += 1
+                        if redirects > 5:
+                            raise RuntimeError(f"Too many redirects from {source}")
+                        source = urllib.parse.urljoin(source, r.location)
+                        target = _request_target(source)
+                    except (OSError, http.client.HTTPException) as e:
+                        # A pooled connection the server closed: reconnect and retry the rest once
+                        conn.close()
+                        conn = None
+                        attempt += 1
+                        if attempt > 1:
+                            raise RuntimeError(f"Segment {start}-{end} from {source} failed: {e}") from e
+                piece = None
+                elapsed = time.monotonic() - began
+                if elapsed > 0:
+                    with self._lock:
+                        speed = (end + 1 - start) / elapsed
+                        previous = self.source_speeds.get(source)
+                        self.source_speeds[source] = speed if previous is None else previous + 0.3 * (speed - previous)
+        except Exception as e:
+            e = e if isinstance(e, RuntimeError) else RuntimeError(str(e))
+            with self._lock:
+                live[0] -= 1
+                # Another source can take over this piece, unless the file itself changed
+                handed_back = piece is not None and live[0] > 0 and not isinstance(e, _RemoteChanged)
+                if handed_back:
+                    pieces.appendleft(piece)
+            if handed_back:
+                print(f"[direct] Dropping source {source}: {e}")
+                return
+            errors.append(e)
+            stop.set()
+            return
+        finally:
+            if conn is not None:
+                conn.close()
+        with self._lock:
+            live[0] -= 1
+
+    def _fetch_range(self, conn, target, fd, start, end, source):
+        primary = source == self._primary()
+        headers = {"Range": f"bytes={start}-{end}"}
+        if self._validator and primary:
+            headers["If-Range"] = self._validator
+        conn.request("GET", target, headers=headers)
+        resp = conn.getresponse()
+        if resp.status in (301, 302, 303, 307, 308) and resp.headers.get("Location"):
+            resp.read()
+            raise _Redirect(resp.headers["Location"])
+        if resp.status == 200 and self._validator and primary:
+            raise _RemoteChanged(f"{self.url} no longer matches {self._validator}")
+        if resp.status != 206:
+            resp.read()
+            raise RuntimeError(f"Server ignored range request (HTTP {resp.status})")
+        if not primary and not (resp.headers.get("Content-Range") or "").endswith(f"/{self.total}"):
+            raise RuntimeError(f"{source} serves a different file (Content-Range {resp.headers.get('Content-Range')})")
+        offset = start
+        while True:
+            block = resp.read(_BLOCK)
+            if not block:
+                break
+            _pwrite(fd, block, offset)
+            if self._hasher is not None:
+                self._hasher.update(offset, block)
+            offset += len(block)
+            self._advance(len(block))
+        if offset != end + 1:
+            # Count the partial bytes out again; the retry rewrites the whole range
+            self._advance(start - offset)
+            raise http.client.IncompleteRead(b"", end + 1 - offset)
+
+
+if hasattr(os, "pwrite"):
+    def _pwrite(fd, data, offset):
+        while data:
+            written = os.pwrite(fd, data, offset)
+            data = data[written:]
+            offset += written
+
+    def _pread(fd, n, offset):
+        return os.pread(fd, n, offset)
+else:
+    _seek_lock = threading.Lock()
+
+    def _pwrite(fd, data, offset):
+        # No positional writes (Windows): serialise seek+write on the shared descriptor
+        with _seek_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while data:
+                written = os.write(fd, data)
+                data = data[written:]
+
+    def _pread(fd, n, offset):
+        with _seek_lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, n)
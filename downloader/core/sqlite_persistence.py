@@ -0,0 +1,156 @@
+# SQLite-backed state store with indexed job columns
+import json
+import os
+import sqlite3
+import threading
+import time
+from . import metrics, tracing
+from .persistence import Persistence, JournalPersistence
+from .job import as_record
+from .utils import STATE_DB_PATH, STATE_PATH
+
+# Job fields copied into their own indexed columns; the full record is kept as JSON in `data`
+JOB_COLUMNS = ('id', 'url', 'backend', 'status', 'pid', 'gid')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    list TEXT NOT NULL DEFAULT 'queue',
+    url TEXT,
+    backend TEXT,
+    status TEXT,
+    pid INTEGER,
+    gid TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_gid ON jobs(gid);
+CREATE INDEX IF NOT EXISTS idx_jobs_pid ON jobs(pid);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+CREATE INDEX IF NOT EXISTS idx_jobs_backend ON jobs(backend);
+CREATE INDEX IF NOT EXISTS idx_jobs_url ON jobs(url);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class SqlitePersistence(Persistence):
+    """Queue and history in a WAL-mode SQLite database.
+
+    Every change is a single-row upsert or delete, and ``get_job``/``find_jobs`` answer point
+    queries from the indexes without loading the whole queue. The JSON state (including any
+    journal) is imported on first use, and again whenever it has been written since the last
+    import, e.g. after switching to the JSON store and back.
+    """
+
+    needs_snapshot = False
+
+    def __init__(self, path=None, json_path=None):
+        self.path = os.fspath(path or STATE_DB_PATH)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+        self._migrate_from_json(json_path)
+
+    @staticmethod
+    def _json_signature(json_path):
+        """Size and mtime of the JSON state and its journals, as recorded after an import."""
+        path = os.fspath(json_path or STATE_PATH)
+        signature = []
+        for p in (path, path + '.journal', path + '.journal.old'):
+            try:
+                st = os.stat(p)
+            except FileNotFoundError:
+                continue
+            signature.append([os.path.basename(p), st.st_mtime_ns, st.st_size])
+        return json.dumps(signature)
+
+    def _migrate_from_json(self, json_path):
+        signature = self._json_signature(json_path)
+        with self._lock:
+            done = self._db.execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone()
+        if done is not None and done[0] == signature:
+            return
+        # Databases from before signatures were recorded hold a path here; their JSON import is done
+        legacy = done is not None and not done[0].startswith('[')
+        data = JournalPersistence(json_path).load() if signature != '[]' and not legacy else None
+        with self._lock, self._db:
+            if data is not None:
+                # The JSON store was written after the last import, so it holds the latest state
+                self._db.execute("DELETE FROM jobs")
+                self._insert_all(data.get('queue', []), data.get('history', []))
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)", (signature,))
+
+    @staticmethod
+    def _row_values(job, list_name):
+        job = as_record(job)
+        return (
+            job['id'], list_name, job.get('url'), job.get('backend'), job.get('status'),
+            job.get('pid'), job.get('gid'), json.dumps(job),
+        )
+
+    @staticmethod
+    def _row_to_job(row):
+        return json.loads(row['data'])
+
+    def _insert_all(self, queue, history):
+        rows = [self._row_values(j, 'queue') for j in queue] + [self._row_values(j, 'history') for j in history]
+        self._db.executemany(
+            "INSERT INTO jobs (id, list, url, backend, status, pid, gid, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def load(self):
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM jobs ORDER BY seq").fetchall()
+        data = {'queue': [], 'history': []}
+        for row in rows:
+            data[row['list']].append(self._row_to_job(row))
+        return data
+
+    def save(self, queue, history):
+        start = time.perf_counter()
+        with tracing.span('save', store='sqlite'), self._lock, self._db:
+            self._db.execute("DELETE FROM jobs")
+            self._insert_all(queue, history)
+        metrics.SAVE_SECONDS.observe(time.perf_counter() - start, store='sqlite')
+        if metrics.enabled():
+            metrics.STATE_BYTES.set(os.path.getsize(self.path), store='sqlite')
+
+    def record(self, op, job, queue=None, history=None):
+        self.record_many(op, [job])
+
+    def record_many(self, op, jobs, queue=None, history=None):
+        with tracing.span('record', store='sqlite', op=op), self._lock, self._db:
+            if op == 'remove':
+                self._db.executemany("DELETE FROM jobs WHERE id = ?", [(as_record(j)['id'],) for j in jobs])
+                return
+            self._db.executemany(
+                "INSERT INTO jobs (id, list, url, backend, status, pid, gid, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET url = excluded.url, backend = excluded.backend, "
+                "status = excluded.status, pid = excluded.pid, gid = excluded.gid, data = excluded.data",
+                [self._row_values(j, 'queue') for j in jobs],
+            )
+
+    def get_job(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ? AND list = 'queue'", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def find_jobs(self, **filters):
+        unknown = set(filters) - set(JOB_COLUMNS)
+        if unknown:
+            raise ValueError(f"Cannot filter jobs by: {', '.join(sorted(unknown))}")
+        where = " AND ".join(f"{k} = ?" for k in filters) or "1"
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT * FROM jobs WHERE list = 'queue' AND {where} ORDER BY seq", tuple(filters.values())
+            ).fetchall()
+        return [self._row_to_job(r) for r in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,44 @@
+# Tests for reusing a recorded aria2 RPC endpoint across runs
+import os
+import subprocess
+import sys
+import tempfile
+from downloader.core.aria2_backend import Aria2Backend
+from downloader.core.aria2_endpoint import save_endpoint, load_endpoint
+from downloader.core.test_aria2_rpc import FakeAria2Server
+
+def _backend(tmp, secret="secret123"):
+    backend = Aria2Backend(binary_path=os.path.join(tmp, 'no-aria2c'), rpc_port=6800, rpc_secret=secret)
+    backend.endpoint_path = os.path.join(tmp, 'aria2.json')
+    return backend
+
+def test_recorded_endpoint_is_reused():
+    with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+        backend = _backend(tmp)
+        save_endpoint(server.port, os.getpid(), server.secret, backend.endpoint_path)
+        # No binary and no port probing: one ping against the recorded port
+        backend._ensure_rpc(tmp)
+        assert backend.rpc_port == server.port
+        assert server.calls == ['aria2.getVersion']
+        health = backend.health()
+        assert health['reachable'] and health['pid_alive'] and health['version'] == '1.37.0'
+
+def test_stale_or_foreign_endpoint_is_ignored():
+    with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+        backend = _backend(tmp, secret="other-secret")
+        save_endpoint(server.port, None, server.secret, backend.endpoint_path)
+        assert not backend.attach_recorded_endpoint()
+        health = backend.health()
+        assert health['stale'] and not health['reachable'] and backend.rpc_port == 6800
+        assert server.calls == []
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        backend = _backend(tmp)
+        save_endpoint(server.port, dead.pid, server.secret, backend.endpoint_path)
+        assert not backend.attach_recorded_endpoint()
+        assert load_endpoint(backend.endpoint_path) is None
+
+if __name__ == "__main__":
+    test_recorded_endpoint_is_reused()
+    test_stale_or_foreign_endpoint_is_ignored()
+    print("aria2 endpoint tests passed.")
@@ -0,0 +1,100 @@
+# Tests for aria2 WebSocket notifications against a local fake WebSocket server
+import base64
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from downloader.core.aria2_events import _WS_GUID
+from downloader.core.test_manager import temp_manager
+from downloader.core.persistence import Persistence
+
+
+class FakeAria2WebSocket:
+    """Accepts WebSocket upgrades on /jsonrpc and pushes aria2-style notifications."""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("localhost", 0))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        self.clients = []
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            head = b""
+            while b"\r\n\r\n" not in head:
+                head += conn.recv(4096)
+            key = next(l.split(":", 1)[1].strip() for l in head.decode().split("\r\n") if l.lower().startswith("sec-websocket-key"))
+            accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+            self.clients.append(conn)
+            conn.sendall((
+                "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+            ).encode())
+
+    def notify(self, method, gid):
+        payload = json.dumps({"jsonrpc": "2.0", "method": method, "params": [{"gid": gid}]}).encode()
+        header = bytes([0x81, len(payload)]) if len(payload) < 126 else bytes([0x81, 126]) + len(payload).to_bytes(2, "big")
+        frame = header + payload
+        for conn in self.clients:
+            conn.sendall(frame)
+
+    def close(self):
+        self.sock.close()
+        for conn in self.clients:
+            conn.close()
+
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_events_update_queue():
+    ws = FakeAria2WebSocket()
+    with tempfile.TemporaryDirectory() as tmp:
+        mgr = temp_manager(tmp)
+        mgr.aria2._set_rpc_port(ws.port)
+        mgr.queue = [{'id': '1', 'url': 'http://a/x', 'backend': 'Aria2Backend', 'status': 'started', 'pid': None, 'gid': 'abc'}]
+        try:
+            assert mgr.start_event_listener()
+            assert mgr.events_active
+            ws.notify("aria2.onDownloadComplete", "abc")
+            assert _wait_for(lambda: mgr.get_job('1').status == 'completed')
+            # Saved by the listener thread just after the in-memory update
+            assert _wait_for(lambda: [j['status'] for j in Persistence(mgr.persistence.path).load()['queue']] == ['completed'])
+            ws.notify("aria2.onDownloadError", "unknown-gid")
+        finally:
+            mgr.stop_event_listener()
+            ws.close()
+
+
+def test_falls_back_to_polling_without_websocket():
+    with tempfile.TemporaryDirectory() as tmp:
+        mgr = temp_manager(tmp)
+        with socket.socket() as s:
+            s.bind(("localhost", 0))
+            port = s.getsockname()[1]
+        mgr.aria2._set_rpc_port(port)
+        assert not mgr.start_event_listener(timeout=0.3)
+        assert not mgr.events_active
+
+
+if __name__ == "__main__":
+    test_events_update_queue()
+    test_falls_back_to_polling_without_websocket()
+    print("aria2 event tests passed.")
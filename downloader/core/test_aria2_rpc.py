@@ -0,0 +1,237 @@
+# Tests for the keep-alive aria2 JSON-RPC client against a local fake aria2
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from downloader.core.aria2_rpc import Aria2RpcClient, Aria2RpcError, Aria2RpcAuthError, Aria2RpcConnectionError
+
+
+class FakeAria2Server(ThreadingHTTPServer):
+    """aria2 JSON-RPC stand-in, shared by the tests and the benchmarks.
+
+    Supports addUri/tellStatus/getServers/getFiles/tellActive/getGlobalStat/pause/unpause/remove/
+    changeOption/changeGlobalOption/changePosition and multicall. ``latency`` (seconds) is slept
+    once per HTTP request, so a multicall costs one delay. With a ``speed`` (bytes per second),
+    active downloads make progress in real time and complete at ``total`` bytes; without one
+    they stay where the test puts them.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, secret="secret123", latency=0.0, speed=None, total=100):
+        super().__init__(("localhost", 0), _FakeAria2Handler)
+        self.secret = secret
+        self.latency = latency
+        self.speed = speed
+        self.total = total
+        self.connections = 0
+        self.requests = 0
+        self.calls = []
+        self.downloads = {}
+        # gid -> options given to addUri/changeOption, and the global options
+        self.options = {}
+        self.global_options = {}
+        # gid -> URIs given to addUri (one file's mirrors)
+        self.uris = {}
+        # gid -> file entries returned by getFiles
+        self.files = {}
+        self.added = 0
+        self.drop_connections = False
+        self._lock = threading.Lock()
+        self._last_progress = time.monotonic()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+    def preload(self, n):
+        """Add ``n`` active downloads directly (no RPC); returns their GIDs."""
+        with self._lock:
+            return [self._add([f"http://fake.invalid/{i}.bin"], {}) for i in range(n)]
+
+    def _add(self, uris, options):
+        self.added += 1
+        gid = f"{self.added:016x}"
+        self.downloads[gid] = {"gid": gid, "status": "active", "completedLength": "0",
+                               "totalLength": str(self.total), "downloadSpeed": "0"}
+        self.options[gid] = dict(options)
+        self.uris[gid] = list(uris)
+        return gid
+
+    def _progress(self):
+        # Advance active downloads by the time since the last request
+        now = time.monotonic()
+        elapsed, self._last_progress = now - self._last_progress, now
+        if not self.speed:
+            return
+        for d in self.downloads.values():
+            if d["status"] == "active":
+                done = min(int(d["totalLength"]), int(d["completedLength"]) + int(elapsed * self.speed))
+                finished = done >= int(d["totalLength"])
+                d.update(completedLength=str(done), status="complete" if finished else "active",
+                         downloadSpeed="0" if finished else str(self.speed))
+            else:
+                d["downloadSpeed"] = "0"
+
+    def handle_rpc(self, method, params):
+        """One HTTP request's worth of work: advance progress, then ``dispatch``."""
+        with self._lock:
+            self.requests += 1
+            self._progress()
+            return self.dispatch(method, params)
+
+    def dispatch(self, method, params):
+        self.calls.append(method)
+        if method == "system.multicall":
+            out = []
+            for call in params[0]:
+                try:
+                    out.append([self.dispatch(call["methodName"], call["params"])])
+                except KeyError as e:
+                    out.append({"code": 1, "message": str(e)})
+            return out
+        if params[:1] != [f"token:{self.secret}"]:
+            raise PermissionError("Unauthorized")
+        params = params[1:]
+        if method == "aria2.getVersion":
+            return {"version": "1.37.0"}
+        if method == "aria2.addUri":
+            if not all("://" in uri for uri in params[0]):
+                raise KeyError("No URI to download.")
+            return self._add(params[0], params[1] if len(params) > 1 else {})
+        if method == "aria2.tellStatus":
+            entry = self.downloads[params[0]]
+            keys = params[1] if len(params) > 1 else entry.keys()
+            return {k: entry[k] for k in keys if k in entry}
+        if method == "aria2.getServers":
+            speed = self.downloads[params[0]]["downloadSpeed"]
+            servers = [{"uri": uri, "currentUri": uri, "downloadSpeed": speed} for uri in self.uris[params[0]]]
+            return [{"index": "1", "servers": servers}]
+        if method == "aria2.removeDownloadResult":
+            self.downloads.pop(params[0])
+            return "OK"
+        if method == "aria2.getFiles":
+            return self.files.get(params[0], [])
+        if method == "aria2.getGlobalStat":
+            count = lambda *states: str(sum(d["status"] in states for d in self.downloads.values()))
+            speed = sum(int(d["downloadSpeed"]) for d in self.downloads.values() if d["status"] == "active")
+            return {"numActive": count("active"), "numWaiting": count("waiting", "paused"),
+                    "numStopped": count("complete", "error", "removed"), "downloadSpeed": str(speed)}
+        if method == "aria2.tellActive":
+            keys = params[0] if params else None
+            return [{k: d[k] for k in (keys or d) if k in d} for d in self.downloads.values() if d["status"] == "active"]
+        if method in ("aria2.pause", "aria2.forcePause", "aria2.unpause"):
+            entry = self.downloads[params[0]]
+            if entry["status"] in ("active", "paused"):
+                entry["status"] = "active" if method == "aria2.unpause" else "paused"
+            return params[0]
+        if method in ("aria2.remove", "aria2.forceRemove"):
+            self.downloads[params[0]]["status"] = "removed"
+            return params[0]
+        if method == "aria2.changeOption":
+            self.options[params[0]].update(params[1])
+            return "OK"
+        if method == "aria2.changeGlobalOption":
+            self.global_options.update(params[0])
+            return "OK"
+        if method == "aria2.changePosition":
+            return 0
+        raise KeyError(f"No such method: {method}")
+
+
+class _FakeAria2Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        try:
+            body = {"jsonrpc": "2.0", "id": payload["id"], "result": self.server.handle_rpc(payload["method"], payload["params"])}
+            code = 200
+        except PermissionError:
+            body = {"jsonrpc": "2.0", "id": payload["id"], "error": {"code": 1, "message": "Unauthorized"}}
+            code = 400
+        except KeyError as e:
+            body = {"jsonrpc": "2.0", "id": payload["id"], "error": {"code": 1, "message": str(e)}}
+            code = 400
+        data = json.dumps(body).encode()
+        # Hang up without announcing it, like aria2 dropping an idle keep-alive socket
+        self.close_connection = self.server.drop_connections
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def test_calls_reuse_one_connection():
+    with FakeAria2Server() as server:
+        client = Aria2RpcClient(port=server.port, secret="secret123")
+        gid = client.call("aria2.addUri", ["http://a/file"], {})
+        for _ in range(20):
+            assert client.call("aria2.tellStatus", gid, ["status"]) == {"status": "active"}
+        client.call("aria2.pause", gid)
+        assert client.call("aria2.tellStatus", gid, ["status"]) == {"status": "paused"}
+        assert server.connections == 1
+        client.close()
+
+
+def test_reconnects_after_server_drops_connection():
+    with FakeAria2Server() as server:
+        client = Aria2RpcClient(port=server.port, secret="secret123")
+        server.drop_connections = True
+        client.call("aria2.getVersion")
+        server.drop_connections = False
+        assert client.call("aria2.getVersion") == {"version": "1.37.0"}
+        assert client.call("aria2.getVersion") == {"version": "1.37.0"}
+        assert server.connections == 2
+
+
+def test_typed_errors():
+    with FakeAria2Server() as server:
+        client = Aria2RpcClient(port=server.port, secret="wrong")
+        try:
+            client.call("aria2.getVersion")
+            assert False, "expected auth error"
+        except Aria2RpcAuthError:
+            pass
+        client.secret = "secret123"
+        try:
+            client.call("aria2.tellStatus", "missing")
+            assert False, "expected rpc error"
+        except Aria2RpcError as e:
+            assert e.method == "aria2.tellStatus"
+        results = client.multicall([("aria2.addUri", [["http://a/x"], {}]), ("aria2.tellStatus", ["missing"])])
+        assert isinstance(results[0], str)
+        assert isinstance(results[1], Aria2RpcError)
+    try:
+        Aria2RpcClient(port=server.port).call("aria2.getVersion", timeout=1)
+        assert False, "expected connection error"
+    except Aria2RpcConnectionError:
+        pass
+
+
+if __name__ == "__main__":
+    test_calls_reuse_one_connection()
+    test_reconnects_after_server_drops_connection()
+    test_typed_errors()
+    print("aria2 RPC client tests passed.")
@@ -0,0 +1,79 @@
+# Tests for speed limits: rate parsing, token bucket and global budget sharing
+import os
+import sys
+import tempfile
+from downloader.core.bandwidth import TokenBucket, parse_rate, share_budget
+from downloader.core.config import Config
+from downloader.core.test_manager import temp_manager
+from downloader.core.job import Job, Backend, JobStatus
+from downloader.core.test_aria2_rpc import FakeAria2Server
+
+def test_parse_rate():
+    assert parse_rate('0') == 0
+    assert parse_rate('500K') == 500 * 1024
+    assert parse_rate('1.5M') == 1536 * 1024
+    assert parse_rate('2mb/s') == 2 * 1024 * 1024
+    for bad in ('fast', '-1K'):
+        try:
+            parse_rate(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(bad)
+
+def test_token_bucket_holds_rate():
+    now = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(1000, clock=lambda: now[0], sleep=sleep)
+    # The first second's worth passes as a burst, then 3000 more bytes take 3 seconds
+    for _ in range(4):
+        bucket.consume(1000)
+    assert abs(now[0] - 3.0) < 1e-9
+    bucket.set_rate(0)
+    bucket.consume(10 ** 9)
+    assert abs(now[0] - 3.0) < 1e-9
+
+def _job(i, priority=0, max_speed=None):
+    extra = {k: v for k, v in (('priority', priority), ('max_speed', max_speed)) if v}
+    return Job(str(i), f'http://h/{i}', Backend.ARIA2, JobStatus.STARTED, extra=extra or None)
+
+def test_share_budget_by_priority_and_caps():
+    jobs = [_job(1), _job(2, priority=1), _job(3, max_speed=100)]
+    assert share_budget(0, jobs) == {'1': 0, '2': 0, '3': 100}
+    # Job 3 only needs 100 of its 1000 share; the other 2900 split 1:2 by priority
+    assert share_budget(3000, jobs) == {'1': 966, '2': 1933, '3': 100}
+
+def test_limits_reach_aria2():
+    with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+        mgr = temp_manager(tmp, Config(os.path.join(tmp, 'config.json')))
+        mgr.aria2.binary_path = sys.executable
+        mgr.aria2.endpoint_path = os.path.join(tmp, 'aria2.json')
+        mgr.aria2._set_rpc_port(server.port)
+        mgr.aria2.rpc.secret = server.secret
+        mgr.queue = []
+        for i in range(2):
+            gid = mgr.aria2.rpc.call('aria2.addUri', [f'http://example.com/{i}'], {})
+            mgr.queue.append(Job(str(i), f'http://example.com/{i}', Backend.ARIA2, JobStatus.STARTED, gid=gid,
+                                 extra={'priority': 1} if i else None))
+        mgr.set_limit('global', 3000)
+        assert server.global_options == {'max-overall-download-limit': '3000'}
+        assert [server.options[j.gid]['max-download-limit'] for j in mgr.queue] == ['1000', '2000']
+        assert Config(os.path.join(tmp, 'config.json')).get_bandwidth() == {'global': 3000}
+        mgr.set_limit('0', 500)
+        assert [server.options[j.gid]['max-download-limit'] for j in mgr.queue] == ['500', '2500']
+        # Nothing changed: no RPC round trip
+        server.calls.clear()
+        mgr.rebalance_bandwidth()
+        assert server.calls == []
+
+if __name__ == "__main__":
+    test_parse_rate()
+    test_token_bucket_holds_rate()
+    test_share_budget_by_priority_and_caps()
+    test_limits_reach_aria2()
+    print("Bandwidth tests passed.")
@@ -0,0 +1,143 @@
+# Tests for checksum parsing, streaming and pooled verification, and retries on mismatch
+import hashlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from downloader.core.checksums import ChecksumMismatch, IncrementalHash, parse_checksum, read_manifest
+from downloader.core.job import Backend, Job, JobStatus
+from downloader.core.test_manager import temp_manager
+from downloader.core.segmented import SegmentedDownload
+from downloader.core.test_aria2_rpc import FakeAria2Server
+from downloader.core.test_segmented import PAYLOAD, _serve
+
+SHA256 = 'sha256=' + hashlib.sha256(PAYLOAD).hexdigest()
+
+def test_parse_and_manifest():
+    digest = hashlib.sha256(b'x').hexdigest()
+    assert parse_checksum(f'SHA-256:{digest.upper()}') == f'sha256={digest}'
+    assert parse_checksum(hashlib.md5(b'x').hexdigest()).startswith('md5=')
+    for bad in ('sha256=abc', 'crc32=00000000'):
+        try:
+            parse_checksum(bad)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(bad)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'SHA256SUMS')
+        with open(path, 'w') as f:
+            f.write(f"# release\n{digest}  a.iso\n{digest} *dir/b.iso\nSHA256 (c.iso) = {digest}\n")
+        assert read_manifest(path) == {name: f'sha256={digest}' for name in ('a.iso', 'b.iso', 'c.iso')}
+
+def test_incremental_hash_out_of_order():
+    data = os.urandom(10000)
+    reads = []
+
+    def read_at(offset, n):
+        reads.append((offset, n))
+        return data[offset:offset + n]
+
+    h = IncrementalHash('sha256', read_at)
+    # Two "connections": the second piece lands first and is read back once the first is done
+    h.update(5000, data[5000:8000])
+    h.update(0, data[:3000])
+    h.update(3000, data[3000:5000])
+    h.update(8000, data[8000:])
+    assert h.hexdigest(len(data)) == hashlib.sha256(data).hexdigest()
+    assert reads == [(5000, 3000)]
+
+def test_direct_download_verifies_while_writing():
+    server, url, _ = _serve()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            dest = os.path.join(tmp, 'file.bin')
+            engine = SegmentedDownload(url, dest, connections=3, chunk_size=32 * 1024, checksum=SHA256)
+            engine.run()
+            assert engine.digest == SHA256.split('=')[1]
+            bad = SegmentedDownload(url, os.path.join(tmp, 'bad.bin'), chunk_size=32 * 1024, checksum='sha256=' + '0' * 64)
+            try:
+                bad.run()
+            except ChecksumMismatch:
+                pass
+            else:
+                raise AssertionError('mismatch not detected')
+            # The bad copy is gone, .part and chunk map included
+            assert os.listdir(tmp) == ['file.bin']
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def _manager(server, tmp):
+    mgr = temp_manager(tmp)
+    mgr.aria2.binary_path = sys.executable
+    mgr.aria2.endpoint_path = os.path.join(tmp, 'aria2.json')
+    mgr.aria2._set_rpc_port(server.port)
+    mgr.aria2.rpc.secret = server.secret
+    mgr.precheck_mode = 'off'
+    mgr.queue = []
+    return mgr
+
+def test_aria2_mismatch_is_retried_then_fails():
+    with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+        mgr = _manager(server, tmp)
+        job = mgr.add('http://example.com/file.iso', checksum=SHA256.upper().replace('SHA256', 'sha-256'))
+        assert server.options[job.gid]['checksum'] == 'sha-256=' + SHA256.split('=')[1]
+        for attempt in (1, 2):
+            gid = job.gid
+            server.downloads[gid].update(status='error', errorCode='32', errorMessage='Checksum validation failed')
+            mgr.refresh()
+            job = mgr.get_job(job.id)
+            assert job.extra['checksum_result']['status'] == 'mismatch'
+            if attempt == 1:
+                # Downloaded again under a new GID; the failed result is removed from aria2
+                assert job.status == JobStatus.STARTED and job.gid != gid
+                assert gid not in server.downloads
+        assert job.status == JobStatus.ERROR
+        assert job.extra['checksum_attempts'] == 1
+
+def test_process_download_is_hashed_in_pool():
+    with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+        mgr = _manager(server, tmp)
+        staging = os.path.join(tmp, '.verify-1')
+        os.makedirs(staging)
+        with open(os.path.join(staging, 'file.bin'), 'wb') as f:
+            f.write(PAYLOAD)
+        # A mega-get that has already exited
+        proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+        proc.wait()
+        mgr.queue = [Job('1', 'https://mega.nz/file/x', Backend.MEGA, JobStatus.STARTED, pid=proc.pid,
+                         extra={'checksum': SHA256, 'staging': staging})]
+        mgr.refresh()
+        job = mgr.get_job('1')
+        assert job.status == JobStatus.COMPLETED
+        deadline = time.monotonic() + 30
+        while job.extra['checksum_result']['status'] == 'pending' and time.monotonic() < deadline:
+            time.sleep(0.05)
+        mgr.hash_pool.shutdown()
+        assert job.extra['checksum_result'] == {'status': 'ok', 'by': 'pool'}
+        # Verified, so it left the staging directory
+        assert job.extra['path'] == os.path.join(tmp, 'file.bin')
+        assert not os.path.exists(staging)
+
+def test_pool_mismatch_is_recorded_when_file_is_gone():
+    with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+        mgr = _manager(server, tmp)
+        mgr.checksum_retries = 0
+        mgr.queue = [Job('1', 'https://mega.nz/file/x', Backend.MEGA, JobStatus.COMPLETED, extra={'checksum': SHA256})]
+        job = mgr.get_job('1')
+        # The mismatched file was already deleted (or is locked) by the time the pool reports back
+        mgr._on_hashed(job, os.path.join(tmp, 'missing.bin'), '00' * 32, None)
+        assert job.status == JobStatus.ERROR
+        assert job.extra['checksum_result']['status'] == 'mismatch'
+        assert mgr.persistence.get_job('1')['status'] == JobStatus.ERROR
+
+if __name__ == "__main__":
+    test_parse_and_manifest()
+    test_incremental_hash_out_of_order()
+    test_direct_download_verifies_while_writing()
+    test_aria2_mismatch_is_retried_then_fails()
+    test_process_download_is_hashed_in_pool()
+    test_pool_mismatch_is_recorded_when_file_is_gone()
+    print("Checksum tests passed.")
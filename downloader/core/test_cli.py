@@ -1,9 +1,28 @@
-# Basic CLI test (manual, for now)
+# CLI tests: entry-point smoke tests, plus a manual add/list/remove walk-through
+import json
+import os
 import subprocess
 import sys
-import os
+import tempfile
+from downloader.core.utils import PROJECT_ROOT
+
+def _cli(*args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.fspath(PROJECT_ROOT), os.getenv('PYTHONPATH')])))
+    env.pop('DOWNLOADER_TRACE', None)
+    return subprocess.run([sys.executable, '-m', 'downloader.cli', *args], cwd=PROJECT_ROOT, env=env,
+                          capture_output=True, text=True, timeout=60)
+
+def test_commands_exit_cleanly():
+    with tempfile.TemporaryDirectory() as tmp:
+        trace = os.path.join(tmp, 'trace.json')
+        for args in (['config', 'show'], ['--no-daemon', 'list'], ['--trace', trace, '--no-daemon', 'list']):
+            proc = _cli(*args)
+            assert proc.returncode == 0, f"{' '.join(args)} exited {proc.returncode}:\n{proc.stderr}"
+        with open(trace) as f:
+            assert 'traceEvents' in json.load(f)
 
 if __name__ == "__main__":
+    test_commands_exit_cleanly()
     # Add a download
     subprocess.run([sys.executable, '-m', 'downloader.cli', 'add', 'http://example.com/file.zip'])
     # List downloads
@@ -0,0 +1,76 @@
+# Tests for the content index and completing downloads from files already on disk
+import os
+import sys
+import tempfile
+from downloader.core.content_index import ContentIndex, place_copy
+from downloader.core.job import JobStatus
+from downloader.core.test_manager import temp_manager
+from downloader.core.metadata_cache import MetadataCache
+from downloader.core.test_aria2_rpc import FakeAria2Server
+from downloader.core.test_segmented import PAYLOAD, _serve
+
+def test_lookup_by_etag_and_hash():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'a.bin')
+        with open(path, 'wb') as f:
+            f.write(b'x' * 100)
+        index = ContentIndex(os.path.join(tmp, 'content.json'))
+        index.add(path, etag='"v1"', sha256='AB' * 32)
+        index.add(os.path.join(tmp, 'weak.bin'), etag='W/"v1"')
+        assert index.lookup(size=100, etag='"v1"') == path
+        assert index.lookup(sha256='ab' * 32) == path
+        assert index.lookup(size=99, etag='"v1"') is None
+        assert index.lookup(size=100, etag='W/"v1"') is None
+        index.flush()
+        copy = os.path.join(tmp, 'b.bin')
+        assert place_copy(path, copy, ('copy',)) == 'copy'
+        # A file changed after it was indexed no longer matches
+        with open(path, 'ab') as f:
+            f.write(b'y')
+        assert ContentIndex(index.path).lookup(size=100, etag='"v1"') is None
+
+def test_known_content_is_not_downloaded_again():
+    first, first_url, _ = _serve()
+    second, second_url, second_seen = _serve()
+    try:
+        with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+            mgr = temp_manager(tmp)
+            mgr.aria2.binary_path = sys.executable
+            mgr.aria2.endpoint_path = os.path.join(tmp, 'aria2.json')
+            mgr.aria2._set_rpc_port(server.port)
+            mgr.aria2.rpc.secret = server.secret
+            mgr.metadata = mgr.aria2.metadata = MetadataCache(os.path.join(tmp, 'metadata.json'))
+            mgr.content_index = ContentIndex(os.path.join(tmp, 'content.json'))
+            mgr.queue = []
+            options = {'dir': tmp}
+            job = mgr.add(first_url, options=options)
+            # aria2 finishes the first download
+            path = os.path.join(tmp, 'file.bin')
+            with open(path, 'wb') as f:
+                f.write(PAYLOAD)
+            server.downloads[job.gid]['status'] = 'complete'
+            server.files[job.gid] = [{'path': path, 'length': str(len(PAYLOAD))}]
+            mgr.refresh()
+            # Same size and ETag from another server: linked in place, aria2 is not asked
+            calls = len(server.calls)
+            again = mgr.add(second_url, options=options)
+            assert again.status == JobStatus.COMPLETED
+            assert 'aria2.addUri' not in server.calls[calls:]
+            # The target name already holds that content, so no file_1.bin copy is made
+            assert again.extra['local_copy'] == {'path': path, 'source': path, 'method': 'existing'}
+            named = mgr.add(second_url, options={'dir': tmp, 'out': 'named.bin'})
+            assert named.extra['local_copy']['method'] == 'hardlink'
+            with open(os.path.join(tmp, 'named.bin'), 'rb') as f:
+                assert f.read() == PAYLOAD
+            assert 'file_1.bin' not in os.listdir(tmp)
+            # Only the precheck (a HEAD request) reached the second server
+            assert second_seen == []
+    finally:
+        for http in (first, second):
+            http.shutdown()
+            http.server_close()
+
+if __name__ == "__main__":
+    test_lookup_by_etag_and_hash()
+    test_known_content_is_not_downloaded_again()
+    print("Content index tests passed.")
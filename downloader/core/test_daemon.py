@@ -0,0 +1,57 @@
+# Tests for the downloader daemon and its socket client
+import contextlib
+import io
+import os
+import tempfile
+import threading
+from downloader.core.daemon import DownloaderDaemon, DaemonUnavailable, run_command, send_command
+from downloader.core.test_manager import temp_manager
+from downloader.core.utils import echo
+
+def test_daemon_serves_commands_until_shutdown():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'd.sock')
+        mgr = temp_manager(tmp)
+        daemon = DownloaderDaemon(mgr, path)
+        ready = threading.Event()
+        thread = threading.Thread(target=daemon.serve_forever, args=(ready,), daemon=True)
+        thread.start()
+        assert ready.wait(5)
+        assert os.stat(path).st_mode & 0o777 == 0o600
+        assert send_command('ping', path=path)['pid'] == os.getpid()
+        assert "No downloads yet" in send_command('list', {'status': None}, path=path)['output']
+        assert send_command('pause', {'id': 'missing'}, path=path)['output'] == "Download missing not found\n"
+        reply = send_command('frobnicate', path=path)
+        assert not reply['ok'] and 'Unknown command' in reply['error']
+        assert send_command('shutdown', path=path)['ok']
+        thread.join(5)
+        assert not thread.is_alive() and not os.path.exists(path)
+        try:
+            send_command('list', path=path)
+        except DaemonUnavailable:
+            pass
+        else:
+            raise AssertionError("expected DaemonUnavailable once the daemon stopped")
+
+def test_command_output_goes_only_to_its_stream():
+    with tempfile.TemporaryDirectory() as tmp:
+        mgr = temp_manager(tmp)
+
+        def pause(download_id):
+            # Output from another thread while the command runs belongs on stdout, not in the reply
+            worker = threading.Thread(target=echo, args=("background",))
+            worker.start()
+            worker.join()
+            echo(f"Paused {download_id}")
+
+        mgr.pause = pause
+        out, stdout = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            run_command(mgr, 'pause', {'id': 'x'}, out)
+        assert out.getvalue() == "Paused x\n"
+        assert stdout.getvalue() == "background\n"
+
+if __name__ == "__main__":
+    test_daemon_serves_commands_until_shutdown()
+    test_command_output_goes_only_to_its_stream()
+    print("Daemon tests passed.")
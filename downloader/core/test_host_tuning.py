@@ -0,0 +1,57 @@
+# Tests for per-host connection tuning
+import os
+import sys
+import tempfile
+from downloader.core.host_tuning import HostTuning
+from downloader.core.test_manager import temp_manager
+from downloader.core.test_aria2_rpc import FakeAria2Server
+
+URL = 'http://mirror.example/file.iso'
+
+def test_climbs_to_best_and_backs_off():
+    now = [0.0]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'hosts.json')
+        tuning = HostTuning(path, min_samples=3, cooldown=60, clock=lambda: now[0])
+        assert tuning.connections(URL) == 4
+        for _ in range(3):
+            now[0] += 30
+            tuning.observe(URL, 4, 1000)
+        # Measured at 4 and the cooldown has passed: try 8
+        assert tuning.connections(URL) == 8
+        for _ in range(3):
+            now[0] += 30
+            tuning.observe(URL, 8, 600)
+        # 8 was slower, and it has been measured, so go back and stay at 4
+        assert tuning.connections(URL) == 4
+        now[0] += 120
+        tuning.observe(URL, 4, 1000)
+        assert tuning.connections(URL) == 4
+        assert tuning.throttled(URL) == 2
+        tuning.pin('mirror.example', 16)
+        assert tuning.throttled(URL) is None
+        tuning.flush()
+        assert HostTuning(path).connections(URL) == 16
+
+def test_manager_applies_and_retunes_aria2_connections():
+    with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+        mgr = temp_manager(tmp)
+        mgr.aria2.binary_path = sys.executable
+        mgr.aria2.endpoint_path = os.path.join(tmp, 'aria2.json')
+        mgr.aria2._set_rpc_port(server.port)
+        mgr.aria2.rpc.secret = server.secret
+        mgr.precheck_mode = 'off'
+        mgr.host_tuning = mgr.aria2.host_tuning = HostTuning(os.path.join(tmp, 'hosts.json'), min_samples=1, cooldown=0)
+        mgr.queue = []
+        job = mgr.add(URL)
+        assert server.options[job.gid]['max-connection-per-server'] == '4'
+        server.downloads[job.gid]['downloadSpeed'] = '5000'
+        mgr.fetch_aria2_statuses()
+        # The host moved to 8 connections and the running download followed
+        assert server.options[job.gid]['split'] == '8'
+        assert mgr.aria2.connection_settings[job.gid] == 8
+
+if __name__ == "__main__":
+    test_climbs_to_best_and_backs_off()
+    test_manager_applies_and_retunes_aria2_connections()
+    print("Host tuning tests passed.")
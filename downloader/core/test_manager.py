@@ -1,17 +1,88 @@
 # Basic tests for DownloadManager backend selection
+import atexit
+import os
+import sys
+import tempfile
+from downloader.core.config import Config
+from downloader.core.content_index import ContentIndex
 from downloader.core.manager import DownloadManager
+from downloader.core.metadata_cache import MetadataCache
+from downloader.core.mirrors import MirrorStats
+from downloader.core.persistence import Persistence, JournalPersistence
+from downloader.core.precheck import PrecheckPool
+from downloader.core.job import Job, Backend, JobStatus
+from downloader.core.test_aria2_rpc import FakeAria2Server
+
+def temp_manager(tmp, config=None):
+    """A DownloadManager whose state, caches and logs live under ``tmp``, so tests leave the tree unchanged."""
+    config = config or Config(os.path.join(tmp, 'config.json'))
+    config.data.setdefault('persistence', {}).setdefault('path', os.path.join(tmp, 'state.json'))
+    config.data.setdefault('host_tuning', {}).setdefault('path', os.path.join(tmp, 'hosts.json'))
+    mgr = DownloadManager(config=config)
+    # tmp is gone by the time the process exits
+    atexit.unregister(mgr.host_tuning.flush)
+    # The project-root stores opened by __init__ stay clean, so their exit flushes write nothing
+    mgr.metadata = mgr.prechecks.cache = MetadataCache(os.path.join(tmp, 'metadata.json'))
+    mgr.mirror_stats = MirrorStats(os.path.join(tmp, 'mirrors.json'))
+    mgr.content_index = ContentIndex(os.path.join(tmp, 'content.json'))
+    mgr.scheduler.log_path = None
+    return mgr
 
 def test_backend_selection():
-    mgr = DownloadManager()
-    assert mgr._select_backend('https://mega.nz/file/abc') == mgr.mega
-    assert mgr._select_backend('mega://folder/xyz') == mgr.mega
-    assert mgr._select_backend('http://example.com/file.zip') == mgr.aria2
-    assert mgr._select_backend('magnet:?xt=urn:btih:...') == mgr.aria2
-    assert mgr._select_backend('ftp://example.com/file') == mgr.aria2
-    assert mgr._select_backend('https://example.com/file') == mgr.aria2
-    assert mgr._select_backend('https://mega.nz/file/abc', backend='aria2') == mgr.aria2
-    assert mgr._select_backend('http://example.com/file.zip', backend='mega') == mgr.mega
+    with tempfile.TemporaryDirectory() as tmp:
+        mgr = temp_manager(tmp)
+        assert mgr._select_backend('https://mega.nz/file/abc') == mgr.mega
+        assert mgr._select_backend('mega://folder/xyz') == mgr.mega
+        assert mgr._select_backend('http://example.com/file.zip') == mgr.aria2
+        assert mgr._select_backend('magnet:?xt=urn:btih:...') == mgr.aria2
+        assert mgr._select_backend('ftp://example.com/file') == mgr.aria2
+        assert mgr._select_backend('https://example.com/file') == mgr.aria2
+        assert mgr._select_backend('https://mega.nz/file/abc', backend='aria2') == mgr.aria2
+        assert mgr._select_backend('http://example.com/file.zip', backend='mega') == mgr.mega
+
+def test_refresh_batches_aria2_status():
+    with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+        mgr = temp_manager(tmp)
+        mgr.aria2._set_rpc_port(server.port)
+        mgr.aria2.rpc.secret = server.secret
+        mgr.queue = []
+        for i in range(50):
+            gid = mgr.aria2.rpc.call('aria2.addUri', [f'http://example.com/{i}'], {})
+            mgr.queue.append(Job(str(i), f'http://example.com/{i}', Backend.ARIA2, JobStatus.STARTED, gid=gid))
+        server.downloads[mgr.get_job('0').gid]['status'] = 'complete'
+        server.calls.clear()
+        statuses = mgr.refresh()
+        assert server.calls.count('system.multicall') == 1
+        assert len(statuses) == 50
+        assert mgr.get_job('0').status == 'completed'
+        assert mgr.get_job('1').status == 'started'
+        assert [j.id for j in mgr.find_jobs(status='completed')] == ['0']
+        assert len(mgr.queue.with_status('started')) == 49
+        assert Persistence(mgr.persistence.path).load()['queue'][0]['status'] == 'completed'
+
+def test_add_many_uses_one_rpc_and_one_write():
+    with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+        mgr = temp_manager(tmp)
+        mgr.persistence = JournalPersistence(os.path.join(tmp, 'state.json'))
+        mgr.aria2.binary_path = sys.executable
+        mgr.aria2.endpoint_path = os.path.join(tmp, 'aria2.json')
+        mgr.aria2._set_rpc_port(server.port)
+        mgr.aria2.rpc.secret = server.secret
+        mgr.mega.binary_path = os.path.join(tmp, 'missing-mega-get')
+        mgr.prechecks = PrecheckPool(check=lambda url, timeout: None)
+        urls = [f'http://example.com/{i}' for i in range(200)] + ['not-a-url', 'https://mega.nz/file/abc']
+        jobs = mgr.add_many(urls)
+        assert [j.url for j in jobs] == urls
+        # One ping, then every addUri nested inside a single multicall
+        assert server.calls == ['aria2.getVersion', 'system.multicall'] + ['aria2.addUri'] * 201
+        assert len(server.downloads) == 200
+        assert [j.url for j in mgr.find_jobs(status='error')] == urls[-2:]
+        with open(mgr.persistence.journal_path) as f:
+            assert len(f.readlines()) == len(urls)
+        assert len(JournalPersistence(mgr.persistence.path).load()['queue']) == len(urls)
 
 if __name__ == "__main__":
     test_backend_selection()
+    test_refresh_batches_aria2_status()
+    test_add_many_uses_one_rpc_and_one_write()
     print("Backend selection tests passed.")
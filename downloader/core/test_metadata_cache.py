@@ -0,0 +1,53 @@
+# Tests for the remote metadata cache
+import os
+import tempfile
+from downloader.core.metadata_cache import MetadataCache, normalize_url
+from downloader.core.precheck import PrecheckPool
+
+def test_normalize_url():
+    assert normalize_url('HTTP://Example.COM:80/a?b=1#frag') == 'http://example.com/a?b=1'
+    assert normalize_url('https://example.com') == 'https://example.com/'
+    assert normalize_url('https://example.com:8443/x') == 'https://example.com:8443/x'
+
+def test_ttl_lru_and_persistence():
+    now = [1000.0]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'meta.json')
+        cache = MetadataCache(path, ttl=60, max_entries=2, clock=lambda: now[0])
+        cache.put('http://a/1', {'size': 10, 'etag': '"x"', 'accept_ranges': 'bytes'})
+        cache.put('http://a/2', {'size': 20})
+        assert cache.get('http://A/1')['etag'] == '"x"'
+        cache.put('http://a/3', {'size': 30})
+        # a/2 was least recently used
+        assert cache.get('http://a/2') is None and cache.get('http://a/1')['size'] == 10
+        now[0] += 61
+        assert cache.get('http://a/1') is None
+        assert cache.get('http://a/1', fresh=False)['size'] == 10
+        cache.put('http://a/3', {'size': 31})
+        cache.flush()
+        reloaded = MetadataCache(path, ttl=60, clock=lambda: now[0])
+        assert reloaded.get('http://a/3')['size'] == 31
+        assert reloaded.get('http://a/1', fresh=False) is None
+
+def test_precheck_skips_cached_urls():
+    probes = []
+
+    def check(url, timeout):
+        probes.append(url)
+        return {'size': 5, 'final_url': url}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = MetadataCache(os.path.join(tmp, 'meta.json'))
+        pool = PrecheckPool(check=check, cache=cache)
+        urls = [f'http://h/{i}' for i in range(5)]
+        assert all(err is None for err in pool.check_many(urls).values())
+        assert all(err is None for err in pool.check_many(urls).values())
+        assert sorted(probes) == urls
+        assert cache.get('http://h/3')['size'] == 5
+        pool.close()
+
+if __name__ == "__main__":
+    test_normalize_url()
+    test_ttl_lru_and_persistence()
+    test_precheck_skips_cached_urls()
+    print("Metadata cache tests passed.")
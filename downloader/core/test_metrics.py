@@ -0,0 +1,79 @@
+# Tests for the metrics registry, its Prometheus rendering and the daemon's /metrics endpoint
+import os
+import sys
+import tempfile
+import threading
+import urllib.request
+from downloader.core import metrics
+from downloader.core.daemon import DownloaderDaemon, send_command
+from downloader.core.test_manager import temp_manager
+from downloader.core.test_aria2_rpc import FakeAria2Server
+
+def test_registry_renders_prometheus_text():
+    registry = metrics.Registry()
+    calls = registry.counter('calls_total', 'Calls', ('method',))
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    # Disabled: nothing is recorded
+    calls.inc(method='a')
+    assert calls.value(method='a') is None
+    registry.enabled = True
+    calls.inc(method='a "quoted"')
+    calls.inc(2, method='a "quoted"')
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(3)
+    text = registry.render()
+    assert '# TYPE calls_total counter\ncalls_total{method="a \\"quoted\\""} 3\n' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1\nlatency_seconds_bucket{le="1"} 2\nlatency_seconds_bucket{le="+Inf"} 3\n' in text
+    assert 'latency_seconds_sum 3.55\nlatency_seconds_count 3\n' in text
+    try:
+        calls.inc(host='x')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('wrong labels accepted')
+
+def test_daemon_serves_manager_metrics():
+    metrics.REGISTRY.reset()
+    was_enabled = metrics.enabled()
+    metrics.enable()
+    try:
+        with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+            mgr = temp_manager(tmp)
+            mgr.aria2.binary_path = sys.executable
+            mgr.aria2.endpoint_path = os.path.join(tmp, 'aria2.json')
+            mgr.aria2._set_rpc_port(server.port)
+            mgr.aria2.rpc.secret = server.secret
+            mgr.precheck_mode = 'off'
+            mgr.queue = []
+            job = mgr.add('http://example.com/a.iso')
+            server.downloads[job.gid]['downloadSpeed'] = '2048'
+            path = os.path.join(tmp, 'd.sock')
+            daemon = DownloaderDaemon(mgr, path, metrics_port=0)
+            ready = threading.Event()
+            thread = threading.Thread(target=daemon.serve_forever, args=(ready,), daemon=True)
+            thread.start()
+            assert ready.wait(5)
+            try:
+                with urllib.request.urlopen(f'http://localhost:{daemon.metrics_port}/metrics', timeout=5) as resp:
+                    assert resp.headers['Content-Type'].startswith('text/plain')
+                    text = resp.read().decode()
+                # The socket command prints the same registry
+                assert 'downloader_download_speed_bytes 2048' in send_command('metrics', path=path)['output']
+            finally:
+                send_command('shutdown', path=path)
+                thread.join(5)
+        assert f'downloader_job_download_speed_bytes{{job="{job.id}"}} 2048' in text
+        assert 'downloader_download_speed_bytes 2048' in text
+        assert 'downloader_aria2_downloads{state="active"} 1' in text
+        assert metrics.RPC_SECONDS.value(method='aria2.addUri')[0] == 1
+        assert metrics.SAVE_SECONDS.value(store='json')[0] >= 1
+        assert metrics.STATE_BYTES.value(store='json') > 0
+    finally:
+        metrics.enable(was_enabled)
+        metrics.REGISTRY.reset()
+
+if __name__ == "__main__":
+    test_registry_renders_prometheus_text()
+    test_daemon_serves_manager_metrics()
+    print("Metrics tests passed.")
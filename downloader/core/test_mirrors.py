@@ -0,0 +1,97 @@
+# Tests for mirror ranking and multi-source downloads
+import os
+import socket
+import sys
+import tempfile
+from downloader.core.test_manager import temp_manager
+from downloader.core.mirrors import MirrorStats, rank_mirrors
+from downloader.core.segmented import SegmentedDownload
+from downloader.core.test_aria2_rpc import FakeAria2Server
+from downloader.core.test_segmented import PAYLOAD, _serve
+
+def _dead_url():
+    # A port nothing listens on: connections are refused at once
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{s.getsockname()[1]}/file.bin'
+
+def test_ranking_weighs_latency_and_throughput():
+    latencies = {'http://a/f': 0.05, 'http://b/f': 0.01, 'http://c/f': 0.06, 'http://down/f': None}
+
+    def probe(url, timeout):
+        if latencies[url] is None:
+            raise OSError('refused')
+        return latencies[url]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stats = MirrorStats(os.path.join(tmp, 'mirrors.json'))
+        # b answers first but has been slow; c has no history and is scored at the median speed (a's)
+        stats.record_throughput('http://a/f', 50 << 20)
+        stats.record_throughput('http://b/f', 1 << 20)
+        ranked = rank_mirrors(['http://down/f', 'http://a/f', 'http://b/f', 'http://c/f'], stats, probe)
+        assert ranked == ['http://a/f', 'http://c/f', 'http://b/f', 'http://down/f']
+        assert stats.get('http://down/f')['failures'] == 1
+        stats.flush()
+        assert MirrorStats(stats.path).get('http://b/f')['latency'] == 0.01
+
+def test_download_splits_across_mirrors():
+    primary, url, seen = _serve()
+    mirror, mirror_url, mirror_seen = _serve()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            dest = os.path.join(tmp, 'file.bin')
+            engine = SegmentedDownload(url, dest, connections=1, chunk_size=32 * 1024, mirrors=[url, mirror_url])
+            engine.run()
+            with open(dest, 'rb') as f:
+                assert f.read() == PAYLOAD
+    finally:
+        for server in (primary, mirror):
+            server.shutdown()
+            server.server_close()
+    # Both sources served pieces, and only the primary was probed
+    assert mirror_seen and 'bytes=0-0' not in mirror_seen
+    assert len(seen) > 1
+    assert set(engine.source_speeds) == {url, mirror_url}
+
+def test_failing_mirror_is_dropped():
+    server, url, seen = _serve()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            dest = os.path.join(tmp, 'file.bin')
+            SegmentedDownload(url, dest, connections=2, chunk_size=32 * 1024, mirrors=[_dead_url()]).run()
+            with open(dest, 'rb') as f:
+                assert f.read() == PAYLOAD
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_manager_sends_ranked_mirrors_to_aria2():
+    http, url, _ = _serve()
+    dead = _dead_url()
+    try:
+        with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+            mgr = temp_manager(tmp)
+            mgr.aria2.binary_path = sys.executable
+            mgr.aria2.endpoint_path = os.path.join(tmp, 'aria2.json')
+            mgr.aria2._set_rpc_port(server.port)
+            mgr.aria2.rpc.secret = server.secret
+            mgr.precheck_mode = 'off'
+            mgr.mirror_stats = mgr.aria2.mirror_stats = MirrorStats(os.path.join(tmp, 'mirrors.json'))
+            mgr.queue = []
+            job = mgr.add(dead, mirrors=[url])
+            # The unreachable primary goes last; aria2 gets both URLs of the file
+            assert job.mirrors == [url, dead]
+            assert server.uris[job.gid] == [url, dead]
+            server.downloads[job.gid]['downloadSpeed'] = '5000'
+            mgr.fetch_aria2_statuses()
+            assert mgr.mirror_stats.get(url)['throughput'] == 5000
+    finally:
+        http.shutdown()
+        http.server_close()
+
+if __name__ == "__main__":
+    test_ranking_weighs_latency_and_throughput()
+    test_download_splits_across_mirrors()
+    test_failing_mirror_is_dropped()
+    test_manager_sends_ranked_mirrors_to_aria2()
+    print("Mirror tests passed.")
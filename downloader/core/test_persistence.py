@@ -1,6 +1,9 @@
 # Test for Persistence module
-from downloader.core.persistence import Persistence
+from downloader.core.persistence import Persistence, JournalPersistence, migrate_persistence, open_persistence
+from downloader.core.sqlite_persistence import SqlitePersistence
 import os
+import json
+import tempfile
 
 def test_persistence():
     test_path = 'test_queue.json'
@@ -14,5 +17,132 @@ def test_persistence():
     os.remove(test_path)
     print('Persistence test passed.')
 
+def test_journal_persistence():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'state.json')
+        p = JournalPersistence(path)
+        queue = []
+        for i in range(3):
+            job = {'id': str(i), 'url': f'http://a/{i}', 'backend': 'aria2', 'status': 'queued', 'pid': None, 'gid': None}
+            queue.append(job)
+            p.record('add', job, queue, [])
+        queue[1]['status'] = 'started'
+        p.record('update', queue[1], queue, [])
+        p.record('remove', queue.pop(0), queue, [])
+        # Only the journal was written; the snapshot is still empty
+        with open(path) as f:
+            assert json.load(f)['queue'] == []
+        # A torn final record (crash mid-append) is ignored
+        with open(p.journal_path, 'a') as f:
+            f.write('{"op": "update", "job": {"id": "2", "sta')
+        data = JournalPersistence(path).load()
+        assert data['queue'] == queue
+        p.record('update', queue[0], queue, [])
+        assert JournalPersistence(path).load()['queue'] == queue
+        # A full save takes Job objects, as the manager holds them
+        from downloader.core.job import Job
+        p.save([Job.from_dict(j) for j in queue], [])
+        assert JournalPersistence(path).load()['queue'] == queue
+
+def test_journal_update_drops_removed_keys():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'state.json')
+        p = JournalPersistence(path)
+        job = {'id': '1', 'url': 'http://a', 'backend': 'aria2', 'status': 'started', 'pid': None, 'gid': 'g1',
+               'extra': {'max_speed': 100, 'preempted': True}}
+        p.save([job], [])
+        # e.g. `limit 1 0` clears the job's extra; the record holds the whole job without it
+        job = {k: v for k, v in job.items() if k != 'extra'}
+        p.record('update', job, [job], [])
+        assert JournalPersistence(path).load()['queue'] == [job]
+
+def test_journal_compaction():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'state.json')
+        p = JournalPersistence(path, compact_bytes=512)
+        queue = []
+        for i in range(20):
+            job = {'id': str(i), 'url': f'http://a/{i}', 'backend': 'aria2', 'status': 'queued', 'pid': None, 'gid': None}
+            queue.append(job)
+            p.record('add', job, queue, [])
+        p.close()
+        assert not os.path.exists(p.old_journal_path)
+        # Compacted records moved into the snapshot, which stays in the plain format older readers understand
+        compacted = Persistence(path).load()['queue']
+        assert len(compacted) >= 4
+        assert compacted == queue[:len(compacted)]
+        assert JournalPersistence(path).load()['queue'] == queue
+
+def test_sqlite_persistence():
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'state.json')
+        queue = [{'id': str(i), 'url': f'http://a/{i}', 'backend': 'Aria2Backend', 'status': 'started' if i % 2 else 'queued', 'pid': None, 'gid': f'g{i}'} for i in range(10)]
+        history = [{'id': 'h', 'url': 'http://b', 'backend': 'aria2', 'status': 'done'}]
+        Persistence(json_path).save(queue, history)
+        # First open imports the JSON state once
+        db = SqlitePersistence(os.path.join(tmp, 'state.sqlite3'), json_path=json_path)
+        assert db.load() == {'queue': queue, 'history': history}
+        assert db.get_job('3') == queue[3]
+        assert [j['id'] for j in db.find_jobs(status='started')] == ['1', '3', '5', '7', '9']
+        assert db.find_jobs(gid='g4') == [queue[4]]
+        db.record('update', dict(queue[4], status='paused', priority=5))
+        db.record('remove', {'id': '0'})
+        db.record('add', {'id': 'new', 'url': 'http://c', 'backend': 'mega', 'status': 'queued', 'pid': 42, 'gid': None})
+        assert db.get_job('4')['priority'] == 5
+        assert db.get_job('0') is None
+        assert db.find_jobs(pid=42)[0]['id'] == 'new'
+        db.close()
+        # Reopening does not import the unchanged JSON file again
+        db = SqlitePersistence(os.path.join(tmp, 'state.sqlite3'), json_path=json_path)
+        assert len(db.load()['queue']) == 10 and db.get_job('new') and not db.get_job('0')
+        db.close()
+        # JSON state written since the import (the JSON store was used again) replaces it
+        Persistence(json_path).save([], [])
+        db = SqlitePersistence(os.path.join(tmp, 'state.sqlite3'), json_path=json_path)
+        assert db.load() == {'queue': [], 'history': []}
+        db.close()
+
+def test_switching_stores_keeps_every_change():
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {'path': os.path.join(tmp, 'state.json'), 'db_path': os.path.join(tmp, 'state.sqlite3')}
+        first = {'id': '1', 'url': 'http://a', 'backend': 'aria2', 'status': 'started', 'pid': None, 'gid': 'g1',
+                 'options': {'dir': '/data', 'out': 'a.iso'}, 'extra': {'priority': 2}}
+        Persistence(paths['path']).save([first], [])
+        migrate_persistence('json', 'sqlite', **paths)
+        db = open_persistence('sqlite', **paths)
+        assert db.load()['queue'] == [first]
+        second = dict(first, id='2', gid='g2')
+        db.record('add', second)
+        db.close()
+        migrate_persistence('sqlite', 'json', **paths)
+        store = open_persistence('json', **paths)
+        assert store.load()['queue'] == [first, second]
+        third = dict(first, id='3', gid='g3', options={'split': '8'})
+        store.save([first, second, third], [])
+        # Back to SQLite: the jobs added while on JSON are imported, not lost to the earlier import
+        migrate_persistence('json', 'sqlite', **paths)
+        db = open_persistence('sqlite', **paths)
+        assert db.load()['queue'] == [first, second, third]
+        assert db.get_job('3')['options'] == {'split': '8'}
+        db.close()
+
+def test_get_job_ignores_history():
+    queued = {'id': 'q', 'url': 'http://a', 'backend': 'aria2', 'status': 'started', 'pid': None, 'gid': 'g1'}
+    finished = {'id': 'h', 'url': 'http://b', 'backend': 'aria2', 'status': 'completed', 'pid': None, 'gid': 'g2'}
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'state.json')
+        for store in (Persistence(json_path), JournalPersistence(os.path.join(tmp, 'journal.json')),
+                      SqlitePersistence(os.path.join(tmp, 'state.sqlite3'), json_path=json_path)):
+            store.save([queued], [finished])
+            assert store.get_job('q') == queued, type(store).__name__
+            assert store.get_job('h') is None, type(store).__name__
+            store.close()
+
 if __name__ == "__main__":
     test_persistence()
+    test_journal_persistence()
+    test_journal_update_drops_removed_keys()
+    test_journal_compaction()
+    test_sqlite_persistence()
+    test_switching_stores_keeps_every_change()
+    test_get_job_ignores_history()
@@ -0,0 +1,48 @@
+# Tests for concurrent URL prechecks
+import threading
+import time
+from downloader.core.precheck import PrecheckPool
+
+def test_hosts_checked_concurrently_with_per_host_cap():
+    active = {}
+    peak = {}
+    lock = threading.Lock()
+
+    def check(url, timeout):
+        host = url.split('/')[2]
+        with lock:
+            active[host] = active.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), active[host])
+        time.sleep(0.1)
+        with lock:
+            active[host] -= 1
+        if url.endswith('/bad'):
+            raise RuntimeError("URL precheck failed: HTTP 404")
+
+    pool = PrecheckPool(workers=16, per_host=2, check=check)
+    urls = [f'http://h{h}/{i}' for h in range(6) for i in range(4)] + ['http://h0/bad']
+    start = time.monotonic()
+    results = pool.check_many(urls)
+    elapsed = time.monotonic() - start
+    # 5 URLs on the busiest host, 2 at a time: 3 rounds, not 25 sequential checks
+    assert elapsed < 1.0, elapsed
+    assert max(peak.values()) == 2
+    assert [u for u, err in results.items() if err is not None] == ['http://h0/bad']
+    pool.close()
+
+def test_deadline_bounds_slow_hosts():
+    def check(url, timeout):
+        time.sleep(min(timeout, 2 if 'slow' in url else 0))
+
+    pool = PrecheckPool(check=check)
+    start = time.monotonic()
+    results = pool.check_many(['http://fast/1', 'http://slow/1', 'http://slow/2', 'http://slow/3'], deadline=0.3)
+    assert time.monotonic() - start < 1.0
+    assert results['http://fast/1'] is None
+    assert isinstance(results['http://slow/3'], TimeoutError)
+    pool.close()
+
+if __name__ == "__main__":
+    test_hosts_checked_concurrently_with_per_host_cap()
+    test_deadline_bounds_slow_hosts()
+    print("Precheck tests passed.")
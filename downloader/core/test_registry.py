@@ -0,0 +1,37 @@
+# Tests for the indexed job registry and the Job record
+from downloader.core.registry import JobRegistry
+from downloader.core.job import Job, JobStatus, Backend
+
+def test_registry_indexes_follow_updates():
+    reg = JobRegistry(Job(str(i), f'http://a/{i}', Backend.ARIA2) for i in range(1000))
+    job = reg.get('500')
+    reg.update(job, status=JobStatus.STARTED, gid='abc')
+    assert reg.by_gid('abc') is job
+    assert reg.with_status('started') == [job]
+    assert len(reg.with_status(JobStatus.QUEUED)) == 999
+    reg.update(job, gid=None, pid=42, status=JobStatus.PAUSED)
+    assert reg.by_gid('abc') is None
+    assert reg.by_pid(42) is job
+    assert reg.find(status='paused', backend='aria2') == [job]
+    assert reg.remove('500') is job
+    assert '500' not in reg and reg.by_pid(42) is None and reg.with_status('paused') == []
+    assert len(reg) == 999
+    assert [j.id for j in reg][:3] == ['0', '1', '2']
+
+def test_job_round_trip():
+    # Records written before the Job model (class-name backends, extra keys) load and save unchanged
+    record = {'id': '1', 'url': 'http://a/x', 'backend': 'Aria2Backend', 'status': 'started', 'pid': None, 'gid': 'g1', 'priority': 3}
+    job = Job.from_dict(record)
+    assert job.backend is Backend.ARIA2 and job.status is JobStatus.STARTED
+    assert job.aria2_gid == 'g1'
+    assert job.to_dict() == dict(record, backend='aria2')
+    assert Job.from_dict(job.to_dict()).to_dict() == job.to_dict()
+    # Jobs are mutable registry entries: equality is identity, so equal jobs hash alike
+    assert Job.from_dict(record) != job and len({job, job}) == 1
+    assert Job.from_dict({'id': '2', 'url': 'http://b', 'backend': 'mega', 'status': 'done'}).to_dict()['status'] == 'done'
+    assert Job('3', 'http://a/x', Backend.MEGA).url is job.url
+
+if __name__ == "__main__":
+    test_registry_indexes_follow_updates()
+    test_job_round_trip()
+    print("Registry tests passed.")
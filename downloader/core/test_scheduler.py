@@ -0,0 +1,65 @@
+# Tests for the queue scheduler and its ordering policies
+import os
+import sys
+import tempfile
+from downloader.core.scheduler import Scheduler
+from downloader.core.test_manager import temp_manager
+from downloader.core.persistence import JournalPersistence
+from downloader.core.precheck import PrecheckPool
+from downloader.core.job import Job, Backend, JobStatus
+from downloader.core.test_aria2_rpc import FakeAria2Server
+
+def _job(i, host='a', backend=Backend.ARIA2, status=JobStatus.QUEUED, priority=0, gid=None):
+    return Job(str(i), f'http://{host}/{i}', backend, status, gid=gid, extra={'priority': priority} if priority else None)
+
+def test_limits_and_decision_log():
+    sched = Scheduler(max_active=3, per_host=2, per_backend={'mega': 1})
+    active = [_job(0, host='a', status=JobStatus.STARTED)]
+    queued = [_job(1, 'a'), _job(2, 'a'), _job(3, 'b', Backend.MEGA), _job(4, 'c', Backend.MEGA), _job(5, 'c')]
+    start, preempt = sched.plan(queued, active)
+    # host a is full after job 1, mega after job 3, and job 5 finds no global slot left
+    assert [j.id for j in start] == ['1', '3']
+    assert preempt == []
+    waits = {d['job']: d['reason'] for d in sched.recent() if d['decision'] == 'wait'}
+    assert waits == {'2': 'host a at per_host cap 2', '4': 'backend mega at per_backend cap 1', '5': 'max_active 3 reached'}
+    # Unchanged reasons are not logged again
+    sched.plan([queued[1], queued[3], queued[4]], active + start)
+    assert len(sched.recent()) == 5
+
+def test_shortest_and_priority_policies():
+    sizes = {'http://a/1': 500, 'http://a/2': None, 'http://a/3': 10}
+    sched = Scheduler(max_active=2, policy='shortest', size_of=sizes.get)
+    start, _ = sched.plan([_job(1), _job(2), _job(3)], [])
+    assert [j.id for j in start] == ['3', '1']
+
+    sched = Scheduler(max_active=1, policy='priority', can_preempt=lambda job: job.aria2_gid is not None)
+    running = _job(0, status=JobStatus.STARTED, priority=1, gid='g0')
+    start, preempt = sched.plan([_job(1, priority=1), _job(2, priority=5)], [running])
+    assert [j.id for j in start] == ['2'] and preempt == [running]
+
+def test_manager_holds_jobs_until_slots_free():
+    with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+        mgr = temp_manager(tmp)
+        mgr.persistence = JournalPersistence(os.path.join(tmp, 'state.json'))
+        mgr.aria2.binary_path = sys.executable
+        mgr.aria2.endpoint_path = os.path.join(tmp, 'aria2.json')
+        mgr.aria2._set_rpc_port(server.port)
+        mgr.aria2.rpc.secret = server.secret
+        mgr.prechecks = PrecheckPool(check=lambda url, timeout: None)
+        mgr.scheduler = Scheduler(max_active=2, log_path=os.path.join(tmp, 'scheduler.log'))
+        mgr.queue = []
+        jobs = mgr.add_many([f'http://example.com/{i}' for i in range(5)])
+        assert [j.status for j in jobs] == ['started'] * 2 + ['queued'] * 3
+        # The two starts share one multicall
+        assert server.calls.count('system.multicall') == 1 and len(server.downloads) == 2
+        server.downloads[jobs[0].gid]['status'] = 'complete'
+        mgr.refresh()
+        assert [j.status for j in jobs] == ['completed', 'started', 'started', 'queued', 'queued']
+        decisions = mgr.scheduler.recent()
+        assert [d['job'] for d in decisions if d['decision'] == 'start'] == [jobs[0].id, jobs[1].id, jobs[2].id]
+
+if __name__ == "__main__":
+    test_limits_and_decision_log()
+    test_shortest_and_priority_policies()
+    test_manager_holds_jobs_until_slots_free()
+    print("Scheduler tests passed.")
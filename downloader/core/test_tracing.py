@@ -0,0 +1,56 @@
+# Tests for tracing spans and the Chrome trace file they are written to
+import json
+import os
+import sys
+import tempfile
+from downloader.core import tracing
+from downloader.core.test_manager import temp_manager
+from downloader.core.metadata_cache import MetadataCache
+from downloader.core.test_aria2_rpc import FakeAria2Server
+from downloader.core.test_segmented import _serve
+
+def test_spans_are_noops_when_off():
+    assert not tracing.enabled()
+    assert tracing.span('x', a=1) is tracing.span('y')
+
+    @tracing.traced('f')
+    def f(x):
+        return x + 1
+    assert f(1) == 2
+
+def test_add_is_traced():
+    http, url, _ = _serve()
+    try:
+        with FakeAria2Server() as server, tempfile.TemporaryDirectory() as tmp:
+            mgr = temp_manager(tmp)
+            mgr.aria2.binary_path = sys.executable
+            mgr.aria2.endpoint_path = os.path.join(tmp, 'aria2.json')
+            mgr.aria2._set_rpc_port(server.port)
+            mgr.aria2.rpc.secret = server.secret
+            mgr.metadata = mgr.aria2.metadata = MetadataCache(os.path.join(tmp, 'metadata.json'))
+            mgr.queue = []
+            path = os.path.join(tmp, 'trace.json')
+            tracing.start(path)
+            try:
+                mgr.add(url)
+            finally:
+                tracing.stop()
+            with open(path) as f:
+                events = [e for e in json.load(f)['traceEvents'] if e['ph'] == 'X']
+    finally:
+        http.shutdown()
+        http.server_close()
+    spans = {e['name']: e for e in events}
+    for name in ('add', 'precheck', 'ensure_rpc', 'aria2.addUri', 'get_status', 'aria2.tellStatus', 'save'):
+        assert name in spans, name
+    add = spans['add']
+    # Everything else ran inside the add
+    for e in events:
+        assert add['ts'] <= e['ts'] and e['ts'] + e['dur'] <= add['ts'] + add['dur'] + 1
+    assert spans['save']['args'] == {'store': 'json'}
+    assert not tracing.enabled()
+
+if __name__ == "__main__":
+    test_spans_are_noops_when_off()
+    test_add_is_traced()
+    print("Tracing tests passed.")
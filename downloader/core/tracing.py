@@ -0,0 +1,142 @@
+# Timed spans written as Chrome/Perfetto trace JSON, to see where a slow command spends its time
+import atexit
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+# Names the trace file for processes started without --trace (e.g. the GUI)
+ENV_VAR = "DOWNLOADER_TRACE"
+
+_NOOP = contextlib.nullcontext()
+_tracer = None
+_atexit_registered = False
+
+
+class _Span:
+    """One timed block; recorded when it exits, with the exception if it raised."""
+
+    __slots__ = ("_tracer", "_name", "_args", "_start")
+
+    def __init__(self, tracer, name, args):
+        self._tracer = tracer
+        self._name = name
+        self._args = args
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._args = dict(self._args, error=f"{exc_type.__name__}: {exc}")
+        self._tracer.record(self._name, self._start, time.perf_counter_ns(), self._args)
+        return False
+
+
+class Tracer:
+    """Collects complete ("X") events in memory; ``write()`` saves them as trace JSON."""
+
+    def __init__(self, path):
+        self.path = os.fspath(path)
+        self._origin = time.perf_counter_ns()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._events = []
+        self._threads = set()
+
+    def span(self, name, args=None):
+        return _Span(self, name, args or {})
+
+    def record(self, name, start_ns, end_ns, args=None):
+        tid = threading.get_native_id()
+        event = {
+            "name": name,
+            "cat": "downloader",
+            "ph": "X",
+            "ts": (start_ns - self._origin) / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": self._pid,
+            "tid": tid,
+        }
+        if args:
+            event["args"] = {k: v if isinstance(v, (int, float, bool, type(None))) else str(v) for k, v in args.items()}
+        with self._lock:
+            if tid not in self._threads:
+                self._threads.add(tid)
+                self._events.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid,
+                                     "args": {"name": threading.current_thread().name}})
+            self._events.append(event)
+
+    def events(self):
+        with self._lock:
+            return list(self._events)
+
+    def write(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
+        os.replace(tmp, self.path)
+
+
+def start(path):
+    """Record spans from now on; they are written to ``path`` by ``stop()`` or at exit.
+
+    Open the file in ``chrome://tracing`` or https://ui.perfetto.dev: spans on one thread nest by
+    time, so a slow ``add`` shows its precheck, aria2 start-up, RPC calls and state saves under it.
+    """
+    global _tracer, _atexit_registered
+    _tracer = Tracer(path)
+    if not _atexit_registered:
+        atexit.register(stop)
+        _atexit_registered = True
+    return _tracer
+
+
+def start_from_env():
+    """``start()`` with the file named by ``DOWNLOADER_TRACE``, if set; returns the tracer or None."""
+    path = os.getenv(ENV_VAR)
+    return start(path) if path else None
+
+
+def stop():
+    """Stop recording and write the trace file."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return
+    try:
+        tracer.write()
+    except OSError as e:
+        print(f"[trace] Could not write {tracer.path}: {e}")
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, **args):
+    """Context manager timing the enclosed block as ``name``.
+
+    While tracing is off this returns a shared no-op context manager, so it costs a call.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP
+    return tracer.span(name, args)
+
+
+def traced(name):
+    """Decorator recording each call of the function as a span called ``name``."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
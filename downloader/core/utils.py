@@ -1,10 +1,47 @@
-# Shared utilities (progress formatting, paths)
+# Shared utilities (progress formatting, paths, command output)
+import contextlib
+import sys
+import threading
 from pathlib import Path
 
 # Project root is two levels up from this file (core -> downloader -> project root)
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 DOWNLOADS_DIR = PROJECT_ROOT / "downloads"
 STATE_PATH = PROJECT_ROOT / ".downloader_state.json"
+STATE_DB_PATH = PROJECT_ROOT / ".downloader_state.sqlite3"
+METADATA_CACHE_PATH = PROJECT_ROOT / ".downloader_metadata.json"
+DAEMON_SOCKET_PATH = PROJECT_ROOT / ".downloader_daemon.sock"
+BINARY_CACHE_PATH = PROJECT_ROOT / ".downloader_binaries.json"
+ARIA2_ENDPOINT_PATH = PROJECT_ROOT / ".downloader_aria2.json"
+ARIA2_LOG_PATH = PROJECT_ROOT / ".downloader_aria2.log"
+SCHEDULER_LOG_PATH = PROJECT_ROOT / ".downloader_scheduler.log"
+HOST_TUNING_PATH = PROJECT_ROOT / ".downloader_hosts.json"
+MIRROR_STATS_PATH = PROJECT_ROOT / ".downloader_mirrors.json"
+CONTENT_INDEX_PATH = PROJECT_ROOT / ".downloader_content.json"
+
+
+# The stream echo() writes to on each thread; see output_to()
+_output = threading.local()
+
+
+def echo(*args, **kwargs):
+    """print() to the stream chosen with ``output_to()`` on this thread, or to stdout."""
+    print(*args, file=getattr(_output, "stream", None) or sys.stdout, **kwargs)
+
+
+@contextlib.contextmanager
+def output_to(stream):
+    """Send ``echo()`` output from the current thread to ``stream`` inside the block.
+
+    Unlike ``contextlib.redirect_stdout`` this leaves ``sys.stdout`` alone, so background
+    threads and other daemon clients keep writing where they did. ``None`` means stdout.
+    """
+    previous = getattr(_output, "stream", None)
+    _output.stream = stream
+    try:
+        yield stream
+    finally:
+        _output.stream = previous
 
 
 def ensure_download_dir() -> Path:
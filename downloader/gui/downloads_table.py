@@ -1,45 +1,41 @@
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QPushButton, QHBoxLayout, QMessageBox
-from PyQt5.QtCore import QTimer
-import os
-import sys
-import json
+from progress_worker import ProgressWorker, job_progress, run_captured
+
 
 class DownloadsTable(QWidget):
-    def __init__(self, parent=None):
+    def __init__(self, manager, parent=None):
         super().__init__(parent)
+        self.manager = manager
         self.layout = QVBoxLayout()
         self.table = QTableWidget()
         self.table.setColumnCount(8)
         self.table.setHorizontalHeaderLabels(['ID', 'URL', 'Backend', 'Status', 'Progress', 'Pause', 'Resume', 'Remove'])
         self.layout.addWidget(self.table)
         self.setLayout(self.layout)
+        self._rows = {}
+        self._progress = {}
         self.refresh_table()
-        # Auto-refresh every 3 seconds
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.refresh_table)
-        self.timer.start(3000)
+        # Poll in the background every 3 seconds; only changed rows come back to the UI thread
+        self.worker = ProgressWorker(self.manager, interval_ms=3000, parent=self)
+        self.worker.changed.connect(self.apply_changes)
+        self.worker.start()
+
+    def _jobs(self):
+        return list(self.manager.queue) + list(self.manager.history)
 
     def refresh_table(self):
-        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-        state_path = os.path.abspath(os.path.join(project_root, '.downloader_state.json'))
-        try:
-            with open(state_path, 'r') as f:
-                state = json.load(f)
-            jobs = (state.get('queue') or []) + (state.get('history') or [])
-        except Exception:
-            jobs = []
+        """Rebuild the table from the manager's in-memory jobs (no network access)."""
+        jobs = self._jobs()
+        self._rows = {}
         self.table.setRowCount(len(jobs))
         for row, job in enumerate(jobs):
-            self.table.setItem(row, 0, QTableWidgetItem(job.get('id', '')))
-            self.table.setItem(row, 1, QTableWidgetItem(job.get('url', '')))
-            self.table.setItem(row, 2, QTableWidgetItem(str(job.get('backend', ''))))
-            self.table.setItem(row, 3, QTableWidgetItem(job.get('status', '')))
-            # Progress
-            percent = '0'
-            if job.get('status') == 'completed' or job.get('gid') == 'direct-download':
-                percent = '100'
-            elif job.get('gid'):
-                percent = self.get_progress(job.get('gid'))
+            self._rows[job.id] = row
+            self.table.setItem(row, 0, QTableWidgetItem(job.id))
+            self.table.setItem(row, 1, QTableWidgetItem(job.url))
+            self.table.setItem(row, 2, QTableWidgetItem(str(job.backend)))
+            self.table.setItem(row, 3, QTableWidgetItem(str(job.status)))
+            # Progress: last value reported by the worker, or what the job record alone tells us
+            percent = self._progress.get(job.id) or job_progress(job, None)
             self.table.setItem(row, 4, QTableWidgetItem(percent))
             # Pause button
             pause_btn = QPushButton('Pause')
@@ -54,32 +50,20 @@ class DownloadsTable(QWidget):
             remove_btn.clicked.connect(lambda _, r=row: self.remove_job(r))
             self.table.setCellWidget(row, 7, remove_btn)
 
-    def get_progress(self, gid):
-        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-        try:
-            import subprocess
-            result = subprocess.run([
-                sys.executable, '-m', 'downloader.cli', 'aria2-progress', gid
-            ], capture_output=True, text=True, cwd=project_root)
-            output = result.stdout.strip()
-            import re
-            match = re.search(r'Progress: ([0-9.]+)%', output)
-            if match:
-                return match.group(1)
-        except Exception:
-            pass
-        return '0'
-
-    def _run_cli(self, args):
-        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-        try:
-            import subprocess
-            result = subprocess.run([
-                sys.executable, '-m', 'downloader.cli', *args
-            ], capture_output=True, text=True, cwd=project_root)
-            return result.returncode, (result.stdout.strip() or result.stderr.strip())
-        except Exception as e:
-            return 1, str(e)
+    def apply_changes(self, diff):
+        """Apply a ProgressWorker diff in place; rebuild only when rows were added or removed."""
+        for job_id, values in diff.items():
+            if values is not None:
+                self._progress[job_id] = values['progress']
+            else:
+                self._progress.pop(job_id, None)
+        if any(values is None or job_id not in self._rows for job_id, values in diff.items()):
+            self.refresh_table()
+            return
+        for job_id, values in diff.items():
+            row = self._rows[job_id]
+            self.table.setItem(row, 3, QTableWidgetItem(values['status']))
+            self.table.setItem(row, 4, QTableWidgetItem(values['progress']))
 
     def pause_job(self, row):
         job_id = self.table.item(row, 0).text()
@@ -87,11 +71,13 @@ class DownloadsTable(QWidget):
         if not job:
             QMessageBox.information(self, 'Pause not supported', 'Job not found.')
             return
-        if not job.get('pid') and not job.get('gid'):
+        if not job.pid and not job.gid:
             QMessageBox.information(self, 'Pause not supported', 'Pause is only available for jobs with PID or GID (aria2).')
             return
-        code, out = self._run_cli(['pause', job_id])
-        if code != 0:
+        _, out = run_captured(self.manager.pause, job_id)
+        # Reload: with point queries each lookup returns a fresh Job, not the one the manager updated
+        job = self._load_job(job_id)
+        if not job or job.status != 'paused':
             QMessageBox.warning(self, 'Pause failed', out or 'Pause failed')
         self.refresh_table()
 
@@ -101,11 +87,13 @@ class DownloadsTable(QWidget):
         if not job:
             QMessageBox.information(self, 'Resume not supported', 'Job not found.')
             return
-        if not job.get('pid') and not job.get('gid'):
+        if not job.pid and not job.gid:
             QMessageBox.information(self, 'Resume not supported', 'Resume is only available for jobs with PID or GID (aria2).')
             return
-        code, out = self._run_cli(['resume', job_id])
-        if code != 0:
+        _, out = run_captured(self.manager.resume, job_id)
+        # Reload: with point queries each lookup returns a fresh Job, not the one the manager updated
+        job = self._load_job(job_id)
+        if not job or job.status != 'started':
             QMessageBox.warning(self, 'Resume failed', out or 'Resume failed')
         self.refresh_table()
 
@@ -131,28 +119,10 @@ class DownloadsTable(QWidget):
         self.refresh_table()
 
     def _load_job(self, job_id):
-        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-        state_path = os.path.abspath(os.path.join(project_root, '.downloader_state.json'))
-        try:
-            with open(state_path, 'r') as f:
-                state = json.load(f)
-            jobs = (state.get('queue') or []) + (state.get('history') or [])
-            return next((j for j in jobs if j.get('id') == job_id), None)
-        except Exception:
-            return None
+        return self.manager.get_job(job_id) or next((j for j in self.manager.history if j.id == job_id), None)
 
     def remove_from_list(self, job_id):
-        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-        state_path = os.path.abspath(os.path.join(project_root, '.downloader_state.json'))
-        try:
-            with open(state_path, 'r') as f:
-                state = json.load(f)
-            queue = [j for j in state.get('queue', []) if j.get('id') != job_id]
-            history = [j for j in state.get('history', []) if j.get('id') != job_id]
-            with open(state_path, 'w') as f:
-                json.dump({'queue': queue, 'history': history}, f)
-        except Exception:
-            pass
+        run_captured(self.manager.remove, job_id)
 
     def delete_file(self, job):
         if not job:
@@ -160,7 +130,7 @@ class DownloadsTable(QWidget):
         from pathlib import Path
         from urllib.parse import urlparse
         downloads_dir = Path(__file__).resolve().parents[2] / 'downloads'
-        url = job.get('url', '')
+        url = job.url
         parsed = urlparse(url)
         filename = Path(parsed.path).name or 'download.bin'
         stem = Path(filename).stem
@@ -1,12 +1,26 @@
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QLabel, QLineEdit
-from downloads_table import DownloadsTable
+import os
 import sys
 
+# Running as a script puts downloader/gui on sys.path; the core package lives at the project root
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from downloads_table import DownloadsTable
+from progress_worker import AddWorker
+from downloader.core import tracing
+from downloader.core.manager import DownloadManager
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle('Downloader GUI')
         self.setGeometry(100, 100, 400, 200)
+        # One in-process manager shared by the form, the table and its background poller
+        self.manager = DownloadManager()
+        self.manager.start_event_listener(timeout=0.5)
+        self._add_worker = None
         self._init_ui()
 
     def _init_ui(self):
@@ -17,7 +31,7 @@ class MainWindow(QMainWindow):
         self.url_input = QLineEdit()
         self.download_button = QPushButton('Download')
         self.status_label = QLabel('Status: Ready')
-        self.downloads_table = DownloadsTable()
+        self.downloads_table = DownloadsTable(self.manager)
 
         layout.addWidget(self.url_label)
         layout.addWidget(self.url_input)
@@ -31,96 +45,36 @@ class MainWindow(QMainWindow):
         self.download_button.clicked.connect(self.start_download)
 
     def start_download(self):
-        import subprocess
-        import os
-        import re
         url = self.url_input.text()
         if not url:
             self.status_label.setText('Please enter a URL.')
             return
 
         self.status_label.setText(f'Starting download: {url}')
-        try:
-            project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-            result = subprocess.run([
-                sys.executable, '-m', 'downloader.cli', 'add', url
-            ], capture_output=True, text=True, cwd=project_root)
-            if result.returncode == 0:
-                self.status_label.setText('Download started successfully.')
-                self.downloads_table.refresh_table()
-            else:
-                self.status_label.setText(f'Error: {result.stderr.strip() or result.stdout.strip()}')
-        except Exception as e:
-            self.status_label.setText(f'Exception: {str(e)}')
-
-    def refresh_progress(self):
-        # Call CLI to get progress for self.download_id
-        import subprocess
-        import os
-        import re
-        import json
-        if not self.download_id:
-            self.status_label.setText('No download ID available.')
-            return
-
-        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-
-        # Load state to find gid/status
-        gid = None
-        job_status = None
-        try:
-            state_path = os.path.abspath(os.path.join(project_root, '.downloader_state.json'))
-            with open(state_path, 'r') as f:
-                state = json.load(f)
-            all_jobs = (state.get('queue') or []) + (state.get('history') or [])
-            for job in all_jobs:
-                if job.get('id') == self.download_id:
-                    gid = job.get('gid')
-                    job_status = job.get('status')
-                    break
-        except Exception:
-            pass
-
-        # If completed, set to 100%
-        if job_status == 'completed' or (gid == 'direct-download'):
-            self.progress_bar.setValue(100)
-            self.status_label.setText('Progress: 100% (completed)')
-            return
+        # One add at a time; the window stays responsive while it runs
+        self.download_button.setEnabled(False)
+        self._add_worker = AddWorker(self.manager, url, parent=self)
+        self._add_worker.done.connect(self.download_started)
+        self._add_worker.start()
 
-        # Try aria2-progress when gid is available and not a direct-download marker
-        if gid:
-            try:
-                result = subprocess.run([
-                    sys.executable, '-m', 'downloader.cli', 'aria2-progress', gid
-                ], capture_output=True, text=True, cwd=project_root)
-                output = result.stdout.strip()
-                percent = None
-                match = re.search(r'Progress: ([0-9.]+)%', output)
-                if match:
-                    percent = float(match.group(1))
-                if percent is not None:
-                    self.progress_bar.setValue(int(percent))
-                    self.status_label.setText(f'Progress: {percent:.2f}%')
-                    return
-                else:
-                    # Fallback to display raw output
-                    self.status_label.setText(output or 'No output from aria2-progress.')
-                    return
-            except Exception as e:
-                self.status_label.setText(f'Exception: {str(e)}')
-                return
+    def download_started(self, job, out):
+        if job and job.status != 'error':
+            self.status_label.setText('Download started successfully.')
+        else:
+            self.status_label.setText(f'Error: {out}')
+        self.download_button.setEnabled(True)
+        self.downloads_table.refresh_table()
 
-        # Fallback: call status (may not provide percentage)
-        try:
-            result = subprocess.run([
-                sys.executable, '-m', 'downloader.cli', 'status', self.download_id
-            ], capture_output=True, text=True, cwd=project_root)
-            output = result.stdout.strip()
-            self.status_label.setText(output or 'No output from status command.')
-        except Exception as e:
-            self.status_label.setText(f'Exception: {str(e)}')
+    def closeEvent(self, event):
+        if self._add_worker is not None:
+            self._add_worker.wait()
+        self.downloads_table.worker.stop()
+        self.manager.stop_event_listener()
+        super().closeEvent(event)
 
 if __name__ == '__main__':
+    # DOWNLOADER_TRACE=FILE records adds, refreshes and the calls under them (written on exit)
+    tracing.start_from_env()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,99 @@
+# Background work for the GUI: progress polling and manager calls that block on the network
+import io
+from PyQt5.QtCore import QThread, pyqtSignal
+from downloader.core.utils import output_to
+
+
+def run_captured(fn, *args):
+    """Run a manager operation in-process; return its result and whatever it printed."""
+    out = io.StringIO()
+    try:
+        # Only this call's output: the progress worker and other threads keep printing to stdout
+        with output_to(out):
+            result = fn(*args)
+    except Exception as e:
+        return None, f"{out.getvalue()}{e}".strip()
+    return result, out.getvalue().strip()
+
+
+def job_progress(job, aria2_statuses):
+    """Return a job's progress percentage as display text."""
+    if job.status == 'completed':
+        return '100'
+    # aria2 jobs are keyed by GID, background direct downloads by job id
+    status = (aria2_statuses or {}).get(job.aria2_gid or job.id)
+    if status:
+        total = int(status.get('totalLength', 0))
+        completed = int(status.get('completedLength', 0))
+        if total:
+            return f"{completed / total * 100:.2f}"
+    return '0'
+
+
+class ProgressWorker(QThread):
+    """Polls the DownloadManager off the UI thread and emits only the rows that changed.
+
+    Each tick is one batched refresh; ``changed`` carries ``{job_id: {'status': ..., 'progress': ...}}``
+    for rows whose values differ from the previous tick, and ``{job_id: None}`` for rows that disappeared.
+    """
+
+    changed = pyqtSignal(dict)
+
+    def __init__(self, manager, interval_ms=3000, parent=None):
+        super().__init__(parent)
+        self.manager = manager
+        self.interval_ms = interval_ms
+        self._last = {}
+
+    def stop(self):
+        self.requestInterruption()
+        self.wait()
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[gui] Progress poll failed: {e}")
+            # Sleep in short slices so stop() does not wait a whole interval
+            for _ in range(max(1, self.interval_ms // 100)):
+                if self.isInterruptionRequested():
+                    return
+                self.msleep(100)
+
+    def poll(self):
+        statuses = self.manager.refresh()
+        jobs = list(self.manager.queue) + list(self.manager.history)
+        if statuses is None:
+            # aria2 notifications keep statuses current; progress still needs one batched query
+            queue = self.manager.queue
+            active = queue.with_status('started') + queue.with_status('queued') + queue.with_status('paused')
+            statuses = self.manager.fetch_aria2_statuses(active)
+        statuses = dict(statuses, **self.manager.direct_progress)
+        snapshot = {
+            j.id: {'status': str(j.status), 'progress': job_progress(j, statuses)}
+            for j in jobs
+        }
+        diff = {job_id: row for job_id, row in snapshot.items() if self._last.get(job_id) != row}
+        diff.update({job_id: None for job_id in self._last if job_id not in snapshot})
+        self._last = snapshot
+        if diff:
+            self.changed.emit(diff)
+
+
+class AddWorker(QThread):
+    """Runs ``manager.add(url)`` off the UI thread (precheck, aria2 start-up and RPC can take seconds).
+
+    ``done`` carries the new job (None if the add raised) and the text the add printed.
+    """
+
+    done = pyqtSignal(object, str)
+
+    def __init__(self, manager, url, parent=None):
+        super().__init__(parent)
+        self.manager = manager
+        self.url = url
+
+    def run(self):
+        job, out = run_captured(self.manager.add, self.url)
+        self.done.emit(job, out)